@@ -0,0 +1,58 @@
+"""Compares encode time and payload size of every image upload profile.
+
+Run from the repository root:
+    python benchmarks/image_encode_profiles.py [image ...]
+Masks are benchmarked with a synthetic brush-stroke mask the size of each image."""
+import os
+import sys
+import time
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.utils import IMAGE_ENCODE_PROFILES, image_to_base64
+
+DEFAULT_IMAGES = ["assets/chili.png", "assets/sdxl.png", "assets/flux.png"]
+REPEATS = 5
+
+
+def make_mask(size):
+    mask = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(mask)
+    width, height = size
+    draw.line([(width * 0.2, height * 0.3), (width * 0.8, height * 0.6)], fill=(255, 255, 255, 255), width=40)
+    draw.ellipse([width * 0.4, height * 0.1, width * 0.6, height * 0.3], fill=(255, 255, 255, 255))
+    return mask
+
+
+def benchmark(image, width, height, profile):
+    timings = []
+    payload = ""
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        payload = image_to_base64(image, width, height, profile)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000, len(payload)
+
+
+def main(paths):
+    print(f"{'input':<24}{'profile':<16}{'best ms':>10}{'payload KB':>12}")
+    for path in paths:
+        image = Image.open(path)
+        image.load()
+        width, height = image.size
+        name = os.path.basename(path)
+        for profile in IMAGE_ENCODE_PROFILES:
+            if profile == "mask":
+                continue
+            ms, size = benchmark(image, width, height, profile)
+            print(f"{name:<24}{profile:<16}{ms:>10.1f}{size / 1024:>12.1f}")
+        mask = make_mask(image.size)
+        for profile in IMAGE_ENCODE_PROFILES:
+            ms, size = benchmark(mask, width, height, profile)
+            print(f"{name + ' (mask)':<24}{profile:<16}{ms:>10.1f}{size / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or DEFAULT_IMAGES)
@@ -0,0 +1,132 @@
+"""A stand-in avernus server for exercising streaming responses without a GPU.
+
+Run from the repository root and point ultrahal at 127.0.0.1 on the same port:
+    python benchmarks/stub_avernus_server.py [port]
+Every POST to an /*_generate endpoint pretends to run its steps (0.1s each) and returns copies of assets/sdxl.png.
+While it runs, GET /progress streams server-sent events with the step count and a preview every fifth step.
+POST /llm_chat_stream echoes the prompt back as server-sent token events, POST /llm_chat and /llm_chat_batch echo
+the prompts back in one response and POST /cancel aborts the running job."""
+import asyncio
+import base64
+import json
+import sys
+
+STEP_TIME = 0.1
+PREVIEW_EVERY = 5
+
+with open("assets/sdxl.png", "rb") as f:
+    RESULT_IMAGE = base64.b64encode(f.read()).decode()
+
+JOB = {"step": 0, "total_steps": 0, "running": False, "cancelled": False}
+
+
+async def read_request(reader):
+    request_line = (await reader.readline()).decode().strip()
+    if not request_line:
+        return None, None, b""
+    method, path, _ = request_line.split(" ", 2)
+    headers = {}
+    while (line := (await reader.readline()).decode().strip()):
+        name, value = line.split(":", 1)
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return method, path, body
+
+
+def respond(writer, status, payload, content_type="application/json", extra_headers=""):
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                 f"{extra_headers}\r\n".encode() + body)
+
+
+async def stream_progress(writer):
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                 b"Connection: close\r\n\r\n")
+    last_step = None
+    while True:
+        if JOB["running"] and JOB["step"] != last_step:
+            last_step = JOB["step"]
+            event = {"step": JOB["step"], "total_steps": JOB["total_steps"]}
+            if JOB["step"] % PREVIEW_EVERY == 0:
+                event["preview"] = RESULT_IMAGE
+            writer.write(f"data: {json.dumps(event)}\n\n".encode())
+            await writer.drain()
+        await asyncio.sleep(STEP_TIME / 2)
+
+
+async def generate(writer, body):
+    data = json.loads(body or b"{}")
+    steps = int(data.get("steps") or 20)
+    batch_size = int(data.get("batch_size") or 1)
+    JOB.update(step=0, total_steps=steps, running=True, cancelled=False)
+    try:
+        for step in range(1, steps + 1):
+            await asyncio.sleep(STEP_TIME)
+            if JOB["cancelled"]:
+                print(f"Job cancelled at step {step}/{steps}")
+                respond(writer, "200 OK", {"status": "False", "images": []})
+                return
+            JOB["step"] = step
+    finally:
+        JOB["running"] = False
+    respond(writer, "200 OK", {"status": "True", "images": [RESULT_IMAGE] * batch_size})
+
+
+async def chat_stream(writer, body):
+    prompt = json.loads(body or b"{}").get("prompt") or ""
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                 b"Connection: close\r\n\r\n")
+    for word in f"You said: {prompt}".split(" "):
+        writer.write(f"data: {json.dumps({'token': word + ' '})}\n\n".encode())
+        await writer.drain()
+        await asyncio.sleep(STEP_TIME / 2)
+    writer.write(b"data: [DONE]\n\n")
+
+
+async def handle(reader, writer):
+    try:
+        while True:
+            method, path, body = await read_request(reader)
+            if method is None:
+                break
+            if path == "/progress":
+                await stream_progress(writer)
+                break
+            if method == "POST" and path == "/llm_chat_stream":
+                await chat_stream(writer, body)
+                await writer.drain()
+                break
+            if method == "POST" and path == "/cancel":
+                JOB["cancelled"] = JOB["running"]
+                respond(writer, "200 OK", {"status": True, "cancelled": JOB["cancelled"]})
+            elif method == "POST" and path == "/llm_chat":
+                await asyncio.sleep(STEP_TIME)
+                prompt = json.loads(body or b"{}").get("prompt") or ""
+                respond(writer, "200 OK", {"status": True, "response": f"You said: {prompt}"})
+            elif method == "POST" and path == "/llm_chat_batch":
+                await asyncio.sleep(STEP_TIME)
+                prompts = json.loads(body or b"{}").get("prompts") or []
+                print(f"Batched {len(prompts)} prompts")
+                respond(writer, "200 OK", {"status": True, "responses": [f"You said: {p}" for p in prompts]})
+            elif method == "GET" and path == "/status":
+                respond(writer, "200 OK", {"status": True, "version": "stub", "queue_depth": int(JOB["running"])})
+            elif method == "POST" and path.endswith("_generate"):
+                await generate(writer, body)
+            else:
+                respond(writer, "404 Not Found", {"detail": "Not Found"})
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def main(port):
+    server = await asyncio.start_server(handle, "127.0.0.1", port)
+    print(f"Stub avernus server listening on 127.0.0.1:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 6969))
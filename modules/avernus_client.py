@@ -1,13 +1,220 @@
+import asyncio
+import hashlib
+import importlib.util
+import json
+import os
+import tempfile
+
 import aiofiles
 import httpx
-import os
+
+from modules.multipart_upload import MultipartUpload
+from modules.response_stream import JsonImageStreamParser
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+VIDEO_CACHE_DIR = "cache/videos"
+
+
+class CountedStream(httpx.AsyncByteStream):
+    """Response stream that calls on_close once when the response is closed"""
+    def __init__(self, stream, on_close):
+        self.stream = stream
+        self.on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            if self.on_close is not None:
+                on_close, self.on_close = self.on_close, None
+                on_close()
+
+
+class CountingTransport(httpx.AsyncBaseTransport):
+    """Wraps a transport and counts the requests still using it, a request counts until its response is closed"""
+    def __init__(self, transport):
+        self.transport = transport
+        self.in_flight = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    async def handle_async_request(self, request):
+        self.in_flight += 1
+        self.idle.clear()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self.finished()
+            raise
+        response.stream = CountedStream(response.stream, self.finished)
+        return response
+
+    def finished(self):
+        self.in_flight -= 1
+        if self.in_flight == 0:
+            self.idle.set()
+
+    async def aclose(self):
+        await self.transport.aclose()
+
 
 class AvernusClient:
     """This is the client for the avernus API server"""
-    def __init__(self, url, port=6969):
+    def __init__(self, url, port=6969, max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0,
+                 http2=False, video_dir=VIDEO_CACHE_DIR):
         self.url = url
         self.port = port
         self.base_url = f"{self.url}:{self.port}"
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self.video_dir = video_dir
+        self.progress_supported = True
+        self.batch_chat_supported = True
+        self.retired_clients = set()
+        self.client: httpx.AsyncClient = self.build_client()
+
+    def build_client(self):
+        """Builds the pooled http client that every request to the server goes through"""
+        limits = httpx.Limits(max_connections=self.max_connections,
+                              max_keepalive_connections=self.max_keepalive_connections,
+                              keepalive_expiry=self.keepalive_expiry)
+        http2 = self.http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            print("HTTP/2 requested but the h2 package is not installed, falling back to HTTP/1.1")
+            http2 = False
+        self.transport = CountingTransport(httpx.AsyncHTTPTransport(limits=limits, http2=http2))
+        return httpx.AsyncClient(transport=self.transport, timeout=None)
+
+    async def close(self):
+        """Closes the pooled http client and any keep-alive connections it holds"""
+        for client in list(self.retired_clients):
+            await client.aclose()
+        self.retired_clients.clear()
+        await self.client.aclose()
+
+    async def close_when_idle(self, client, transport):
+        """Closes a replaced client once every request that was still using its transport has finished"""
+        self.retired_clients.add(client)
+        try:
+            await transport.idle.wait()
+            await client.aclose()
+        finally:
+            self.retired_clients.discard(client)
+
+    async def generate_images(self, url, data, error_name, on_image=None):
+        """Posts a generation request and decodes the images out of the response as the body streams in.
+
+        Each base64 image is handed to the on_image coroutine as soon as it has fully arrived, otherwise they are
+        collected into the returned dicts images list like before"""
+        try:
+            async with self.client.stream("POST", url, json=data, timeout=None) as response:
+                if response.status_code != 200:
+                    print(f"{error_name} ERROR: {response.status_code}")
+                    return
+                parser = JsonImageStreamParser()
+                images = []
+                async for chunk in response.aiter_bytes():
+                    for image in parser.feed(chunk):
+                        if on_image is not None:
+                            await on_image(image)
+                        else:
+                            images.append(image.decode())
+                result = parser.result()
+                result["images"] = images
+                return result
+        except Exception as e:
+            print(f"ERROR: {e}")
+            return {"ERROR": str(e)}
+
+    async def download_video(self, url, error_name, output_path=None, on_progress=None, **request_kwargs):
+        """Posts a generation request and streams the returned video straight to disk a chunk at a time.
+
+        The video is written to output_path if one is given. Otherwise it is hashed as it streams into a temp file in
+        the video cache and then renamed to its content key, so history entries never point at temp files the OS may
+        clean up. on_progress is called with the bytes received so far and the total size if the server sent one"""
+        created_path = None
+        try:
+            async with self.client.stream("POST", url, timeout=None, **request_kwargs) as response:
+                status_header = response.headers.get("x-status")
+                if response.status_code != 200:
+                    await response.aread()
+                    print(f"{error_name} ERROR: {response.status_code} - {response.text}")
+                    return None
+                digest = None
+                if output_path is None:
+                    os.makedirs(self.video_dir, exist_ok=True)
+                    with tempfile.NamedTemporaryFile(dir=self.video_dir, delete=False, suffix=".mp4.tmp") as temp_file:
+                        output_path = created_path = temp_file.name
+                    digest = hashlib.sha256()
+                content_length = response.headers.get("content-length")
+                total = int(content_length) if content_length else None
+                received = 0
+                async with aiofiles.open(output_path, "wb") as f:
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        await f.write(chunk)
+                        if digest is not None:
+                            digest.update(chunk)
+                        received += len(chunk)
+                        if on_progress is not None:
+                            on_progress(received, total)
+                if digest is not None:
+                    output_path = self.store_video(created_path, digest.hexdigest())
+                    created_path = None
+                return {"status": status_header,
+                        "video_path": output_path}
+        except BaseException as e:
+            # Don't leave a half written temp file behind when the download fails or is cancelled
+            if created_path is not None:
+                try:
+                    os.remove(created_path)
+                except OSError:
+                    pass
+            if not isinstance(e, Exception):
+                raise
+            print(f"ERROR: {e}")
+            return {"ERROR": str(e)}
+
+    def store_video(self, temp_path, key):
+        """Renames a downloaded temp file to its content key in the video cache and returns the new path.
+        The temp file is in the same directory tree so this is a rename, not a copy."""
+        path = os.path.join(self.video_dir, key[:2], f"{key}.mp4")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, path)
+        return path
+
+    async def progress_events(self):
+        """Follows the servers progress stream and yields each server-sent event as a dict until it closes.
+        Events carry step and total_steps, and optionally a base64 encoded low resolution preview"""
+        if not self.progress_supported:
+            return
+        url = f"http://{self.base_url}/progress"
+        async with self.client.stream("GET", url, timeout=httpx.Timeout(None, connect=5.0)) as response:
+            if response.status_code == 404:
+                print("Server has no progress stream, jobs will run without progress updates")
+                self.progress_supported = False
+                return
+            if response.status_code != 200:
+                print(f"PROGRESS ERROR: {response.status_code}")
+                return
+            data_lines = []
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    data_lines.append(line[5:].lstrip())
+                elif line == "" and data_lines:
+                    try:
+                        yield json.loads("\n".join(data_lines))
+                    except json.JSONDecodeError as e:
+                        print(f"PROGRESS ERROR: {e}")
+                    data_lines = []
 
     async def ace_music(self, prompt, lyrics, audio_duration=None, guidance_scale=None, infer_step=None,
                         omega_scale=None, actual_seeds=None):
@@ -22,9 +229,8 @@ class AvernusClient:
                 "actual_seeds": actual_seeds}
 
         try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-                status_header = response.headers.get("x-status")
+            response = await self.client.post(url, json=data, timeout=None)
+            status_header = response.headers.get("x-status")
             if response.status_code == 200:
                 return {"status": status_header,
                         "audio": response.content,
@@ -38,7 +244,7 @@ class AvernusClient:
             return {"ERROR": str(e)}
 
     async def auraflow_image(self, prompt, negative_prompt=None, model_name=None, width=None, height=None, steps=None,
-                            batch_size=None, seed=None, guidance_scale=None, lora_name=None):
+                            batch_size=None, seed=None, guidance_scale=None, lora_name=None, on_image=None):
         """This takes a prompt and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/auraflow_generate"
         data = {"prompt": prompt,
@@ -51,35 +257,43 @@ class AvernusClient:
                 "seed": seed,
                 "guidance_scale": guidance_scale,
                 "lora_name": lora_name}
+        return await self.generate_images(url, data, "AURAFLOW", on_image)
+
+    async def cancel(self):
+        """Asks the server to abort the job it is currently running"""
+        url = f"http://{self.base_url}/cancel"
+
         try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
+            response = await self.client.post(url, timeout=5.0)
             if response.status_code == 200:
                 return response.json()
             else:
-                print(f"AURAFLOW ERROR: {response.status_code}")
+                print(f"CANCEL ERROR: {response.status_code}, Response: {response.text}")
+                return {"ERROR": response.text}
         except Exception as e:
-            print(f"ERROR: {e}")
+            print(f"cancel ERROR: {e}")
             return {"ERROR": str(e)}
 
-    async def check_status(self):
-        """Attempts to contact the avernus server and returns a dict with status information from the server"""
+    async def check_status(self, quiet=False):
+        """Attempts to contact the avernus server and returns a dict with status information from the server.
+        quiet skips printing failures, for callers that poll and report them themselves"""
         url = f"http://{self.base_url}/status"
 
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(url)
+            response = await self.client.get(url, timeout=5.0)
             if response.status_code == 200:
                 return response.json()
             else:
-                print(f"STATUS ERROR: {response.status_code}, Response: {response.text}")
+                if not quiet:
+                    print(f"STATUS ERROR: {response.status_code}, Response: {response.text}")
                 return {"ERROR": response.text}
         except Exception as e:
-            print(f"status ERROR: {e}")
+            if not quiet:
+                print(f"status ERROR: {e}")
             return {"ERROR": str(e)}
 
     async def chroma_image(self, prompt, negative_prompt=None, image=None, model_name=None, lora_name=None, width=None,
-                           height=None, steps=None, batch_size=None, strength=None, seed=None, guidance_scale=None):
+                           height=None, steps=None, batch_size=None, strength=None, seed=None, guidance_scale=None, on_image=None):
         """This takes a prompt and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/chroma_generate"
         data = {"prompt": prompt,
@@ -94,20 +308,11 @@ class AvernusClient:
                 "strength": strength,
                 "seed": seed,
                 "guidance_scale": guidance_scale}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"CHROMA ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "CHROMA", on_image)
 
     async def chronoedit(self, prompt, negative_prompt=None, image=None, model_name=None, lora_name=None,
                          width=None, height=None, steps=None, batch_size=None, seed=None, guidance_scale=None,
-                         flow_shift=None, num_frames=None):
+                         flow_shift=None, num_frames=None, on_image=None):
         """This takes a prompt and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/chronoedit_generate"
         data = {"prompt": prompt,
@@ -123,20 +328,11 @@ class AvernusClient:
                 "guidance_scale": guidance_scale,
                 "flow_shift": flow_shift,
                 "num_frames": num_frames}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"CHRONOEDIT ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "CHRONOEDIT", on_image)
 
     async def flux_fill_image(self, prompt, image=None, model_name=None, width=None,
                               height=None, steps=None, batch_size=None, guidance_scale=None, mask_image=None,
-                              strength=None, lora_name=None, seed=None):
+                              strength=None, lora_name=None, seed=None, on_image=None):
         """This takes a prompt, and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/flux_fill_generate"
         data = {"prompt": prompt,
@@ -151,20 +347,11 @@ class AvernusClient:
                 "mask_image": mask_image,
                 "strength": strength,
                 "seed": seed}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"FLUX FILL ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "FLUX FILL", on_image)
 
     async def flux_image(self, prompt, negative_prompt=None, image=None, model_name=None, lora_name=None, width=None,
                          height=None, steps=None, batch_size=None, strength=None, ip_adapter_image=None,
-                         ip_adapter_strength=None, seed=None, guidance_scale=None, true_cfg_scale=None):
+                         ip_adapter_strength=None, seed=None, guidance_scale=None, true_cfg_scale=None, on_image=None):
         """This takes a prompt and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/flux_generate"
         data = {"prompt": prompt,
@@ -182,20 +369,11 @@ class AvernusClient:
                 "seed": seed,
                 "guidance_scale": guidance_scale,
                 "true_cfg_scale": true_cfg_scale}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"FLUX ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "FLUX", on_image)
 
     async def flux_inpaint_image(self, prompt, negative_prompt=None, image=None, model_name=None, width=None,
                                  height=None, steps=None, batch_size=None, guidance_scale=None, mask_image=None,
-                                 strength=None, lora_name=None, seed=None, true_cfg_scale=None):
+                                 strength=None, lora_name=None, seed=None, true_cfg_scale=None, on_image=None):
         """This takes a prompt, and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/flux_inpaint_generate"
         data = {"prompt": prompt,
@@ -212,21 +390,12 @@ class AvernusClient:
                 "strength": strength,
                 "seed": seed,
                 "true_cfg_scale": true_cfg_scale}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"FLUX INPAINT ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "FLUX INPAINT", on_image)
 
     async def flux_kontext(self, prompt, negative_prompt=None, image=None, model_name=None, lora_name=None, width=None,
                            height=None, steps=None, batch_size=None, controlnet_image=None, controlnet_processor=None,
                            ip_adapter_image=None, ip_adapter_strength=None, seed=None, guidance_scale=None,
-                           true_cfg_scale=None):
+                           true_cfg_scale=None, on_image=None):
         """This takes a prompt and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/flux_kontext_generate"
         data = {"prompt": prompt,
@@ -245,19 +414,10 @@ class AvernusClient:
                 "seed": seed,
                 "guidance_scale": guidance_scale,
                 "true_cfg_scale": true_cfg_scale}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"FLUX KONTEXT ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "FLUX KONTEXT", on_image)
 
     async def flux2_image(self, prompt, negative_prompt=None, image=None, model_name=None, lora_name=None, width=None,
-                         height=None, steps=None, batch_size=None, seed=None, guidance_scale=None, true_cfg_scale=None):
+                         height=None, steps=None, batch_size=None, seed=None, guidance_scale=None, true_cfg_scale=None, on_image=None):
         """This takes a prompt and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/flux2_generate"
         data = {"prompt": prompt,
@@ -272,19 +432,11 @@ class AvernusClient:
                 "seed": seed,
                 "guidance_scale": guidance_scale,
                 "true_cfg_scale": true_cfg_scale}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"FLUX2 ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "FLUX2", on_image)
 
     async def framepack(self, prompt, image, negative_prompt=None, width=None, height=None, steps=None, num_frames=None,
-                       guidance_scale=None, last_image=None, seed=None, model_name=None, lora_name=None):
+                       guidance_scale=None, last_image=None, seed=None, model_name=None, lora_name=None,
+                       output_path=None, on_progress=None):
         """This takes a prompt and returns a video"""
         url = f"http://{self.base_url}/framepack_generate"
         data = {"prompt": prompt,
@@ -299,22 +451,10 @@ class AvernusClient:
                 "last_image": last_image,
                 "model_name": model_name,
                 "lora_name": lora_name}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-                status_header = response.headers.get("x-status")
-            if response.status_code == 200:
-                return {"status": status_header,
-                        "video": response.content}
-            else:
-                print(f"FRAMEPACK ERROR: {response.status_code} - {response.text}")
-                return None
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.download_video(url, "FRAMEPACK", output_path, on_progress, json=data)
 
     async def hidream_image(self, prompt, negative_prompt=None, model_name=None, width=None, height=None, steps=None,
-                            batch_size=None, seed=None, guidance_scale=None, lora_name=None):
+                            batch_size=None, seed=None, guidance_scale=None, lora_name=None, on_image=None):
         """This takes a prompt and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/hidream_generate"
         data = {"prompt": prompt,
@@ -327,19 +467,11 @@ class AvernusClient:
                 "seed": seed,
                 "guidance_scale": guidance_scale,
                 "lora_name": lora_name}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"HIDREAM ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "HIDREAM", on_image)
 
     async def hunyuan_ti2v(self, prompt, negative_prompt=None, width=None, height=None, steps=None, num_frames=None,
-                       guidance_scale=None, image=None,  seed=None, model_name=None, flow_shift=None, lora_name=None):
+                       guidance_scale=None, image=None,  seed=None, model_name=None, flow_shift=None, lora_name=None,
+                       output_path=None, on_progress=None):
         """This takes a prompt and returns a video"""
         url = f"http://{self.base_url}/hunyuan_ti2v_generate"
         data = {"prompt": prompt,
@@ -354,21 +486,9 @@ class AvernusClient:
                 "model_name": model_name,
                 "flow_shift": flow_shift,
                 "lora_name": lora_name}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-                status_header = response.headers.get("x-status")
-            if response.status_code == 200:
-                return {"status": status_header,
-                        "video": response.content}
-            else:
-                print(f"HUNYUAN TI2V ERROR: {response.status_code} - {response.text}")
-                return None
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.download_video(url, "HUNYUAN TI2V", output_path, on_progress, json=data)
 
-    async def image_gen_aux_upscale(self, image, model=None, scale=None, tiling=None, tile_width=None, tile_height=None, overlap=None):
+    async def image_gen_aux_upscale(self, image, model=None, scale=None, tiling=None, tile_width=None, tile_height=None, overlap=None, on_image=None):
         """This takes an image and an optional scale of either 2, 4, or 8 and returns an upscaled image"""
         url = f"http://{self.base_url}/image_gen_aux_upscale"
         data = {"image": image,
@@ -378,19 +498,11 @@ class AvernusClient:
                 "tile_width": tile_width,
                 "tile_height": tile_height,
                 "overlap": overlap}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"IMAGE_GEN_AUX_UPSCALE ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "IMAGE_GEN_AUX_UPSCALE", on_image)
 
     async def kandinsky5_t2v(self, prompt, negative_prompt=None, width=None, height=None, steps=None, num_frames=None,
-                       guidance_scale=None, seed=None, model_name=None, lora_name=None):
+                       guidance_scale=None, seed=None, model_name=None, lora_name=None,
+                       output_path=None, on_progress=None):
         """This takes a prompt and returns a video"""
         url = f"http://{self.base_url}/kandinsky5_t2v_generate"
         data = {"prompt": prompt,
@@ -403,19 +515,7 @@ class AvernusClient:
                 "steps": steps,
                 "model_name": model_name,
                 "lora_name": lora_name}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-                status_header = response.headers.get("x-status")
-            if response.status_code == 200:
-                return {"status": status_header,
-                        "video": response.content}
-            else:
-                print(f"KANDINSKY5 T2V ERROR: {response.status_code} - {response.text}")
-                return None
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.download_video(url, "KANDINSKY5 T2V", output_path, on_progress, json=data)
 
 
     async def list_chroma_loras(self):
@@ -423,8 +523,7 @@ class AvernusClient:
         url = f"http://{self.base_url}/list_chroma_loras"
 
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(url)
+            response = await self.client.get(url, timeout=5.0)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -439,8 +538,7 @@ class AvernusClient:
         url = f"http://{self.base_url}/list_flux_loras"
 
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(url)
+            response = await self.client.get(url, timeout=5.0)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -455,8 +553,7 @@ class AvernusClient:
         url = f"http://{self.base_url}/list_flux2_loras"
 
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(url)
+            response = await self.client.get(url, timeout=5.0)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -467,12 +564,30 @@ class AvernusClient:
             return {"ERROR": str(e)}
 
 
+    async def fetch_list(self, endpoint, etag=None):
+        """Fetches one of the list endpoints, revalidating against etag if given.
+        Returns (result, etag), where result is None if the server says the list is unchanged"""
+        url = f"http://{self.base_url}/{endpoint}"
+        headers = {"If-None-Match": etag} if etag else None
+
+        try:
+            response = await self.client.get(url, headers=headers, timeout=5.0)
+            if response.status_code == 304:
+                return None, etag
+            if response.status_code == 200:
+                return response.json(), response.headers.get("ETag")
+            else:
+                print(f"{endpoint.upper()} ERROR: {response.status_code}, Response: {response.text}")
+                return {"ERROR": response.text}, None
+        except Exception as e:
+            print(f"{endpoint} ERROR: {e}")
+            return {"ERROR": str(e)}, None
+
     async def list_models(self):
         """Fetches a list of available model types and models"""
         url = f"http://{self.base_url}/list_models"
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(url)
+            response = await self.client.get(url, timeout=5.0)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -487,8 +602,7 @@ class AvernusClient:
         url = f"http://{self.base_url}/list_qwen_image_loras"
 
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(url)
+            response = await self.client.get(url, timeout=5.0)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -503,8 +617,7 @@ class AvernusClient:
         url = f"http://{self.base_url}/list_sd15_loras"
 
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(url)
+            response = await self.client.get(url, timeout=5.0)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -519,8 +632,7 @@ class AvernusClient:
         url = f"http://{self.base_url}/list_sdxl_controlnets"
 
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(url)
+            response = await self.client.get(url, timeout=5.0)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -535,8 +647,7 @@ class AvernusClient:
         url = f"http://{self.base_url}/list_sdxl_loras"
 
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(url)
+            response = await self.client.get(url, timeout=5.0)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -551,8 +662,7 @@ class AvernusClient:
         url = f"http://{self.base_url}/list_sdxl_schedulers"
 
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(url)
+            response = await self.client.get(url, timeout=5.0)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -567,8 +677,7 @@ class AvernusClient:
         url = f"http://{self.base_url}/list_zimage_loras"
 
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(url)
+            response = await self.client.get(url, timeout=5.0)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -584,8 +693,7 @@ class AvernusClient:
         data = {"prompt": prompt, "model_name": model_name, "messages": messages}
 
         try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
+            response = await self.client.post(url, json=data, timeout=None)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -595,8 +703,68 @@ class AvernusClient:
             print(f"EXCEPTION ERROR: {e}")
             return {"ERROR": str(e)}
 
+    async def llm_chat_batch(self, prompts, model_name=None):
+        """Sends several independent prompts in one request and returns a list of llm_chat style results in the same
+        order. Returns None if the server has no batch endpoint so the caller can send them one at a time"""
+        if not self.batch_chat_supported:
+            return None
+        url = f"http://{self.base_url}/llm_chat_batch"
+        data = {"prompts": prompts, "model_name": model_name}
+
+        try:
+            response = await self.client.post(url, json=data, timeout=None)
+            if response.status_code == 404:
+                self.batch_chat_supported = False
+                return None
+            if response.status_code == 200:
+                result = response.json()
+                responses = result.get("responses")
+                if isinstance(responses, list) and len(responses) == len(prompts):
+                    return [{"status": result.get("status"), "response": text} for text in responses]
+                print(f"LLM BATCH ERROR: expected {len(prompts)} responses, got {result}")
+            else:
+                print(f"LLM BATCH ERROR: {response.status_code}, Response: {response.text}")
+            return None
+        except Exception as e:
+            print(f"EXCEPTION ERROR: {e}")
+            return None
+
+    async def llm_chat_stream(self, prompt, model_name=None, messages=None):
+        """Like llm_chat but yields the response text as the server generates it.
+        Reads server-sent {"token": ...} events or a plain chunked text body, and falls back to a single llm_chat
+        call if the server has no streaming endpoint"""
+        url = f"http://{self.base_url}/llm_chat_stream"
+        data = {"prompt": prompt, "model_name": model_name, "messages": messages}
+        async with self.client.stream("POST", url, json=data, timeout=None) as response:
+            if response.status_code == 404:
+                result = await self.llm_chat(prompt, model_name=model_name, messages=messages)
+                if result.get("status") not in (True, "True") or not isinstance(result.get("response"), str):
+                    raise RuntimeError(f"LLM ERROR: {result}")
+                yield result["response"]
+                return
+            if response.status_code != 200:
+                await response.aread()
+                raise RuntimeError(f"LLM ERROR: {response.status_code}, Response: {response.text}")
+            if not response.headers.get("content-type", "").startswith("text/event-stream"):
+                async for text in response.aiter_text():
+                    yield text
+                return
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    return
+                event = json.loads(payload)
+                if "error" in event:
+                    raise RuntimeError(f"LLM ERROR: {event['error']}")
+                token = event.get("token")
+                if token:
+                    yield token
+
     async def ltx_ti2v(self, prompt, negative_prompt=None, width=None, height=None, steps=None, num_frames=None,
-                       guidance_scale=None, image=None,  seed=None, model_name=None, frame_rate=None, lora_name=None):
+                       guidance_scale=None, image=None,  seed=None, model_name=None, frame_rate=None, lora_name=None,
+                       output_path=None, on_progress=None):
         """This takes a prompt and returns a video"""
         url = f"http://{self.base_url}/ltx_ti2v_generate"
         data = {"prompt": prompt,
@@ -611,22 +779,10 @@ class AvernusClient:
                 "model_name": model_name,
                 "frame_rate": frame_rate,
                 "lora_name": lora_name}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-                status_header = response.headers.get("x-status")
-            if response.status_code == 200:
-                return {"status": status_header,
-                        "video": response.content}
-            else:
-                print(f"LTX TI2V ERROR: {response.status_code} - {response.text}")
-                return None
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.download_video(url, "LTX TI2V", output_path, on_progress, json=data)
 
     async def lumina2_image(self, prompt, negative_prompt=None, model_name=None, width=None, height=None, steps=None,
-                            batch_size=None, seed=None, guidance_scale=None, lora_name=None):
+                            batch_size=None, seed=None, guidance_scale=None, lora_name=None, on_image=None):
         """This takes a prompt and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/lumina2_generate"
         data = {"prompt": prompt,
@@ -639,20 +795,11 @@ class AvernusClient:
                 "seed": seed,
                 "guidance_scale": guidance_scale,
                 "lora_name": lora_name}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"LUMINA2 ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "LUMINA2", on_image)
 
     async def qwen_image_image(self, prompt, negative_prompt=None, image=None, model_name=None, lora_name=None,
                                width=None, height=None, steps=None, batch_size=None, strength=None, seed=None,
-                               true_cfg_scale=None):
+                               true_cfg_scale=None, on_image=None):
         """This takes a prompt and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/qwen_image_generate"
         data = {"prompt": prompt,
@@ -667,20 +814,11 @@ class AvernusClient:
                 "strength": strength,
                 "seed": seed,
                 "true_cfg_scale": true_cfg_scale}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"QWEN IMAGE ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "QWEN IMAGE", on_image)
 
     async def qwen_image_nunchaku_image(self, prompt, negative_prompt=None, image=None, model_name=None, lora_name=None,
                                         width=None, height=None, steps=None, batch_size=None, strength=None, seed=None,
-                                        true_cfg_scale=None):
+                                        true_cfg_scale=None, on_image=None):
         """This takes a prompt and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/qwen_image_nunchaku_generate"
         data = {"prompt": prompt,
@@ -695,20 +833,11 @@ class AvernusClient:
                 "strength": strength,
                 "seed": seed,
                 "true_cfg_scale": true_cfg_scale}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"QWEN IMAGE NUNCHAKU ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "QWEN IMAGE NUNCHAKU", on_image)
 
     async def qwen_image_inpaint_image(self, prompt, negative_prompt=None, image=None, model_name=None, width=None,
                                        height=None, steps=None, batch_size=None, true_cfg_scale=None, mask_image=None,
-                                       strength=None, lora_name=None, seed=None):
+                                       strength=None, lora_name=None, seed=None, on_image=None):
         """This takes a prompt, and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/qwen_image_inpaint_generate"
         data = {"prompt": prompt,
@@ -724,20 +853,11 @@ class AvernusClient:
                 "mask_image": mask_image,
                 "strength": strength,
                 "seed": seed}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"QWEN IMAGE INPAINT ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "QWEN IMAGE INPAINT", on_image)
 
     async def qwen_image_inpaint_nunchaku_image(self, prompt, negative_prompt=None, image=None, model_name=None, width=None,
                                                 height=None, steps=None, batch_size=None, true_cfg_scale=None, mask_image=None,
-                                                strength=None, lora_name=None, seed=None):
+                                                strength=None, lora_name=None, seed=None, on_image=None):
         """This takes a prompt, and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/qwen_image_inpaint_nunchaku_generate"
         data = {"prompt": prompt,
@@ -753,19 +873,10 @@ class AvernusClient:
                 "mask_image": mask_image,
                 "strength": strength,
                 "seed": seed}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"QWEN IMAGE INPAINT NUNCHAKU ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "QWEN IMAGE INPAINT NUNCHAKU", on_image)
 
     async def qwen_image_edit(self, prompt, negative_prompt=None, image=None, model_name=None, lora_name=None,
-                              width=None, height=None, steps=None, batch_size=None, seed=None, true_cfg_scale=None):
+                              width=None, height=None, steps=None, batch_size=None, seed=None, true_cfg_scale=None, on_image=None):
         """This takes a prompt and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/qwen_image_edit_generate"
         data = {"prompt": prompt,
@@ -779,19 +890,10 @@ class AvernusClient:
                 "batch_size": batch_size,
                 "seed": seed,
                 "true_cfg_scale": true_cfg_scale}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"QWEN IMAGE EDIT ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "QWEN IMAGE EDIT", on_image)
 
     async def qwen_image_edit_nunchaku(self, prompt, negative_prompt=None, image=None, model_name=None, lora_name=None,
-                                       width=None, height=None, steps=None, batch_size=None, seed=None, true_cfg_scale=None):
+                                       width=None, height=None, steps=None, batch_size=None, seed=None, true_cfg_scale=None, on_image=None):
         """This takes a prompt and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/qwen_image_edit_nunchaku_generate"
         data = {"prompt": prompt,
@@ -805,19 +907,10 @@ class AvernusClient:
                 "batch_size": batch_size,
                 "seed": seed,
                 "true_cfg_scale": true_cfg_scale}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"QWEN IMAGE EDIT NUNCHAKU ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "QWEN IMAGE EDIT NUNCHAKU", on_image)
 
     async def qwen_image_edit_plus(self, prompt, negative_prompt=None, images=None, model_name=None, lora_name=None,
-                              width=None, height=None, steps=None, batch_size=None, seed=None, true_cfg_scale=None):
+                              width=None, height=None, steps=None, batch_size=None, seed=None, true_cfg_scale=None, on_image=None):
         """This takes a prompt and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/qwen_image_edit_plus_generate"
         data = {"prompt": prompt,
@@ -831,19 +924,10 @@ class AvernusClient:
                 "batch_size": batch_size,
                 "seed": seed,
                 "true_cfg_scale": true_cfg_scale}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"QWEN IMAGE EDIT ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "QWEN IMAGE EDIT", on_image)
 
     async def qwen_image_edit_plus_nunchaku(self, prompt, negative_prompt=None, images=None, model_name=None, lora_name=None,
-                                            width=None, height=None, steps=None, batch_size=None, seed=None, true_cfg_scale=None):
+                                            width=None, height=None, steps=None, batch_size=None, seed=None, true_cfg_scale=None, on_image=None):
         """This takes a prompt and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/qwen_image_edit_plus_nunchaku_generate"
         data = {"prompt": prompt,
@@ -857,36 +941,18 @@ class AvernusClient:
                 "batch_size": batch_size,
                 "seed": seed,
                 "true_cfg_scale": true_cfg_scale}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"QWEN IMAGE EDIT NUNCHAKU ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "QWEN IMAGE EDIT NUNCHAKU", on_image)
 
-    async def realesrgan(self, image, scale=None):
+    async def realesrgan(self, image, scale=None, on_image=None):
         """This takes an image and an optional scale of either 2, 4, or 8 and returns an upscaled image"""
         url = f"http://{self.base_url}/realesrgan_generate"
         data = {"image": image,
                 "scale": scale}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"REALESRGAN ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "REALESRGAN", on_image)
 
     async def sana_sprint_image(self, prompt, max_timesteps=None, intermediate_timesteps=None, image=None,
                                 model_name=None, lora_name=None, width=None, height=None, steps=None, batch_size=None,
-                                strength=None, seed=None, guidance_scale=None):
+                                strength=None, seed=None, guidance_scale=None, on_image=None):
         """This takes a prompt and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/sana_sprint_generate"
         data = {"prompt": prompt,
@@ -904,20 +970,11 @@ class AvernusClient:
                 "guidance_scale": guidance_scale}
         if intermediate_timesteps is not None:
             data["intermediate_timesteps"] = intermediate_timesteps
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"SANA SPRINT ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "SANA SPRINT", on_image)
 
     async def sd15_image(self, prompt, image=None, negative_prompt=None, model_name=None, lora_name=None, width=None,
                          height=None, steps=None, batch_size=None, guidance_scale=None, strength=None, scheduler=None,
-                         seed=None):
+                         seed=None, on_image=None):
         """This takes a prompt, and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/sd15_generate"
         data = {"prompt": prompt,
@@ -933,20 +990,11 @@ class AvernusClient:
                 "strength": strength,
                 "scheduler": scheduler,
                 "seed": seed}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"SD15 ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "SD15", on_image)
 
     async def sd15_inpaint_image(self, prompt, image=None, negative_prompt=None, model_name=None, width=None,
                                  height=None, steps=None, batch_size=None, guidance_scale=None, mask_image=None,
-                                 strength=None, lora_name=None, scheduler=None, seed=None):
+                                 strength=None, lora_name=None, scheduler=None, seed=None, on_image=None):
         """This takes a prompt, and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/sd15_inpaint_generate"
         data = {"prompt": prompt,
@@ -963,21 +1011,12 @@ class AvernusClient:
                 "strength": strength,
                 "scheduler": scheduler,
                 "seed": seed}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"SD15 INPAINT ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "SD15 INPAINT", on_image)
 
     async def sdxl_image(self, prompt, image=None, negative_prompt=None, model_name=None, lora_name=None, width=None,
                          height=None, steps=None, batch_size=None, guidance_scale=None, strength=None,
                          controlnet_image=None, controlnet_processor=None, controlnet_conditioning=None,
-                         ip_adapter_image=None, ip_adapter_strength=None, scheduler=None, seed=None):
+                         ip_adapter_image=None, ip_adapter_strength=None, scheduler=None, seed=None, on_image=None):
         """This takes a prompt, and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/sdxl_generate"
         data = {"prompt": prompt,
@@ -998,20 +1037,11 @@ class AvernusClient:
                 "ip_adapter_image": ip_adapter_image,
                 "scheduler": scheduler,
                 "seed": seed}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"SDXL ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "SDXL", on_image)
 
     async def sdxl_inpaint_image(self, prompt, image=None, negative_prompt=None, model_name=None, width=None,
                                  height=None, steps=None, batch_size=None, guidance_scale=None, mask_image=None,
-                                 strength=None, lora_name=None, scheduler=None, seed=None):
+                                 strength=None, lora_name=None, scheduler=None, seed=None, on_image=None):
         """This takes a prompt, and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/sdxl_inpaint_generate"
         data = {"prompt": prompt,
@@ -1028,34 +1058,17 @@ class AvernusClient:
                 "strength": strength,
                 "scheduler": scheduler,
                 "seed": seed}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"SDXL INPAINT ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "SDXL INPAINT", on_image)
 
-    async def swin2sr(self, image):
+    async def swin2sr(self, image, on_image=None):
         """This takes an image and returns an upscaled image"""
         url = f"http://{self.base_url}/swin2sr_generate"
         data = {"image": image}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"SWIN2SR ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "SWIN2SR", on_image)
 
     async def wan_ti2v(self, prompt, negative_prompt=None, width=None, height=None, steps=None, num_frames=None,
-                       guidance_scale=None, image=None,  seed=None, model_name=None, flow_shift=None, lora_name=None):
+                       guidance_scale=None, image=None,  seed=None, model_name=None, flow_shift=None, lora_name=None,
+                       output_path=None, on_progress=None):
         """This takes a prompt and returns a video"""
         url = f"http://{self.base_url}/wan_ti2v_generate"
         data = {"prompt": prompt,
@@ -1070,23 +1083,12 @@ class AvernusClient:
                 "model_name": model_name,
                 "flow_shift": flow_shift,
                 "lora_name": lora_name}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-                status_header = response.headers.get("x-status")
-            if response.status_code == 200:
-                return {"status": status_header,
-                        "video": response.content}
-            else:
-                print(f"WAN TI2V ERROR: {response.status_code} - {response.text}")
-                return None
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.download_video(url, "WAN TI2V", output_path, on_progress, json=data)
 
     async def wan_vace(self, prompt, negative_prompt=None, width=None, height=None, steps=None, num_frames=None,
                        guidance_scale=None, first_frame=None, last_frame=None, flow_shift=None, seed=None,
-                       model_name=None, lora_name=None):
+                       model_name=None, lora_name=None,
+                       output_path=None, on_progress=None):
         """This takes a prompt and returns a video"""
         url = f"http://{self.base_url}/wan_vace_generate"
         data = {"prompt": prompt,
@@ -1102,22 +1104,11 @@ class AvernusClient:
                 "flow_shift": flow_shift,
                 "model_name": model_name,
                 "lora_name": lora_name}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-                status_header = response.headers.get("x-status")
-            if response.status_code == 200:
-                return {"status": status_header,
-                        "video": response.content}
-            else:
-                print(f"WAN VACE ERROR: {response.status_code} - {response.text}")
-                return None
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.download_video(url, "WAN VACE", output_path, on_progress, json=data)
 
     async def wan_v2v(self, prompt, negative_prompt=None, width=None, height=None, steps=None,
-                      guidance_scale=None, seed=None, model_name=None, video_path=None, flow_shift=None, lora_name=None):
+                      guidance_scale=None, seed=None, model_name=None, video_path=None, flow_shift=None, lora_name=None,
+                      output_path=None, on_progress=None, on_upload_progress=None):
         """This takes a prompt and (optionally) a video, and returns a generated video."""
         url = f"http://{self.base_url}/wan_v2v_generate"
         data = {
@@ -1132,28 +1123,17 @@ class AvernusClient:
             "flow_shift": flow_shift,
             "lora_name": lora_name}
         data = {k: str(v) for k, v in data.items() if v is not None}
-        files = None
-        if video_path:
-            async with aiofiles.open(video_path, "rb") as f:
-                video_bytes = await f.read()
-            files = {"video": (os.path.basename(video_path), video_bytes, "video/mp4")}
-
+        files = {"video": (video_path, "video/mp4")} if video_path else None
         try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, data=data, files=files)
-            status_header = response.headers.get("x-status")
-            if response.status_code == 200:
-                return {"status": status_header,
-                        "video": response.content}
-            else:
-                print(f"WAN TI2V ERROR: {response.status_code} - {response.text}")
-                return None
-        except Exception as e:
+            upload = MultipartUpload(data, files, on_progress=on_upload_progress)
+        except OSError as e:
             print(f"ERROR: {e}")
             return {"ERROR": str(e)}
+        return await self.download_video(url, "WAN TI2V", output_path, on_progress, content=upload,
+                                         headers=upload.headers)
 
     async def zimage_image(self, prompt, negative_prompt=None, model_name=None, lora_name=None, width=None,
-                           height=None, steps=None, batch_size=None, seed=None, guidance_scale=None):
+                           height=None, steps=None, batch_size=None, seed=None, guidance_scale=None, on_image=None):
         """This takes a prompt and optional other variables and returns a list of base64 encoded images"""
         url = f"http://{self.base_url}/zimage_generate"
         data = {"prompt": prompt,
@@ -1166,19 +1146,21 @@ class AvernusClient:
                 "batch_size": batch_size,
                 "seed": seed,
                 "guidance_scale": guidance_scale}
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=data)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"ZIMAGE ERROR: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return {"ERROR": str(e)}
+        return await self.generate_images(url, data, "ZIMAGE", on_image)
 
 
     async def update_url(self, url, port=6969):
+        base_url = f"{url}:{port}"
+        old_client = None
+        if base_url != self.base_url:
+            # Drop the pooled connections to the old server rather than letting them linger until keep-alive expiry,
+            # but only once the requests still running on it are done
+            old_client, old_transport = self.client, self.transport
+            self.client = self.build_client()
+            self.progress_supported = True
+            self.batch_chat_supported = True
         self.url = url
         self.port = port
-        self.base_url = f"{self.url}:{self.port}"
\ No newline at end of file
+        self.base_url = base_url
+        if old_client is not None:
+            asyncio.ensure_future(self.close_when_idle(old_client, old_transport))
\ No newline at end of file
@@ -0,0 +1,182 @@
+import asyncio
+import weakref
+
+from modules.avernus_client import AvernusClient
+from modules.request_queue import RequestQueue, mark_finished
+
+SCHEDULING_POLICIES = ["FIFO", "Model Affinity"]
+
+
+def model_family_key(queue_request):
+    """Returns the key requests are grouped by when minimising model swaps on the server"""
+    lora_name = getattr(queue_request, "lora_name", None)
+    if isinstance(lora_name, list):
+        lora_name = tuple(lora_name)
+    return queue_request.__class__.__name__, getattr(queue_request, "model_name", None), lora_name
+
+
+class AvernusEndpoint:
+    """A single avernus server that queued requests can be dispatched to"""
+    def __init__(self, avernus_client: AvernusClient, max_concurrency: int = 1):
+        self.avernus_client: AvernusClient = avernus_client
+        self.max_concurrency: int = max(1, max_concurrency)
+        self.active: int = 0
+        self.last_model_key: tuple | None = None
+
+    @property
+    def name(self):
+        return self.avernus_client.base_url
+
+    def is_idle(self):
+        return self.active < self.max_concurrency
+
+    def load(self):
+        return self.active / self.max_concurrency
+
+
+class RequestDispatcher:
+    """Hands queued requests to whichever avernus endpoint has a free slot"""
+    def __init__(self, request_event: asyncio.Event, policy: str = "FIFO", max_skips: int = 8,
+                 affinity_window: int = 32, prepare_lookahead: int = 2, enhance_lookahead: int = 16):
+        self.request_event: asyncio.Event = request_event
+        self.endpoints: list[AvernusEndpoint] = []
+        self.retiring: list[AvernusEndpoint] = []
+        self.running: dict = {}
+        self.policy: str = policy
+        self.max_skips: int = max_skips
+        # Weak so requests removed or cancelled while they wait don't linger here with their images and widgets
+        self.skipped: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self.affinity_window: int = affinity_window
+        self.prepare_lookahead: int = prepare_lookahead
+        self.enhance_lookahead: int = max(enhance_lookahead, prepare_lookahead)
+        self.journal = None
+        self.health: dict = {}
+
+    def set_policy(self, policy: str):
+        if policy not in SCHEDULING_POLICIES:
+            print(f"Unknown scheduling policy: {policy}")
+            return
+        self.policy = policy
+        print(f"Scheduling policy: {policy}")
+
+    def set_endpoints(self, endpoints: list[AvernusEndpoint]):
+        """Replaces the endpoint pool. Removed endpoints get no new work, and their clients are closed once the jobs
+        still running on them have finished"""
+        removed = [endpoint for endpoint in self.endpoints + self.retiring if endpoint not in endpoints]
+        self.endpoints = endpoints
+        self.retiring = []
+        for endpoint in removed:
+            if endpoint.active:
+                self.retiring.append(endpoint)
+            else:
+                asyncio.ensure_future(endpoint.avernus_client.close())
+        self.request_event.set()
+
+    def is_available(self, endpoint: AvernusEndpoint):
+        """Returns False if the health monitor has found the endpoint unreachable"""
+        health = self.health.get(endpoint.name)
+        return health is None or health.online is not False
+
+    def endpoint_rank(self, endpoint: AvernusEndpoint):
+        """Sort key for picking between idle endpoints: least loaded first, then the shortest queue on the server
+        itself, then the lowest round trip time"""
+        health = self.health.get(endpoint.name)
+        queue_depth = health.queue_depth if health is not None and isinstance(health.queue_depth, int) else 0
+        rtt = health.rtt() if health is not None else None
+        return endpoint.load(), queue_depth, rtt if rtt is not None else 0.0
+
+    def idle_endpoint(self):
+        """Returns the best reachable endpoint with a free slot, or None if every endpoint is busy or unreachable"""
+        idle = [endpoint for endpoint in self.endpoints if endpoint.is_idle() and self.is_available(endpoint)]
+        if not idle:
+            return None
+        return min(idle, key=self.endpoint_rank)
+
+    def select_next(self, pending_requests: RequestQueue, endpoint: AvernusEndpoint):
+        """Returns the pending request the endpoint should run next.
+
+        With the Model Affinity policy the oldest request in the front lane sharing the model family the endpoint
+        last ran is picked, so the server can keep its weights loaded. Only the first affinity_window requests are
+        considered and requests never jump ahead of a higher priority lane. Every request passed over is aged, and
+        once the oldest one has been skipped max_skips times it runs regardless so no family can starve the others."""
+        head = pending_requests.peek()
+        if self.policy != "Model Affinity" or len(pending_requests) < 2 or endpoint.last_model_key is None:
+            return head
+        if self.skipped.get(head, 0) >= self.max_skips:
+            return head
+        head_lane = pending_requests.lane(head)
+        candidates = [queue_request for queue_request in pending_requests.ordered(self.affinity_window)
+                      if pending_requests.lane(queue_request) == head_lane]
+        for index, queue_request in enumerate(candidates):
+            if model_family_key(queue_request) == endpoint.last_model_key:
+                break
+        else:
+            return head
+        for skipped_request in candidates[:index]:
+            self.skipped[skipped_request] = self.skipped.get(skipped_request, 0) + 1
+        return queue_request
+
+    def prepare_ahead(self, pending_requests: RequestQueue):
+        """Starts preparing the next few queued requests while the endpoints are busy, so their prompt enhancement
+        and input encoding overlap with the generation in front of them. The next prepare_lookahead requests are
+        fully prepared, the ones after them up to enhance_lookahead only get their prompts enhanced, which lets the
+        enhancement batcher send them to the LLM together."""
+        if not self.running:
+            return
+        for index, queue_request in enumerate(pending_requests.ordered(self.enhance_lookahead)):
+            if index < self.prepare_lookahead:
+                start = getattr(queue_request, "start_preparing", None)
+            else:
+                start = getattr(queue_request, "start_enhancing", None)
+            if start is not None:
+                start()
+
+    def dispatch(self, queue_request, endpoint: AvernusEndpoint):
+        """Starts a request on the given endpoint without waiting for it to finish"""
+        self.skipped.pop(queue_request, None)
+        queue_request.avernus_client = endpoint.avernus_client
+        queue_request.endpoint = endpoint
+        endpoint.last_model_key = model_family_key(queue_request)
+        endpoint.active += 1
+        task = asyncio.ensure_future(self._run(queue_request, endpoint))
+        self.running[queue_request] = task
+        return task
+
+    def cancel(self, queue_request):
+        """Cancels a running request, closing its connection and asking its server to abort the job.
+        The servers cancel aborts everything it is running, so it is only sent when this is the endpoints only job,
+        otherwise closing the connection has to do. Returns False if the request is not running."""
+        task = self.running.get(queue_request)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        endpoint = getattr(queue_request, "endpoint", None)
+        if endpoint is None or endpoint.active <= 1:
+            asyncio.ensure_future(queue_request.avernus_client.cancel())
+        return True
+
+    async def _run(self, queue_request, endpoint: AvernusEndpoint):
+        try:
+            await queue_request.run()
+        except asyncio.CancelledError:
+            queue_request.status = "Cancelled"
+            queue_request.ui_item.set_cancelled()
+            print(f"Cancelled {queue_request.__class__.__name__} on {endpoint.name}")
+        except Exception as e:
+            print(f"Exception while processing request on {endpoint.name}: {e}")
+        finally:
+            if self.journal is not None:
+                self.journal.remove(queue_request)
+            endpoint.active -= 1
+            self.running.pop(queue_request, None)
+            if endpoint.active == 0 and endpoint in self.retiring:
+                self.retiring.remove(endpoint)
+                asyncio.ensure_future(endpoint.avernus_client.close())
+            mark_finished(queue_request)
+            self.request_event.set()
+
+    async def close(self, keep: AvernusClient | None = None):
+        """Closes every endpoint client except the one passed in keep"""
+        for endpoint in self.endpoints + self.retiring:
+            if endpoint.avernus_client is not keep:
+                await endpoint.avernus_client.close()
@@ -0,0 +1,57 @@
+import asyncio
+
+ENHANCEMENT_BATCH_WINDOW = 0.05
+ENHANCEMENT_BATCH_SIZE = 16
+
+
+class EnhancementBatcher:
+    """Gathers the LLM prompt enhancements asked for within a short window and sends them to the server together.
+
+    A batch goes out as one llm_chat_batch request so the server can share the prefill of a long instruction
+    string between prompts. Servers without the batch endpoint get the prompts as concurrent llm_chat calls over the
+    pooled connection instead. Each caller gets back its own llm_chat style result."""
+    def __init__(self, window=ENHANCEMENT_BATCH_WINDOW, max_batch_size=ENHANCEMENT_BATCH_SIZE):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.batches = {}
+        self.timers = {}
+
+    async def chat(self, avernus_client, prompt, model_name=None):
+        key = (avernus_client, model_name)
+        future = asyncio.get_running_loop().create_future()
+        batch = self.batches.setdefault(key, [])
+        batch.append((prompt, future))
+        if len(batch) >= self.max_batch_size:
+            self.flush(key)
+        elif key not in self.timers:
+            self.timers[key] = asyncio.get_running_loop().call_later(self.window, self.flush, key)
+        return await future
+
+    def flush(self, key):
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = [(prompt, future) for prompt, future in self.batches.pop(key, []) if not future.done()]
+        if batch:
+            asyncio.ensure_future(self.send(key, batch))
+
+    async def send(self, key, batch):
+        avernus_client, model_name = key
+        prompts = [prompt for prompt, _ in batch]
+        try:
+            results = None
+            if len(batch) > 1:
+                results = await avernus_client.llm_chat_batch(prompts, model_name=model_name)
+            if results is None:
+                results = await asyncio.gather(*(avernus_client.llm_chat(prompt, model_name=model_name)
+                                                 for prompt in prompts))
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+
+ENHANCEMENT_BATCHER = EnhancementBatcher()
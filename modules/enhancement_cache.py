@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+ENHANCEMENT_DB_PATH = "cache/enhancements.sqlite3"
+
+
+class EnhancementCache:
+    """Persistent cache of LLM prompt enhancements keyed by (model, instructions, prompt).
+
+    Every enhancement is stored, but lookups only happen in reuse mode since a fresh enhancement is usually what
+    you want. The cache is bounded to max_entries, evicting whichever entries were used least recently."""
+    def __init__(self, path=ENHANCEMENT_DB_PATH, max_entries=5000):
+        self.path = path
+        self.max_entries = max_entries
+        self.reuse = False
+        self.pending = {}
+        self.connection = None
+        self.entries = 0
+        self.hits = 0
+        self.misses = 0
+
+    def connect(self):
+        if self.connection is not None:
+            return self.connection
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS enhancements (
+                key TEXT PRIMARY KEY,
+                enhanced_prompt TEXT NOT NULL,
+                last_used REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS enhancements_last_used ON enhancements (last_used);
+        """)
+        self.connection.commit()
+        self.entries = self.connection.execute("SELECT COUNT(*) FROM enhancements").fetchone()[0]
+        return self.connection
+
+    @staticmethod
+    def key(model_name, instructions, prompt):
+        return hashlib.sha256(json.dumps([model_name, instructions, prompt]).encode()).hexdigest()
+
+    def get(self, model_name, instructions, prompt):
+        try:
+            connection = self.connect()
+            key = self.key(model_name, instructions, prompt)
+            row = connection.execute("SELECT enhanced_prompt FROM enhancements WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with connection:
+                connection.execute("UPDATE enhancements SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+        except sqlite3.Error as e:
+            print(f"Failed to read the enhancement cache: {e}")
+            return None
+
+    def put(self, model_name, instructions, prompt, enhanced_prompt):
+        try:
+            connection = self.connect()
+            key = self.key(model_name, instructions, prompt)
+            with connection:
+                cursor = connection.execute("UPDATE enhancements SET enhanced_prompt = ?, last_used = ? WHERE key = ?",
+                                            (enhanced_prompt, time.time(), key))
+                if cursor.rowcount == 0:
+                    connection.execute("INSERT INTO enhancements (key, enhanced_prompt, last_used) VALUES (?, ?, ?)",
+                                       (key, enhanced_prompt, time.time()))
+                    self.entries += 1
+                if self.entries > self.max_entries:
+                    connection.execute("DELETE FROM enhancements WHERE key IN (SELECT key FROM enhancements "
+                                       "ORDER BY last_used LIMIT ?)", (self.entries - self.max_entries,))
+                    self.entries = self.max_entries
+        except sqlite3.Error as e:
+            print(f"Failed to write the enhancement cache: {e}")
+
+    def clear(self):
+        try:
+            with self.connect() as connection:
+                connection.execute("DELETE FROM enhancements")
+            self.entries = 0
+        except sqlite3.Error as e:
+            print(f"Failed to clear the enhancement cache: {e}")
+
+    def stats(self):
+        return {"entries": self.entries,
+                "hits": self.hits,
+                "misses": self.misses}
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+ENHANCEMENT_CACHE = EnhancementCache()
@@ -11,7 +11,7 @@ from modules.queue import QueueTab
 from modules.request_helpers import BaseImageRequest, QueueObjectWidget
 from modules.ui_widgets import (HorizontalSlider, ImageGallery, ImageInputBox, ModelPickerWidget, MultiImageInputBox,
                                 ParagraphInputBox, QueueViewer, ResolutionInput, SingleLineInputBox, VerticalTabWidget)
-from modules.utils import base64_to_images, image_to_base64, get_random_artist_prompt, get_generic_danbooru_tags, get_enhanced_prompt
+from modules.utils import encode_image
 
 
 class Flux2Tab(QWidget):
@@ -149,11 +149,9 @@ class Flux2Tab(QWidget):
         except Exception as e:
             print(f"FLUX2 on_submit EXCEPTION: {e}")
 
-    @asyncSlot()
-    async def make_lora_list(self):
+    def set_lora_list(self, response):
         self.lora_list.clear()
         try:
-            response = await self.avernus_client.list_flux2_loras()
             if response["status"] is True:
                 if len(response["loras"]) == 0:
                     self.lora_list.insertItems(0, ["NONE"])
@@ -226,28 +224,17 @@ class Flux2Request(BaseImageRequest):
         if self.i2i_image_enabled:
             input_images = []
             for input_image in self.i2i_image:
-                image = image_to_base64(input_image, kwargs["width"], kwargs["height"])
+                image = await encode_image(input_image, kwargs["width"], kwargs["height"])
                 input_images.append(str(image))
             kwargs["image"] = input_images
-        if self.enhance_prompt:
-            llm_prompt = await get_enhanced_prompt(self.avernus_client, self.prompt)
-            self.enhanced_prompt = llm_prompt
-        if self.add_artist:
-            random_artist_prompt = get_random_artist_prompt()
-            self.enhanced_prompt = f"{random_artist_prompt}. {self.enhanced_prompt}"
-        if self.add_danbooru_tags:
-            danbooru_tags = get_generic_danbooru_tags("./assets/danbooru.csv", self.danbooru_tags_amount)
-            self.enhanced_prompt = f"{self.enhanced_prompt}, {danbooru_tags}"
+        await self.prepare()
 
         try:
             kwargs["model_name"] = str(self.model_name)
-            response = await self.avernus_client.flux2_image(self.enhanced_prompt, **kwargs)
+            response = await self.avernus_client.flux2_image(self.enhanced_prompt, on_image=self.display_image, **kwargs)
             print(response["status"])
             if response["status"] == "True" or response["status"] == True:
                 self.status = "Finished"
-                base64_images = response["images"]
-                images = await base64_to_images(base64_images)
-                await self.display_images(images)
             else:
                 print("FALSE")
                 self.status = "Failed"
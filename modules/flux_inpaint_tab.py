@@ -11,7 +11,7 @@ from modules.queue import QueueTab
 from modules.request_helpers import BaseImageRequest, QueueObjectWidget
 from modules.ui_widgets import (HorizontalSlider, ImageGallery, ModelPickerWidget, PainterWidget, ParagraphInputBox,
                                 QueueViewer, SingleLineInputBox, VerticalTabWidget)
-from modules.utils import base64_to_images, image_to_base64, get_generic_danbooru_tags, get_random_artist_prompt, get_enhanced_prompt
+from modules.utils import encode_image
 
 
 class FluxInpaintTab(QWidget):
@@ -156,11 +156,9 @@ class FluxInpaintTab(QWidget):
     def set_brush_size(self):
         self.paint_area.pen.setWidth(int(self.brush_size_slider.slider.value()))
 
-    @asyncSlot()
-    async def make_lora_list(self):
+    def set_lora_list(self, response):
         self.lora_list.clear()
         try:
-            response = await self.avernus_client.list_flux_loras()
             if response["status"] is True:
                 if len(response["loras"]) == 0:
                     self.lora_list.insertItems(0, ["NONE"])
@@ -172,6 +170,8 @@ class FluxInpaintTab(QWidget):
             self.lora_list.insertItems(0, ["LORA LIST ERROR"])
 
 class FluxInpaintRequest(BaseImageRequest):
+    prefetch_images = (("image", None, "image"), ("mask_image", None, "mask_image"))
+
     def __init__(self,
                  avernus_client: AvernusClient,
                  gallery: ImageGallery,
@@ -232,32 +232,21 @@ class FluxInpaintRequest(BaseImageRequest):
         if self.true_cfg_scale != "": kwargs["true_cfg_scale"] = float(self.true_cfg_scale)
         if self.seed != "": kwargs["seed"] = int(self.seed)
         if self.lora_name != "<None>": kwargs["lora_name"] = self.lora_name
-        image = image_to_base64(self.image, self.width, self.height)
+        image = await encode_image(self.image, self.width, self.height)
         kwargs["image"] = str(image)
-        mask_image = image_to_base64(self.mask_image, self.width, self.height)
+        mask_image = await encode_image(self.mask_image, self.width, self.height, "mask_image")
         kwargs["mask_image"] = str(mask_image)
         kwargs["width"] = self.width
         kwargs["height"] = self.height
         kwargs["strength"] = self.strength
 
-        if self.enhance_prompt:
-            llm_prompt = await get_enhanced_prompt(self.avernus_client, self.prompt)
-            self.enhanced_prompt = llm_prompt
-        if self.add_artist:
-            random_artist_prompt = get_random_artist_prompt()
-            self.enhanced_prompt = f"{random_artist_prompt}. {self.enhanced_prompt}"
-        if self.add_danbooru_tags:
-            danbooru_tags = get_generic_danbooru_tags("./assets/danbooru.csv", self.danbooru_tags_amount)
-            self.enhanced_prompt = f"{self.enhanced_prompt}, {danbooru_tags}"
+        await self.prepare()
 
         try:
             kwargs["model_name"] = str(self.model_name)
-            response = await self.avernus_client.flux_inpaint_image(self.enhanced_prompt, **kwargs)
+            response = await self.avernus_client.flux_inpaint_image(self.enhanced_prompt, on_image=self.display_image, **kwargs)
             if response["status"] == "True" or response["status"] == True:
                 self.status = "Finished"
-                base64_images = response["images"]
-                images = await base64_to_images(base64_images)
-                await self.display_images(images)
             else:
                 self.status = "Failed"
         except Exception as e:
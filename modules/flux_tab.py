@@ -11,7 +11,7 @@ from modules.queue import QueueTab
 from modules.request_helpers import BaseImageRequest, QueueObjectWidget
 from modules.ui_widgets import (HorizontalSlider, ImageGallery, ImageInputBox, ModelPickerWidget, ParagraphInputBox,
                                 QueueViewer, ResolutionInput, SingleLineInputBox, VerticalTabWidget)
-from modules.utils import base64_to_images, image_to_base64, get_random_artist_prompt, get_generic_danbooru_tags, get_enhanced_prompt
+from modules.utils import encode_image
 
 
 class FluxTab(QWidget):
@@ -241,11 +241,9 @@ class FluxTab(QWidget):
         except Exception as e:
             print(f"FLUX on_submit EXCEPTION: {e}")
 
-    @asyncSlot()
-    async def make_lora_list(self):
+    def set_lora_list(self, response):
         self.lora_list.clear()
         try:
-            response = await self.avernus_client.list_flux_loras()
             if response["status"] is True:
                 if len(response["loras"]) == 0:
                     self.lora_list.insertItems(0, ["NONE"])
@@ -274,6 +272,8 @@ class FluxTab(QWidget):
 
 
 class FluxRequest(BaseImageRequest):
+    prefetch_images = (("i2i_image", "i2i_image_enabled", "image"), ("ip_adapter_image", "ip_adapter_enabled", "ip_adapter_image"))
+
     def __init__(self,
                  avernus_client: AvernusClient,
                  gallery: ImageGallery,
@@ -351,45 +351,34 @@ class FluxRequest(BaseImageRequest):
         if self.height is not None: kwargs["height"] = int(self.height)
 
         if self.i2i_image_enabled:
-            image = image_to_base64(self.i2i_image, kwargs["width"], kwargs["height"])
+            image = await encode_image(self.i2i_image, kwargs["width"], kwargs["height"])
             kwargs["image"] = str(image)
             if self.strength != "":
                 kwargs["strength"] = float(self.strength)
         if self.ip_adapter_enabled:
-            ip_adapter_image = image_to_base64(self.ip_adapter_image, kwargs["width"], kwargs["height"])
+            ip_adapter_image = await encode_image(self.ip_adapter_image, kwargs["width"], kwargs["height"], "ip_adapter_image")
             kwargs["ip_adapter_image"] = str(ip_adapter_image)
             if self.ip_adapter_strength != "":
                 kwargs["ip_adapter_strength"] = float(self.ip_adapter_strength)
         if self.kontext_enabled:
             kontext_width = int(self.kontext_image.width())
             kontext_height = int(self.kontext_image.height())
-            kontext_image = image_to_base64(self.kontext_image, kontext_width, kontext_height)
+            kontext_image = await encode_image(self.kontext_image, kontext_width, kontext_height)
             kwargs["image"] = str(kontext_image)
             kwargs["width"] = None
             kwargs["height"] = None
 
-        if self.enhance_prompt:
-            llm_prompt = await get_enhanced_prompt(self.avernus_client, self.prompt)
-            self.enhanced_prompt = llm_prompt
-        if self.add_artist:
-            random_artist_prompt = get_random_artist_prompt()
-            self.enhanced_prompt = f"{random_artist_prompt}. {self.enhanced_prompt}"
-        if self.add_danbooru_tags:
-            danbooru_tags = get_generic_danbooru_tags("./assets/danbooru.csv", self.danbooru_tags_amount)
-            self.enhanced_prompt = f"{self.enhanced_prompt}, {danbooru_tags}"
+        await self.prepare()
 
         try:
             if self.kontext_enabled:
-                response = await self.avernus_client.flux_kontext(self.enhanced_prompt, **kwargs)
+                response = await self.avernus_client.flux_kontext(self.enhanced_prompt, on_image=self.display_image, **kwargs)
             else:
                 kwargs["model_name"] = str(self.model_name)
-                response = await self.avernus_client.flux_image(self.enhanced_prompt, **kwargs)
+                response = await self.avernus_client.flux_image(self.enhanced_prompt, on_image=self.display_image, **kwargs)
             print(response["status"])
             if response["status"] == "True" or response["status"] == True:
                 self.status = "Finished"
-                base64_images = response["images"]
-                images = await base64_to_images(base64_images)
-                await self.display_images(images)
             else:
                 print("FALSE")
                 self.status = "Failed"
@@ -11,7 +11,7 @@ from modules.queue import QueueTab
 from modules.request_helpers import BaseVideoRequest, QueueObjectWidget
 from modules.ui_widgets import (ImageGallery, ImageInputBox, ModelPickerWidget, ParagraphInputBox, ResolutionInput,
                                 QueueViewer, SingleLineInputBox, VerticalTabWidget)
-from modules.utils import image_to_base64, get_enhanced_prompt
+from modules.utils import encode_image
 
 
 class FramepackTab(QWidget):
@@ -119,6 +119,8 @@ class FramepackTab(QWidget):
 
 
 class FramepackRequest(BaseVideoRequest):
+    prefetch_images = (("first_frame", "first_frame_enabled", "image"), ("last_frame", "last_frame_enabled", "image"))
+
     def __init__(self,
                  avernus_client: AvernusClient,
                  gallery: ImageGallery,
@@ -174,22 +176,20 @@ class FramepackRequest(BaseVideoRequest):
         if self.guidance_scale != "": kwargs["guidance_scale"] = float(self.guidance_scale)
         if self.seed != "": kwargs["seed"] = int(self.seed)
         if self.model_name != "" or None: kwargs["model_name"] = str(self.model_name)
-        if self.enhance_prompt:
-            llm_prompt = await get_enhanced_prompt(self.avernus_client, self.prompt, "Rewrite and enhance the original editing instruction with richer detail, clearer structure, and improved descriptive quality. When adding text that should appear inside an image, place that text inside double quotes and in capital letters. Explain what needs to be changed and what needs to be left unchanged. Explain in details how to change  camera position or tell that camera position shouldn't be changed. example: Original text: add text 911 and 'Police' Result: Add the word '911' in large blue letters to the hood. Below that, add the word 'POLICE.' Keep the camera position unchanged, as do the background, car position, and lighting. Answer only with expanded prompt. Rewrite Prompt: ")
-            self.enhanced_prompt = llm_prompt
+        await self.prepare()
         kwargs["prompt"] = self.enhanced_prompt
 
         if self.first_frame_enabled:
-            image = image_to_base64(self.first_frame, kwargs["width"], kwargs["height"])
+            image = await encode_image(self.first_frame, kwargs["width"], kwargs["height"])
             kwargs["image"] = str(image)
         if self.last_frame_enabled:
-            image = image_to_base64(self.last_frame, kwargs["width"], kwargs["height"])
+            image = await encode_image(self.last_frame, kwargs["width"], kwargs["height"])
             kwargs["last_image"] = str(image)
         try:
-            response = await self.avernus_client.framepack(**kwargs)
+            response = await self.avernus_client.framepack(on_progress=self.show_download_progress, **kwargs)
             if response["status"] == "True" or response["status"] == True:
                 self.status = "Finished"
-                await self.display_video(response.content)
+                await self.display_video(response["video_path"])
             else:
                 self.status = "Failed"
         except Exception as e:
@@ -0,0 +1,143 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+from PySide6.QtGui import QImage, QPixmap
+from PySide6.QtCore import Qt
+
+GALLERY_CACHE_DIR = "cache/gallery"
+GALLERY_MAX_DISK_BYTES = 8 * 1024 * 1024 * 1024
+
+
+class GalleryStore:
+    """Content addressed on-disk store for gallery images with a byte-size bounded LRU of full size pixmaps.
+
+    Gallery tiles only keep a small base thumbnail and their key, the full image is loaded back from disk when it
+    is opened or sent somewhere else. The files on disk are capped at max_disk_bytes by prune."""
+    def __init__(self, path=GALLERY_CACHE_DIR, max_bytes=512 * 1024 * 1024, thumbnail_width=512,
+                 max_disk_bytes=GALLERY_MAX_DISK_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.thumbnail_width = thumbnail_width
+        self.current_bytes = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, key):
+        return os.path.join(self.path, key[:2], f"{key}.png")
+
+    def store_image(self, image_data):
+        """Writes encoded image bytes to the store and returns (key, base thumbnail, original size).
+        Only touches QImage so it is safe to run on a worker thread, returns None if the data is not an image."""
+        key = hashlib.sha256(image_data).hexdigest()
+        image = QImage()
+        image.loadFromData(memoryview(image_data))
+        if image.isNull():
+            return None
+        path = self.path_for(key)
+        if os.path.exists(path):
+            try:
+                os.utime(path)  # Stored again, so it is the last to be pruned
+            except OSError:
+                pass
+        else:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_path = f"{path}.tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(image_data)
+                os.replace(temp_path, path)
+            except OSError as e:
+                print(f"Failed to write {path} to the gallery store: {e}")
+        return key, self.base_thumbnail(image), image.size()
+
+    def prune(self):
+        """Deletes the least recently stored images until the files on disk fit in max_disk_bytes and returns how many
+        were deleted. History entries of pruned images show them as missing. Safe to run on a worker thread."""
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.path):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue  # Still being written
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Failed to prune {path} from the gallery store: {e}")
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            print(f"Pruned {removed} images from the gallery store")
+        return removed
+
+    def load_image(self, path):
+        """Reads a stored image back as (key, base thumbnail, original size) without keeping the full image around.
+        Safe to run on a worker thread, returns None if the file is gone."""
+        image = QImage(path)
+        if image.isNull():
+            return None
+        key = os.path.splitext(os.path.basename(path))[0]
+        return key, self.base_thumbnail(image), image.size()
+
+    def base_thumbnail(self, image: QImage) -> QImage:
+        if image.width() > self.thumbnail_width:
+            return image.scaledToWidth(self.thumbnail_width, Qt.SmoothTransformation)
+        return image
+
+    def pixmap(self, key) -> QPixmap:
+        """Returns the full size pixmap for a key, loading it from disk if it is not resident"""
+        pixmap = self.entries.get(key)
+        if pixmap is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return pixmap
+        self.misses += 1
+        pixmap = QPixmap(self.path_for(key))
+        if pixmap.isNull():
+            print(f"Gallery image {key} is missing from {self.path}")
+            return pixmap
+        self.put(key, pixmap)
+        return pixmap
+
+    def put(self, key, pixmap: QPixmap):
+        size = pixmap_bytes(pixmap)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.current_bytes -= pixmap_bytes(self.entries.pop(key))
+        self.entries[key] = pixmap
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.current_bytes -= pixmap_bytes(evicted)
+
+    def clear(self):
+        """Drops the resident pixmaps, the files on disk are kept"""
+        self.entries.clear()
+        self.current_bytes = 0
+
+    def stats(self):
+        return {"entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "hits": self.hits,
+                "misses": self.misses}
+
+
+def pixmap_bytes(pixmap: QPixmap):
+    return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+GALLERY_STORE = GalleryStore()
@@ -0,0 +1,197 @@
+import asyncio
+import time
+from collections import deque
+
+from PySide6.QtWidgets import QLabel, QVBoxLayout, QWidget
+
+HEALTH_INTERVAL = 5.0
+HEALTH_BUSY_INTERVAL = 15.0
+HEALTH_MAX_INTERVAL = 60.0
+HEALTH_WINDOW = 50
+HEALTH_FAILURE_THRESHOLD = 3
+
+
+def percentile(values, fraction):
+    """Returns the nearest rank percentile of values, or None if there are none"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def status_value(status, *names):
+    """Returns the first of names the server reported in its status, since not every server reports the same keys"""
+    for name in names:
+        if status.get(name) is not None:
+            return status[name]
+    return None
+
+
+class EndpointHealth:
+    """Rolling health telemetry for one avernus server.
+    A server is only marked offline after failure_threshold checks in a row have failed, since a server busy
+    generating can easily miss a single status check"""
+    def __init__(self, name, window=HEALTH_WINDOW, failure_threshold=HEALTH_FAILURE_THRESHOLD):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.rtts = deque(maxlen=window)
+        self.results = deque(maxlen=window)
+        self.online = None
+        self.failures = 0
+        self.vram_used = None
+        self.vram_total = None
+        self.queue_depth = None
+        self.last_checked = None
+
+    def record(self, rtt, status):
+        self.last_checked = time.time()
+        if status.get("status") in (True, "True"):
+            self.rtts.append(rtt)
+            self.results.append(True)
+            self.online = True
+            self.failures = 0
+            self.vram_used = status_value(status, "vram_used", "vram_allocated")
+            self.vram_total = status_value(status, "vram_total")
+            self.queue_depth = status_value(status, "queue_depth", "queue_size", "pending")
+        else:
+            self.results.append(False)
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.online = False
+
+    def rtt(self, fraction=0.5):
+        return percentile(self.rtts, fraction)
+
+    def error_rate(self):
+        if not self.results:
+            return 0.0
+        return self.results.count(False) / len(self.results)
+
+    def describe(self):
+        if self.online is None:
+            return f"{self.name}: checking"
+        if not self.online:
+            return f"{self.name}: offline ({self.failures} failed checks)"
+        parts = [f"{self.name}: online"]
+        if self.rtts:
+            parts.append(f"rtt p50 {self.rtt(0.5) * 1000:.0f}ms p95 {self.rtt(0.95) * 1000:.0f}ms")
+        parts.append(f"errors {self.error_rate():.0%}")
+        if self.vram_used is not None:
+            vram = f"vram {self.vram_used}"
+            if self.vram_total is not None:
+                vram += f"/{self.vram_total}"
+            parts.append(vram)
+        if self.queue_depth is not None:
+            parts.append(f"queue {self.queue_depth}")
+        return ", ".join(parts)
+
+
+class HealthMonitor:
+    """Polls the status of every dispatcher endpoint in the background.
+
+    Idle servers are checked every interval seconds and busy ones every busy_interval so the checks stay out of the
+    way of generation traffic. An unreachable server is checked with a doubling backoff up to max_interval. The
+    results are written to the dispatchers health table and passed to every listener after each round."""
+    def __init__(self, dispatcher, interval=HEALTH_INTERVAL, busy_interval=HEALTH_BUSY_INTERVAL,
+                 max_interval=HEALTH_MAX_INTERVAL):
+        self.dispatcher = dispatcher
+        self.interval = interval
+        self.busy_interval = busy_interval
+        self.max_interval = max_interval
+        self.next_check = {}
+        self.listeners = []
+        self.wake_event = asyncio.Event()
+        self.running = False
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def health(self, name):
+        return self.dispatcher.health.get(name)
+
+    def wake(self):
+        """Checks every endpoint straight away, used when the servers change"""
+        self.next_check.clear()
+        self.wake_event.set()
+
+    def stop(self):
+        self.running = False
+        self.wake_event.set()
+
+    async def run(self):
+        self.running = True
+        while self.running:
+            endpoints = list(self.dispatcher.endpoints)
+            names = {endpoint.name for endpoint in endpoints}
+            for name in list(self.dispatcher.health):
+                if name not in names:
+                    del self.dispatcher.health[name]
+                    self.next_check.pop(name, None)
+            now = time.monotonic()
+            due = [endpoint for endpoint in endpoints if self.next_check.get(endpoint.name, 0) <= now]
+            if due:
+                await asyncio.gather(*(self.check(endpoint) for endpoint in due))
+                self.notify()
+            delay = min(self.next_check.values(), default=now + self.interval) - time.monotonic()
+            try:
+                await asyncio.wait_for(self.wake_event.wait(), max(0.0, delay))
+            except asyncio.TimeoutError:
+                pass
+            self.wake_event.clear()
+
+    async def check(self, endpoint):
+        health = self.dispatcher.health.get(endpoint.name)
+        if health is None:
+            health = self.dispatcher.health[endpoint.name] = EndpointHealth(endpoint.name)
+        was_online = health.online
+        start = time.monotonic()
+        try:
+            status = await endpoint.avernus_client.check_status(quiet=True)
+        except Exception as e:
+            status = {"ERROR": str(e)}
+        health.record(time.monotonic() - start, status if isinstance(status, dict) else {})
+        if health.failures == 0:
+            interval = self.busy_interval if endpoint.active else self.interval
+            if was_online is not True:
+                print(f"Avernus server {endpoint.name} is online")
+                self.dispatcher.request_event.set()
+        elif health.online is False:
+            interval = min(self.max_interval, self.interval * 2 ** min(health.failures, 8))
+            if was_online is not False:
+                print(f"Avernus server {endpoint.name} is unreachable")
+        else:
+            # Not unreachable yet, check again soon to confirm either way
+            interval = self.interval
+        self.next_check[endpoint.name] = time.monotonic() + interval
+
+    def notify(self):
+        for callback in self.listeners:
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"Failed to update server health: {e}")
+
+
+class HealthPanel(QWidget):
+    """Shows one line of telemetry per avernus server"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.layout = QVBoxLayout(self)
+        self.layout.setContentsMargins(0, 0, 0, 0)
+        self.layout.setSpacing(0)
+        self.labels = {}
+
+    def show_health(self, monitor):
+        endpoints = [endpoint.name for endpoint in monitor.dispatcher.endpoints]
+        for name in list(self.labels):
+            if name not in endpoints:
+                self.labels.pop(name).deleteLater()
+        for name in endpoints:
+            health = monitor.health(name)
+            if health is None:
+                continue
+            label = self.labels.get(name)
+            if label is None:
+                label = self.labels[name] = QLabel()
+                self.layout.addWidget(label)
+            label.setText(health.describe())
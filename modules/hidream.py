@@ -11,7 +11,6 @@ from modules.request_helpers import BaseImageRequest, QueueObjectWidget
 from modules.ui_widgets import (HorizontalSlider, ImageGallery, ModelPickerWidget, ParagraphInputBox,
                                 PromptPickerWidget, QueueViewer, ResolutionInput, SingleLineInputBox,
                                 VerticalTabWidget)
-from modules.utils import base64_to_images, get_generic_danbooru_tags, get_random_artist_prompt, get_enhanced_prompt
 
 
 class HiDreamTab(QWidget):
@@ -174,24 +173,12 @@ class HiDreamRequest(BaseImageRequest):
         if self.width is not None: kwargs["width"] = int(self.width)
         if self.height is not None: kwargs["height"] = int(self.height)
 
-        if self.enhance_prompt:
-            llm_prompt = await get_enhanced_prompt(self.avernus_client, self.prompt)
-            self.enhanced_prompt = llm_prompt
-            self.enhanced_prompt = llm_prompt
-        if self.add_artist:
-            random_artist_prompt = get_random_artist_prompt()
-            self.enhanced_prompt = f"{random_artist_prompt}. {self.enhanced_prompt}"
-        if self.add_danbooru_tags:
-            danbooru_tags = get_generic_danbooru_tags("./assets/danbooru.csv", self.danbooru_tags_amount)
-            self.enhanced_prompt = f"{self.enhanced_prompt}, {danbooru_tags}"
+        await self.prepare()
 
         try:
-            response = await self.avernus_client.hidream_image(self.enhanced_prompt, **kwargs)
+            response = await self.avernus_client.hidream_image(self.enhanced_prompt, on_image=self.display_image, **kwargs)
             if response["status"] == "True" or response["status"] == True:
                 self.status = "Finished"
-                base64_images = response["images"]
-                images = await base64_to_images(base64_images)
-                await self.display_images(images)
             else:
                 self.status = "Failed"
         except Exception as e:
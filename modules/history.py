@@ -0,0 +1,154 @@
+import json
+import os
+import sqlite3
+import time
+
+HISTORY_DB_PATH = "cache/history.sqlite3"
+HISTORY_SORTS = {"Newest": "g.created DESC",
+                 "Oldest": "g.created ASC",
+                 "Model": "g.model_name ASC, g.created DESC",
+                 "Slowest": "g.elapsed DESC",
+                 "Fastest": "g.elapsed ASC"}
+HISTORY_FIELDS = ["prompt", "enhanced_prompt", "negative_prompt", "model_name", "seed", "width", "height"]
+
+
+class HistoryIndex:
+    """Persistent sqlite index of finished generations and the files they produced.
+    Prompts are searched through an FTS5 table when sqlite has it, falling back to LIKE when it does not."""
+    def __init__(self, path=HISTORY_DB_PATH):
+        self.path = path
+        self.connection = None
+        self.fts = False
+
+    def connect(self):
+        if self.connection is not None:
+            return self.connection
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS generations (
+                id INTEGER PRIMARY KEY,
+                created REAL NOT NULL,
+                request_type TEXT NOT NULL,
+                status TEXT,
+                prompt TEXT,
+                enhanced_prompt TEXT,
+                negative_prompt TEXT,
+                model_name TEXT,
+                lora_name TEXT,
+                seed TEXT,
+                width INTEGER,
+                height INTEGER,
+                elapsed REAL,
+                queue_info TEXT);
+            CREATE INDEX IF NOT EXISTS generations_created ON generations (created);
+            CREATE INDEX IF NOT EXISTS generations_model ON generations (model_name, created);
+            CREATE TABLE IF NOT EXISTS outputs (
+                generation_id INTEGER NOT NULL REFERENCES generations (id) ON DELETE CASCADE,
+                position INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                path TEXT NOT NULL,
+                PRIMARY KEY (generation_id, position));
+        """)
+        try:
+            self.connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS generations_fts USING fts5("
+                                    "prompt, enhanced_prompt, content='generations', content_rowid='id')")
+            self.fts = True
+        except sqlite3.OperationalError as e:
+            print(f"sqlite FTS5 unavailable, history search will be slower: {e}")
+        self.connection.commit()
+        return self.connection
+
+    def record(self, queue_request, elapsed_time, outputs):
+        """Adds a finished request and its output files to the index"""
+        try:
+            connection = self.connect()
+            values = {}
+            for field in HISTORY_FIELDS:
+                value = getattr(queue_request, field, None)
+                values[field] = None if value is None or value == "" else value
+            lora_name = getattr(queue_request, "lora_name", None)
+            with connection:
+                cursor = connection.execute(
+                    "INSERT INTO generations (created, request_type, status, prompt, enhanced_prompt, negative_prompt, "
+                    "model_name, lora_name, seed, width, height, elapsed, queue_info) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (time.time(), queue_request.__class__.__name__, queue_request.status, values["prompt"],
+                     values["enhanced_prompt"], values["negative_prompt"],
+                     None if values["model_name"] is None else str(values["model_name"]),
+                     json.dumps(lora_name) if lora_name not in (None, "", "<None>") else None,
+                     None if values["seed"] is None else str(values["seed"]),
+                     to_int(values["width"]), to_int(values["height"]), elapsed_time,
+                     getattr(queue_request, "queue_info", None)))
+                generation_id = cursor.lastrowid
+                if self.fts:
+                    connection.execute("INSERT INTO generations_fts (rowid, prompt, enhanced_prompt) VALUES (?, ?, ?)",
+                                       (generation_id, values["prompt"], values["enhanced_prompt"]))
+                connection.executemany("INSERT INTO outputs (generation_id, position, kind, path) VALUES (?, ?, ?, ?)",
+                                       [(generation_id, position, kind, path)
+                                        for position, (kind, path) in enumerate(outputs)])
+            return generation_id
+        except sqlite3.Error as e:
+            print(f"Failed to record generation history: {e}")
+
+    def search(self, text="", model_name=None, since=None, until=None, sort="Newest", limit=50, offset=0):
+        """Returns one page of generations matching the prompt text, model and creation time range"""
+        connection = self.connect()
+        joins = ""
+        conditions = []
+        parameters = []
+        text = text.strip()
+        if text and self.fts:
+            joins = "JOIN generations_fts f ON f.rowid = g.id"
+            conditions.append("generations_fts MATCH ?")
+            parameters.append(" ".join('"' + token.replace('"', '""') + '"' for token in text.split()))
+        elif text:
+            for token in text.split():
+                conditions.append("(g.prompt LIKE ? OR g.enhanced_prompt LIKE ?)")
+                parameters += [f"%{token}%", f"%{token}%"]
+        if model_name:
+            conditions.append("g.model_name = ?")
+            parameters.append(model_name)
+        if since is not None:
+            conditions.append("g.created >= ?")
+            parameters.append(since)
+        if until is not None:
+            conditions.append("g.created < ?")
+            parameters.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = HISTORY_SORTS.get(sort, HISTORY_SORTS["Newest"])
+        query = (f"SELECT g.*, (SELECT COUNT(*) FROM outputs o WHERE o.generation_id = g.id) AS output_count "
+                 f"FROM generations g {joins} {where} ORDER BY {order} LIMIT ? OFFSET ?")
+        try:
+            return [dict(row) for row in connection.execute(query, parameters + [limit, offset])]
+        except sqlite3.Error as e:
+            print(f"History search failed: {e}")
+            return []
+
+    def outputs(self, generation_id):
+        connection = self.connect()
+        rows = connection.execute("SELECT kind, path FROM outputs WHERE generation_id = ? ORDER BY position",
+                                  (generation_id,))
+        return [dict(row) for row in rows]
+
+    def models(self):
+        connection = self.connect()
+        rows = connection.execute("SELECT DISTINCT model_name FROM generations WHERE model_name IS NOT NULL "
+                                  "ORDER BY model_name")
+        return [row["model_name"] for row in rows]
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+HISTORY = HistoryIndex()
@@ -0,0 +1,163 @@
+import asyncio
+import datetime
+import os
+import time
+from typing import cast
+
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QPixmap
+from PySide6.QtWidgets import (QComboBox, QHBoxLayout, QLabel, QLineEdit, QListWidget, QListWidgetItem, QPushButton,
+                               QVBoxLayout, QWidget, QAbstractItemView)
+from qasync import asyncSlot
+
+from modules.avernus_client import AvernusClient
+from modules.gallery import GalleryTab
+from modules.gallery_store import GALLERY_STORE
+from modules.history import HISTORY, HISTORY_SORTS
+from modules.request_helpers import ClickablePixmap, ClickableVideo
+from modules.ui_widgets import ImageGallery, VerticalTabWidget
+from modules.utils import IMAGE_WORKERS
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_RANGES = {"Any Time": None,
+                  "Today": 0,
+                  "Last 7 Days": 7,
+                  "Last 30 Days": 30}
+
+
+class HistoryTab(QWidget):
+    def __init__(self, avernus_client: AvernusClient, tabs: VerticalTabWidget):
+        super().__init__()
+        self.avernus_client: AvernusClient = avernus_client
+        self.tabs: VerticalTabWidget = tabs
+        self.gallery_tab: GalleryTab = cast(GalleryTab, self.tabs.named_widget("Gallery"))
+        self.gallery: ImageGallery = self.gallery_tab.gallery
+        self.page = 0
+
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search prompts")
+        self.search_input.returnPressed.connect(self.search)
+        self.model_picker = QComboBox()
+        self.model_picker.addItem("All Models")
+        self.range_picker = QComboBox()
+        self.range_picker.addItems(list(HISTORY_RANGES.keys()))
+        self.sort_picker = QComboBox()
+        self.sort_picker.addItems(list(HISTORY_SORTS.keys()))
+        self.search_button = QPushButton("Search")
+        self.search_button.clicked.connect(self.search)
+        self.results_list = QListWidget()
+        self.results_list.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.results_list.itemDoubleClicked.connect(self.load_selected)
+        self.previous_button = QPushButton("Previous")
+        self.previous_button.clicked.connect(self.previous_page)
+        self.next_button = QPushButton("Next")
+        self.next_button.clicked.connect(self.next_page)
+        self.page_label = QLabel("Page 1")
+        self.load_button = QPushButton("Load Into Gallery")
+        self.load_button.clicked.connect(self.load_selected)
+
+        self.model_picker.currentTextChanged.connect(self.search)
+        self.range_picker.currentTextChanged.connect(self.search)
+        self.sort_picker.currentTextChanged.connect(self.search)
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(self.search_input, stretch=4)
+        filter_layout.addWidget(self.model_picker, stretch=2)
+        filter_layout.addWidget(self.range_picker, stretch=1)
+        filter_layout.addWidget(self.sort_picker, stretch=1)
+        filter_layout.addWidget(self.search_button)
+        page_layout = QHBoxLayout()
+        page_layout.addWidget(self.previous_button)
+        page_layout.addWidget(self.page_label)
+        page_layout.addWidget(self.next_button)
+        page_layout.addStretch(1)
+        page_layout.addWidget(self.load_button)
+
+        main_layout = QVBoxLayout()
+        main_layout.addLayout(filter_layout)
+        main_layout.addWidget(self.results_list)
+        main_layout.addLayout(page_layout)
+        self.setLayout(main_layout)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh_models()
+        self.run_query()
+
+    def refresh_models(self):
+        current = self.model_picker.currentText()
+        self.model_picker.blockSignals(True)
+        self.model_picker.clear()
+        self.model_picker.addItem("All Models")
+        self.model_picker.addItems(HISTORY.models())
+        index = self.model_picker.findText(current)
+        self.model_picker.setCurrentIndex(max(index, 0))
+        self.model_picker.blockSignals(False)
+
+    def search(self):
+        self.page = 0
+        self.run_query()
+
+    def previous_page(self):
+        if self.page > 0:
+            self.page -= 1
+            self.run_query()
+
+    def next_page(self):
+        if self.results_list.count() == HISTORY_PAGE_SIZE:
+            self.page += 1
+            self.run_query()
+
+    def run_query(self):
+        """Fetches the current page of history matching the filters and lists it"""
+        model_name = self.model_picker.currentText()
+        days = HISTORY_RANGES[self.range_picker.currentText()]
+        since = None
+        if days is not None:
+            midnight = datetime.datetime.combine(datetime.date.today(), datetime.time())
+            since = (midnight - datetime.timedelta(days=days)).timestamp()
+        rows = HISTORY.search(self.search_input.text(),
+                              model_name=None if model_name == "All Models" else model_name,
+                              since=since,
+                              sort=self.sort_picker.currentText(),
+                              limit=HISTORY_PAGE_SIZE,
+                              offset=self.page * HISTORY_PAGE_SIZE)
+        self.results_list.clear()
+        for row in rows:
+            created = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["created"]))
+            prompt = row["enhanced_prompt"] or row["prompt"] or ""
+            text = (f"{created} | {row['request_type']} | {row['model_name']} | {row['width']}x{row['height']} | "
+                    f"{row['output_count']} outputs | {row['elapsed'] or 0:.1f}s\n{prompt}")
+            item = QListWidgetItem(text)
+            item.setData(Qt.UserRole, row["id"])
+            item.setToolTip(prompt)
+            self.results_list.addItem(item)
+        self.page_label.setText(f"Page {self.page + 1}")
+        self.previous_button.setEnabled(self.page > 0)
+        self.next_button.setEnabled(len(rows) == HISTORY_PAGE_SIZE)
+
+    @asyncSlot()
+    async def load_selected(self, *args):
+        """Adds the outputs of the selected generations back into the gallery, only their thumbnails are kept in
+        memory"""
+        loop = asyncio.get_running_loop()
+        for item in self.results_list.selectedItems():
+            generation_id = item.data(Qt.UserRole)
+            for output in HISTORY.outputs(generation_id):
+                if output["kind"] == "image":
+                    stored = await loop.run_in_executor(IMAGE_WORKERS, GALLERY_STORE.load_image, output["path"])
+                    if stored is None:
+                        print(f"History image {output['path']} is missing")
+                        continue
+                    key, thumbnail, original_size = stored
+                    gallery_item = ClickablePixmap(QPixmap.fromImage(thumbnail), self.gallery.gallery, self.tabs,
+                                                   image_key=key, original_size=original_size)
+                elif output["kind"] == "video":
+                    if not os.path.exists(output["path"]):
+                        print(f"History video {output['path']} is missing")
+                        continue
+                    gallery_item = ClickableVideo(output["path"], item.toolTip())
+                else:
+                    continue
+                self.gallery.gallery.add_item(gallery_item)
+        self.gallery.update()
@@ -10,7 +10,6 @@ from modules.queue import QueueTab
 from modules.request_helpers import BaseVideoRequest, QueueObjectWidget
 from modules.ui_widgets import (ImageGallery, ModelPickerWidget, ParagraphInputBox, ResolutionInput, QueueViewer,
                                 SingleLineInputBox, VerticalTabWidget)
-from modules.utils import get_enhanced_prompt
 
 
 class HunyuanVideoTab(QWidget):
@@ -126,9 +125,7 @@ class HunyuanVideoRequest(BaseVideoRequest):
     @asyncSlot()
     async def generate(self):
         print(f"HUNYUAN_VIDEO: {self.prompt}, {self.frames}")
-        if self.enhance_prompt:
-            llm_prompt = await get_enhanced_prompt(self.avernus_client, self.prompt, "Rewrite and enhance the original editing instruction with richer detail, clearer structure, and improved descriptive quality. When adding text that should appear inside an image, place that text inside double quotes and in capital letters. Explain what needs to be changed and what needs to be left unchanged. Explain in details how to change  camera position or tell that camera position shouldn't be changed. example: Original text: add text 911 and 'Police' Result: Add the word '911' in large blue letters to the hood. Below that, add the word 'POLICE.' Keep the camera position unchanged, as do the background, car position, and lighting. Answer only with expanded prompt. Rewrite Prompt: ")
-            self.enhanced_prompt = llm_prompt
+        await self.prepare()
         kwargs = {}
         kwargs["prompt"] = self.enhanced_prompt
         if self.negative_prompt != "": kwargs["negative_prompt"] = str(self.negative_prompt)
@@ -140,10 +137,10 @@ class HunyuanVideoRequest(BaseVideoRequest):
         if self.seed != "": kwargs["seed"] = int(self.seed)
         if self.model_name != "" or None: kwargs["model_name"] = str(self.model_name)
         try:
-            response = await self.avernus_client.hunyuan_ti2v(**kwargs)
+            response = await self.avernus_client.hunyuan_ti2v(on_progress=self.show_download_progress, **kwargs)
             if response["status"] == True or response["status"] == "True":
                 self.status = "Finished"
-                await self.display_video(response["video"])
+                await self.display_video(response["video_path"])
             else:
                 self.status = "Failed"
         except Exception as e:
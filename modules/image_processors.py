@@ -10,7 +10,7 @@ from modules.gallery import GalleryTab
 from modules.queue import QueueTab
 from modules.request_helpers import BaseImageRequest, QueueObjectWidget
 from modules.ui_widgets import (ImageGallery, ImageInputBox, QueueViewer, SingleLineInputBox, VerticalTabWidget)
-from modules.utils import base64_to_images, image_to_base64
+from modules.utils import encode_image
 
 
 class ImageProcessorTab(QWidget):
@@ -151,14 +151,11 @@ class RealESRGANRequest(BaseImageRequest):
 
     async def generate(self):
         print("RealESRGAN:")
-        base64_input = image_to_base64(self.image, self.image.width(), self.image.height())
+        base64_input = await encode_image(self.image, self.image.width(), self.image.height())
         try:
-            response = await self.avernus_client.realesrgan(image=base64_input, scale=self.scale)
+            response = await self.avernus_client.realesrgan(image=base64_input, scale=self.scale, on_image=self.display_image)
             if response["status"] == "True" or response["status"] == True:
                 self.status = "Finished"
-                base64_images = response["images"]
-                images = await base64_to_images(base64_images)
-                await self.display_images(images)
             else:
                 self.status = "Failed"
         except Exception as e:
@@ -180,14 +177,11 @@ class Swin2SRRequest(BaseImageRequest):
 
     async def generate(self):
         print("Swin2SR:")
-        base64_input = image_to_base64(self.image, self.image.width(), self.image.height())
+        base64_input = await encode_image(self.image, self.image.width(), self.image.height())
         try:
-            response = await self.avernus_client.swin2sr(image=base64_input)
+            response = await self.avernus_client.swin2sr(image=base64_input, on_image=self.display_image)
             if response["status"] == "True" or response["status"] == True:
                 self.status = "Finished"
-                base64_images = response["images"]
-                images = await base64_to_images(base64_images)
-                await self.display_images(images)
             else:
                 self.status = "Failed"
         except Exception as e:
@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+LIST_TTL = 30.0
+
+
+class ListCatalog:
+    """Shared cache of the servers model, LoRA, scheduler and controlnet lists.
+
+    Tabs subscribe to the list endpoints they show. A refresh fetches each distinct endpoint once no matter how many
+    tabs want it, all in parallel, and only pushes a list to its subscribers when it has changed. Lists fetched within
+    ttl seconds are served as they are, older ones are revalidated with the ETag the server gave them."""
+    def __init__(self, ttl=LIST_TTL):
+        self.ttl = ttl
+        self.subscribers = {}
+        self.entries = {}
+        self.pending = {}
+        self.base_url = None
+
+    def subscribe(self, endpoint, callback):
+        """Calls callback with the endpoints response now if it is cached and again whenever it changes"""
+        self.subscribers.setdefault(endpoint, []).append(callback)
+        if endpoint in self.entries:
+            self.push(endpoint, self.entries[endpoint]["result"])
+
+    def invalidate(self):
+        self.entries.clear()
+
+    async def refresh(self, avernus_client, force=False):
+        """Brings every subscribed list up to date with the server"""
+        if avernus_client.base_url != self.base_url:
+            self.invalidate()
+            self.base_url = avernus_client.base_url
+        now = time.monotonic()
+        tasks = []
+        for endpoint in self.subscribers:
+            entry = self.entries.get(endpoint)
+            if not force and entry is not None and now - entry["fetched"] < self.ttl:
+                continue
+            key = (self.base_url, endpoint)
+            if key not in self.pending:
+                self.pending[key] = asyncio.ensure_future(self.fetch(avernus_client, endpoint, key))
+            tasks.append(self.pending[key])
+        await asyncio.gather(*tasks)
+
+    async def fetch(self, avernus_client, endpoint, key):
+        try:
+            base_url = self.base_url
+            entry = self.entries.get(endpoint)
+            result, etag = await avernus_client.fetch_list(endpoint, entry["etag"] if entry else None)
+            if base_url != self.base_url:
+                return
+            entry = self.entries.get(endpoint)
+            if result is None and entry is None:
+                return
+            if result is None or (entry is not None and result == entry["result"]):
+                entry["etag"] = etag
+                entry["fetched"] = time.monotonic()
+                return
+            if "ERROR" in result:
+                self.entries.pop(endpoint, None)
+            else:
+                self.entries[endpoint] = {"result": result, "etag": etag, "fetched": time.monotonic()}
+            self.push(endpoint, result)
+        finally:
+            self.pending.pop(key, None)
+
+    def push(self, endpoint, result):
+        for callback in self.subscribers.get(endpoint, []):
+            try:
+                callback(result)
+            except Exception as e:
+                print(f"Failed to update {endpoint} list: {e}")
+
+
+LIST_CATALOG = ListCatalog()
@@ -1,3 +1,4 @@
+import asyncio
 from typing import cast
 
 from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QTextEdit, QPushButton
@@ -69,10 +70,6 @@ class LlmTab(QWidget):
         self.tabs.parent().pending_requests.append(request)
         self.tabs.parent().request_event.set()
 
-    async def add_history(self, role, content, hex_color="#444444"):
-        """Adds each message to the history."""
-        self.history_viewer.add_message(role=role, message=content, hex_color=hex_color)
-
 
 class LLMRequest(BaseTextRequest):
     def __init__(self,
@@ -90,24 +87,25 @@ class LLMRequest(BaseTextRequest):
         if self.model_name == "":
             self.model_name = "Goekdeniz-Guelmez/Josiefied-Qwen2.5-14B-Instruct-abliterated-v4"
         print(f"LLM: {self.prompt}, {self.model_name}")
+        gen_history = self.tab.history_viewer.get_history()
+        self.tab.history_viewer.add_message("user", self.prompt, "#303040")
+        assistant_message = self.tab.history_viewer.add_message("assistant", "", "#303050")
         try:
-            if self.tab.history_viewer.get_history() is None:
-                response = await self.avernus_client.llm_chat(self.prompt, model_name=self.model_name)
-            else:
-                gen_history = self.tab.history_viewer.get_history()
-                response = await self.avernus_client.llm_chat(self.prompt, messages=gen_history, model_name=self.model_name)
-            if response["status"] == True or response["status"] == "True":
-                self.status = "Finished"
-                if isinstance(response["response"], str):
-                    await self.tab.add_history("user", self.prompt, "#303040")
-                    await self.tab.add_history("assistant", response["response"], "#303050")
-                    self.tab.text_input.clear()
-                    self.tab.submit_button.setDisabled(False)
-            else:
-                self.status = "Failed"
+            async for text in self.avernus_client.llm_chat_stream(self.prompt, messages=gen_history,
+                                                                  model_name=self.model_name):
+                assistant_message.append_text(text)
+            assistant_message.flush_text()
+            self.status = "Finished"
+            self.tab.text_input.clear()
+        except asyncio.CancelledError:
+            self.tab.history_viewer.handle_remove_request(assistant_message)
+            raise
         except Exception as e:
             self.status = "Failed"
+            self.tab.history_viewer.handle_remove_request(assistant_message)
             print(f"LLM CHAT EXCEPTION: {e}")
+        finally:
+            self.tab.submit_button.setDisabled(False)
 
 
 class LLMRerollRequest(LLMRequest):
@@ -119,26 +117,3 @@ class LLMRerollRequest(LLMRequest):
                  history: list):
         super().__init__(avernus_client, tab, input_text, model_name)
         self.history = history
-
-    async def generate(self):
-        if self.model_name == "":
-            self.model_name = "Goekdeniz-Guelmez/Josiefied-Qwen2.5-14B-Instruct-abliterated-v4"
-        print(f"LLM: {self.prompt}, {self.model_name}")
-        try:
-            if self.tab.history_viewer.get_history() is None:
-                response = await self.avernus_client.llm_chat(self.prompt, model_name=self.model_name)
-            else:
-                gen_history = self.tab.history_viewer.get_history()
-                response = await self.avernus_client.llm_chat(self.prompt, messages=gen_history, model_name=self.model_name)
-            if response["status"] == True or response["status"] == "True":
-                self.status = "Finished"
-                if isinstance(response["response"], str):
-                    await self.tab.add_history("user", self.prompt, "#303040")
-                    await self.tab.add_history("assistant", response["response"], "#303050")
-                    self.tab.text_input.clear()
-                    self.tab.submit_button.setDisabled(False)
-            else:
-                self.status = "Failed"
-        except Exception as e:
-            self.status = "Failed"
-            print(f"LLM CHAT EXCEPTION: {e}")
\ No newline at end of file
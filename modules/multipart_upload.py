@@ -0,0 +1,71 @@
+import mimetypes
+import os
+import uuid
+
+import aiofiles
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class MultipartUpload:
+    """A multipart/form-data request body that streams its files from disk a chunk at a time.
+
+    Pass it to httpx as content=upload with headers=upload.headers. The body length is known up front, so it is
+    sent with a Content-Length instead of chunked encoding, and on_progress is called with the bytes sent so far
+    and the total as the files are read."""
+    def __init__(self, data: dict | None = None, files: dict | None = None, on_progress=None,
+                 chunk_size: int = UPLOAD_CHUNK_SIZE):
+        """data maps field names to values, files maps field names to a path or a (path, content type) tuple"""
+        self.boundary = uuid.uuid4().hex
+        self.on_progress = on_progress
+        self.chunk_size = chunk_size
+        self.parts = []
+        for name, value in (data or {}).items():
+            header = self.part_header(name)
+            self.parts.append((header + str(value).encode() + b"\r\n", None, 0))
+        for name, file in (files or {}).items():
+            path, content_type = file if isinstance(file, tuple) else (file, None)
+            if content_type is None:
+                content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            header = self.part_header(name, os.path.basename(path), content_type)
+            self.parts.append((header, path, os.path.getsize(path)))
+        self.closing = f"--{self.boundary}--\r\n".encode()
+        self.total = sum(len(header) + size + (2 if path else 0) for header, path, size in self.parts)
+        self.total += len(self.closing)
+
+    @property
+    def headers(self):
+        return {"Content-Type": f"multipart/form-data; boundary={self.boundary}",
+                "Content-Length": str(self.total)}
+
+    def part_header(self, name, filename=None, content_type=None):
+        disposition = f'form-data; name="{quote(name)}"'
+        if filename is not None:
+            disposition += f'; filename="{quote(filename)}"'
+        header = f"--{self.boundary}\r\nContent-Disposition: {disposition}\r\n"
+        if content_type is not None:
+            header += f"Content-Type: {content_type}\r\n"
+        return (header + "\r\n").encode()
+
+    async def __aiter__(self):
+        sent = 0
+        for header, path, size in self.parts:
+            yield header
+            sent += len(header)
+            if path is None:
+                continue
+            async with aiofiles.open(path, "rb") as f:
+                while chunk := await f.read(self.chunk_size):
+                    sent += len(chunk)
+                    if self.on_progress is not None:
+                        self.on_progress(sent, self.total)
+                    yield chunk
+            yield b"\r\n"
+            sent += 2
+        yield self.closing
+        if self.on_progress is not None:
+            self.on_progress(self.total, self.total)
+
+
+def quote(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\r", "").replace("\n", "")
@@ -0,0 +1,101 @@
+import asyncio
+import base64
+import time
+
+from PySide6.QtGui import QImage, QPixmap
+
+from modules.utils import IMAGE_WORKERS
+
+PROGRESS_INTERVAL = 0.25
+PREVIEW_INTERVAL = 1.0
+
+
+class ProgressMonitor:
+    """Follows the servers progress stream while a request runs, showing steps and an ETA on its queue item and the
+    latest latent preview as a tile in the gallery. Updates are throttled so a chatty server can't flood the UI.
+
+    The progress stream covers the whole server and carries no job id, so steps and previews are only shown while
+    this request is the only job running on its endpoint. Otherwise the queue item gets an indeterminate bar."""
+    def __init__(self, queue_request):
+        self.queue_request = queue_request
+        self.task: asyncio.Task | None = None
+        self.preview_task: asyncio.Task | None = None
+        self.last_update = 0.0
+        self.last_preview = 0.0
+        self.first_step = None
+        self.first_step_time = None
+        self.shared = False
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.follow())
+
+    async def stop(self):
+        for task in (self.task, self.preview_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        gallery = getattr(self.queue_request, "gallery", None)
+        if gallery is not None:
+            gallery.gallery.hide_preview(self)
+        self.queue_request.ui_item.clear_progress()
+
+    async def follow(self):
+        try:
+            async for event in self.queue_request.avernus_client.progress_events():
+                self.handle_event(event)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Progress stream unavailable: {e}")
+
+    def is_only_job(self):
+        endpoint = getattr(self.queue_request, "endpoint", None)
+        return endpoint is None or endpoint.active <= 1
+
+    def handle_event(self, event):
+        if not self.is_only_job():
+            if not self.shared:
+                self.shared = True
+                self.first_step = None
+                gallery = getattr(self.queue_request, "gallery", None)
+                if gallery is not None:
+                    gallery.gallery.hide_preview(self)
+                self.queue_request.ui_item.set_busy()
+            return
+        self.shared = False
+        now = time.monotonic()
+        step = event.get("step")
+        total = event.get("total_steps")
+        if step is not None and total:
+            if self.first_step is None:
+                self.first_step = step
+                self.first_step_time = now
+            if now - self.last_update >= PROGRESS_INTERVAL or step >= total:
+                self.last_update = now
+                eta = None
+                if step > self.first_step:
+                    eta = (total - step) * (now - self.first_step_time) / (step - self.first_step)
+                self.queue_request.ui_item.set_progress(step, total, eta)
+
+        preview = event.get("preview")
+        gallery = getattr(self.queue_request, "gallery", None)
+        if preview and gallery is not None and now - self.last_preview >= PREVIEW_INTERVAL:
+            if self.preview_task is None or self.preview_task.done():
+                self.last_preview = now
+                self.preview_task = asyncio.ensure_future(self.show_preview(preview))
+
+    async def show_preview(self, preview):
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(IMAGE_WORKERS, decode_preview, preview)
+        if image.isNull():
+            return
+        self.queue_request.gallery.gallery.show_preview(self, QPixmap.fromImage(image))
+
+
+def decode_preview(preview):
+    image = QImage()
+    image.loadFromData(base64.b64decode(preview))
+    return image
@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+
+from PySide6.QtGui import QImage, QPixmap
+
+from modules.request_queue import request_params
+from modules.utils import IMAGE_WORKERS
+
+QUEUE_JOURNAL_PATH = "cache/queue.sqlite3"
+QUEUE_INPUTS_DIR = "cache/inputs"
+QUEUE_INPUT_KEYS_CACHED = 64
+
+
+class QueueJournal:
+    """Durable sqlite journal of queued requests so a restart or crash doesn't lose them.
+
+    A request is written when it is queued, updated when it changes lane or position and deleted once it finishes, is
+    cancelled or is removed. Requests are stored as their constructor arguments, with any input images written once
+    to a content addressed folder so a batch reusing the same image only stores it once. Hashing and writing those
+    images happens on the image workers, so a new request is only journaled once its inputs are on disk."""
+    def __init__(self, path=QUEUE_JOURNAL_PATH, inputs_path=QUEUE_INPUTS_DIR,
+                 input_keys_cached=QUEUE_INPUT_KEYS_CACHED):
+        self.path = path
+        self.inputs_path = inputs_path
+        self.connection = None
+        self.input_keys = OrderedDict()
+        self.input_keys_cached = input_keys_cached
+
+    def connect(self):
+        if self.connection is not None:
+            return self.connection
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                created REAL NOT NULL,
+                module TEXT NOT NULL,
+                request_type TEXT NOT NULL,
+                lane TEXT NOT NULL,
+                position REAL NOT NULL,
+                params TEXT NOT NULL);
+        """)
+        self.connection.commit()
+        return self.connection
+
+    def save(self, queue_request, lane, position):
+        """Journals a newly queued request, or updates the lane and position of one already journaled"""
+        if not getattr(queue_request, "persistent", False):
+            return
+        journal_id = getattr(queue_request, "journal_id", None)
+        if journal_id is None:
+            queue_request.journal_position = (lane, position)
+            if getattr(queue_request, "journal_task", None) is None:
+                queue_request.journal_task = asyncio.ensure_future(self.insert(queue_request))
+            return
+        try:
+            with self.connect() as connection:
+                connection.execute("UPDATE jobs SET lane = ?, position = ? WHERE id = ?", (lane, position, journal_id))
+        except sqlite3.Error as e:
+            print(f"Failed to journal {type(queue_request).__name__}: {e}")
+
+    async def insert(self, queue_request):
+        """Stores a new requests input images and then writes its row at whatever lane and position it has by then"""
+        try:
+            params = json.dumps(await self.encode_params(queue_request))
+            lane, position = queue_request.journal_position
+            with self.connect() as connection:
+                cursor = connection.execute(
+                    "INSERT INTO jobs (created, module, request_type, lane, position, params) VALUES (?, ?, ?, ?, ?, ?)",
+                    (time.time(), type(queue_request).__module__, type(queue_request).__name__, lane, position,
+                     params))
+            queue_request.journal_id = cursor.lastrowid
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Failed to journal {type(queue_request).__name__}: {e}")
+        finally:
+            queue_request.journal_task = None
+
+    def remove(self, queue_request):
+        journal_task = getattr(queue_request, "journal_task", None)
+        if journal_task is not None:
+            journal_task.cancel()
+            queue_request.journal_task = None
+        journal_id = getattr(queue_request, "journal_id", None)
+        if journal_id is None:
+            return
+        try:
+            with self.connect() as connection:
+                connection.execute("DELETE FROM jobs WHERE id = ?", (journal_id,))
+            queue_request.journal_id = None
+        except sqlite3.Error as e:
+            print(f"Failed to remove {type(queue_request).__name__} from the queue journal: {e}")
+
+    def restore(self, avernus_client, gallery, tabs):
+        """Rebuilds the journaled requests in queue order, returning a list of (request, lane)"""
+        restored = []
+        try:
+            rows = self.connect().execute("SELECT * FROM jobs ORDER BY position, id").fetchall()
+        except sqlite3.Error as e:
+            print(f"Failed to read the queue journal: {e}")
+            return restored
+        context = {"avernus_client": avernus_client, "gallery": gallery, "tabs": tabs, "tab": tabs}
+        for row in rows:
+            try:
+                request_class = getattr(importlib.import_module(row["module"]), row["request_type"])
+                params = self.decode_value(json.loads(row["params"]))
+                parameters = inspect.signature(request_class.__init__).parameters
+                kwargs = {name: context[name] for name in parameters if name in context}
+                queue_request = request_class(**kwargs, **params)
+                queue_request.journal_id = row["id"]
+                restored.append((queue_request, row["lane"]))
+            except Exception as e:
+                print(f"Failed to restore queued {row['request_type']}, dropping it: {e}")
+                with self.connect() as connection:
+                    connection.execute("DELETE FROM jobs WHERE id = ?", (row["id"],))
+        self.prune_inputs(rows)
+        return restored
+
+    async def encode_params(self, queue_request):
+        """Returns the requests constructor arguments as JSON safe values"""
+        return {name: await self.encode_value(value) for name, value in request_params(queue_request).items()}
+
+    async def encode_value(self, value):
+        if isinstance(value, (QPixmap, QImage)):
+            key = await self.store_input(value)
+            return None if key is None else {"__image__": key}
+        if isinstance(value, (list, tuple)):
+            return [await self.encode_value(item) for item in value]
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        raise TypeError(f"can't journal a {type(value).__name__}")
+
+    def decode_value(self, value):
+        if isinstance(value, dict) and "__image__" in value:
+            return QPixmap(self.input_path_for(value["__image__"]))
+        if isinstance(value, dict):
+            return {name: self.decode_value(item) for name, item in value.items()}
+        if isinstance(value, list):
+            return [self.decode_value(item) for item in value]
+        return value
+
+    def input_path_for(self, key):
+        return os.path.join(self.inputs_path, key[:2], f"{key}.png")
+
+    async def store_input(self, image):
+        """Writes an input image to disk on the image workers and returns its key.
+        The last input_keys_cached images are remembered by their Qt cache key, so the requests of a batch or sweep
+        sharing one image only hash and write it once"""
+        if image.isNull():
+            return None
+        cache_key = image.cacheKey()
+        future = self.input_keys.get(cache_key)
+        if future is None:
+            if isinstance(image, QPixmap):
+                image = image.toImage()
+            future = asyncio.ensure_future(asyncio.get_running_loop().run_in_executor(IMAGE_WORKERS, self.write_input,
+                                                                                      image))
+            self.input_keys[cache_key] = future
+            while len(self.input_keys) > self.input_keys_cached:
+                self.input_keys.popitem(last=False)
+        else:
+            self.input_keys.move_to_end(cache_key)
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            self.input_keys.pop(cache_key, None)
+            raise
+
+    def write_input(self, image):
+        """Writes an image to the content addressed inputs folder keyed on its pixels, skipping the PNG encode if it
+        is already stored"""
+        digest = hashlib.sha256(f"{image.width()}x{image.height()}:{image.format()}".encode())
+        digest.update(image.constBits())
+        key = digest.hexdigest()
+        path = self.input_path_for(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.tmp.png"
+            if not image.save(temp_path, "PNG"):
+                raise OSError(f"failed to write {path}")
+            os.replace(temp_path, path)
+        return key
+
+    def prune_inputs(self, rows):
+        """Deletes stored input images that no journaled request refers to any more"""
+        referenced = set()
+        for row in rows:
+            collect_keys(json.loads(row["params"]), referenced)
+        for folder, _, files in os.walk(self.inputs_path):
+            for file in files:
+                if os.path.splitext(file)[0] not in referenced:
+                    try:
+                        os.remove(os.path.join(folder, file))
+                    except OSError as e:
+                        print(f"Failed to remove unused queue input {file}: {e}")
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def collect_keys(value, keys):
+    if isinstance(value, dict):
+        if "__image__" in value:
+            keys.add(value["__image__"])
+        else:
+            for item in value.values():
+                collect_keys(item, keys)
+    elif isinstance(value, list):
+        for item in value:
+            collect_keys(item, keys)
+
+
+QUEUE_JOURNAL = QueueJournal()
@@ -10,7 +10,7 @@ from modules.queue import QueueTab
 from modules.request_helpers import BaseImageRequest, QueueObjectWidget
 from modules.ui_widgets import (HorizontalSlider, ImageGallery, ImageInputBox, ParagraphInputBox, QueueViewer,
                                 ResolutionInput, SingleLineInputBox, VerticalTabWidget)
-from modules.utils import base64_to_images, image_to_base64, get_generic_danbooru_tags, get_random_artist_prompt, get_enhanced_prompt
+from modules.utils import encode_image
 
 
 class QwenEditPlusTab(QWidget):
@@ -154,11 +154,9 @@ class QwenEditPlusTab(QWidget):
         except Exception as e:
             print(f"QWEN on_submit EXCEPTION: {e}")
 
-    @asyncSlot()
-    async def make_lora_list(self):
+    def set_lora_list(self, response):
         self.lora_list.clear()
         try:
-            response = await self.avernus_client.list_qwen_image_loras()
             if response["status"] is True:
                 if len(response["loras"]) == 0:
                     self.lora_list.insertItems(0, ["NONE"])
@@ -237,29 +235,18 @@ class QwenEditPlusRequest(BaseImageRequest):
             kwargs["height"] = 1024
         kwargs["images"] = []
         for image in self.images:
-            bas64_image = image_to_base64(image, kwargs["width"], kwargs["height"])
+            bas64_image = await encode_image(image, kwargs["width"], kwargs["height"])
             kwargs["images"].append(bas64_image)
 
-        if self.enhance_prompt:
-            llm_prompt = await get_enhanced_prompt(self.avernus_client, self.prompt)
-            self.enhanced_prompt = llm_prompt
-        if self.add_artist:
-            random_artist_prompt = get_random_artist_prompt()
-            self.enhanced_prompt = f"{random_artist_prompt}. {self.enhanced_prompt}"
-        if self.add_danbooru_tags:
-            danbooru_tags = get_generic_danbooru_tags("./assets/danbooru.csv", self.danbooru_tags_amount)
-            self.enhanced_prompt = f"{self.enhanced_prompt}, {danbooru_tags}"
+        await self.prepare()
         kwargs["prompt"] = self.enhanced_prompt
         try:
             if self.nunchaku_enabled:
-                response = await self.avernus_client.qwen_image_edit_plus_nunchaku(**kwargs)
+                response = await self.avernus_client.qwen_image_edit_plus_nunchaku(on_image=self.display_image, **kwargs)
             else:
-                response = await self.avernus_client.qwen_image_edit_plus(**kwargs)
+                response = await self.avernus_client.qwen_image_edit_plus(on_image=self.display_image, **kwargs)
             if response["status"] == "True" or response["status"] == True:
                 self.status = "Finished"
-                base64_images = response["images"]
-                images = await base64_to_images(base64_images)
-                await self.display_images(images)
             else:
                 self.status = "Failed"
         except Exception as e:
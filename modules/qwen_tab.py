@@ -11,8 +11,7 @@ from modules.queue import QueueTab
 from modules.request_helpers import BaseImageRequest, QueueObjectWidget
 from modules.ui_widgets import (HorizontalSlider, ImageGallery, ImageInputBox, ParagraphInputBox, QueueViewer,
                                 ResolutionInput, SingleLineInputBox, VerticalTabWidget)
-from modules.utils import (base64_to_images, image_to_base64, get_random_artist_prompt, get_generic_danbooru_tags,
-                           get_enhanced_prompt)
+from modules.utils import encode_image
 
 class QwenTab(QWidget):
     def __init__(self, avernus_client: AvernusClient, tabs: VerticalTabWidget):
@@ -210,11 +209,9 @@ class QwenTab(QWidget):
         except Exception as e:
             print(f"QWEN on_submit EXCEPTION: {e}")
 
-    @asyncSlot()
-    async def make_lora_list(self):
+    def set_lora_list(self, response):
         self.lora_list.clear()
         try:
-            response = await self.avernus_client.list_qwen_image_loras()
             if response["status"] is True:
                 if len(response["loras"]) == 0:
                     self.lora_list.insertItems(0, ["NONE"])
@@ -243,6 +240,8 @@ class QwenTab(QWidget):
 
 
 class QwenRequest(BaseImageRequest):
+    prefetch_images = (("i2i_image", "i2i_image_enabled", "image"),)
+
     def __init__(self,
                  avernus_client: AvernusClient,
                  gallery: ImageGallery,
@@ -311,43 +310,32 @@ class QwenRequest(BaseImageRequest):
         if self.height is not None: kwargs["height"] = int(self.height)
 
         if self.i2i_image_enabled:
-            image = image_to_base64(self.i2i_image, kwargs["width"], kwargs["height"])
+            image = await encode_image(self.i2i_image, kwargs["width"], kwargs["height"])
             kwargs["image"] = str(image)
             kwargs["strength"] = float(self.strength)
         if self.edit_enabled:
             edit_width = int(self.edit_image.width())
             edit_height = int(self.edit_image.height())
-            edit_image = image_to_base64(self.edit_image, edit_width, edit_height)
+            edit_image = await encode_image(self.edit_image, edit_width, edit_height)
             kwargs["image"] = str(edit_image)
             kwargs["width"] = None
             kwargs["height"] = None
 
-        if self.enhance_prompt:
-            llm_prompt = await get_enhanced_prompt(self.avernus_client, self.prompt)
-            self.enhanced_prompt = llm_prompt
-        if self.add_artist:
-            random_artist_prompt = get_random_artist_prompt()
-            self.enhanced_prompt = f"{random_artist_prompt}. {self.enhanced_prompt}"
-        if self.add_danbooru_tags:
-            danbooru_tags = get_generic_danbooru_tags("./assets/danbooru.csv", self.danbooru_tags_amount)
-            self.enhanced_prompt = f"{self.enhanced_prompt}, {danbooru_tags}"
+        await self.prepare()
         kwargs["prompt"] = self.enhanced_prompt
         try:
             if self.edit_enabled:
                 if self.nunchaku_enabled:
-                    response = await self.avernus_client.qwen_image_edit_nunchaku(**kwargs)
+                    response = await self.avernus_client.qwen_image_edit_nunchaku(on_image=self.display_image, **kwargs)
                 else:
-                    response = await self.avernus_client.qwen_image_edit(**kwargs)
+                    response = await self.avernus_client.qwen_image_edit(on_image=self.display_image, **kwargs)
             else:
                 if self.nunchaku_enabled:
-                    response = await self.avernus_client.qwen_image_nunchaku_image(**kwargs)
+                    response = await self.avernus_client.qwen_image_nunchaku_image(on_image=self.display_image, **kwargs)
                 else:
-                    response = await self.avernus_client.qwen_image_image(**kwargs)
+                    response = await self.avernus_client.qwen_image_image(on_image=self.display_image, **kwargs)
             if response["status"] == "True" or response["status"] == True:
                 self.status = "Finished"
-                base64_images = response["images"]
-                images = await base64_to_images(base64_images)
-                await self.display_images(images)
             else:
                 self.status = "Failed"
         except Exception as e:
@@ -1,4 +1,5 @@
 import asyncio
+import base64
 import os
 import shutil
 import tempfile
@@ -7,20 +8,91 @@ import time
 from pydub import AudioSegment
 from PySide6.QtWidgets import (QApplication, QHBoxLayout, QVBoxLayout, QPushButton, QGraphicsPixmapItem, QLabel, QMenu,
                                QFileDialog, QSlider, QWidget, QFrame, QSizePolicy, QGraphicsProxyWidget, QPlainTextEdit,
-                               QStyle, QGraphicsWidget)
-from PySide6.QtGui import (QPixmap, QIcon)
+                               QStyle, QGraphicsWidget, QProgressBar)
+from PySide6.QtGui import (QPixmap, QIcon, QDrag)
 from PySide6.QtCore import Qt, QSize, QSizeF, QUrl, QMimeData, QRectF
 from PySide6.QtMultimedia import QMediaPlayer, QAudioOutput
 from PySide6.QtMultimediaWidgets import QGraphicsVideoItem
 from qasync import asyncSlot
 
 from modules.avernus_client import AvernusClient
-from modules.ui_widgets import ImageGallery, SelectableMessageBox, show_context_menu, VerticalTabWidget
+from modules.ui_widgets import (ImageGallery, SelectableMessageBox, show_context_menu, VerticalTabWidget,
+                                QUEUE_ITEM_MIME)
+from modules.gallery_store import GALLERY_STORE
+from modules.history import HISTORY
+from modules.progress import ProgressMonitor
+from modules.request_queue import QUEUE_LANES
+from modules.utils import (IMAGE_WORKERS, encode_image, get_enhanced_prompt, get_generic_danbooru_tags,
+                           get_random_artist_prompt)
+
+THUMBNAIL_WIDTHS_CACHED = 3
+VIDEO_ENHANCE_INSTRUCTIONS = "Rewrite and enhance the original editing instruction with richer detail, clearer structure, and improved descriptive quality. When adding text that should appear inside an image, place that text inside double quotes and in capital letters. Explain what needs to be changed and what needs to be left unchanged. Explain in details how to change  camera position or tell that camera position shouldn't be changed. example: Original text: add text 911 and 'Police' Result: Add the word '911' in large blue letters to the hood. Below that, add the word 'POLICE.' Keep the camera position unchanged, as do the background, car position, and lighting. Answer only with expanded prompt. Rewrite Prompt: "
+
+
+
+def store_base64_image(base64_image):
+    """Decodes a base64 image and writes it to the gallery store without going through an intermediate BytesIO"""
+    return GALLERY_STORE.store_image(base64.b64decode(base64_image))
+
+
+async def enhance_request(queue_request):
+    """Builds a requests final prompt, running the LLM enhancement and random artist and danbooru additions in the
+    same order generate used to"""
+    queue_request.enhanced_prompt = queue_request.prompt
+    if getattr(queue_request, "enhance_prompt", False):
+        queue_request.enhanced_prompt = await get_enhanced_prompt(queue_request.avernus_client, queue_request.prompt,
+                                                                  queue_request.enhance_instructions,
+                                                                  reroll=queue_request.reroll_enhancement)
+    if getattr(queue_request, "add_artist", False):
+        queue_request.enhanced_prompt = f"{get_random_artist_prompt()}. {queue_request.enhanced_prompt}"
+    if getattr(queue_request, "add_danbooru_tags", False):
+        danbooru_tags = get_generic_danbooru_tags("./assets/danbooru.csv", queue_request.danbooru_tags_amount)
+        queue_request.enhanced_prompt = f"{queue_request.enhanced_prompt}, {danbooru_tags}"
+
+
+async def prepare_request(queue_request):
+    """Builds a requests final prompt and encodes its input images so generate finds them ready"""
+    queue_request.start_enhancing()
+    await asyncio.shield(queue_request.enhancement)
+    if not queue_request.prefetch_images:
+        return
+    try:
+        width, height = int(queue_request.width), int(queue_request.height)
+    except (AttributeError, TypeError, ValueError):
+        return  # The size is only worked out inside generate, leave the encoding to it
+    for attribute, enabled, argument in queue_request.prefetch_images:
+        if enabled is not None and not getattr(queue_request, enabled, False):
+            continue
+        try:
+            await encode_image(getattr(queue_request, attribute), width, height, argument)
+        except Exception as e:
+            print(f"Failed to pre-encode {attribute} for {queue_request.__class__.__name__}: {e}")
+
 
+class PreparedRequest:
+    """Shared background preparation for requests with a prompt to enhance and input images to encode.
+    Subclasses set enhancement and preparation to None in __init__"""
+    def start_enhancing(self):
+        """Starts building the final prompt in the background. The dispatcher does this further ahead than
+        start_preparing so enhancements for a batch reach the LLM together"""
+        if self.enhancement is None:
+            self.enhancement = asyncio.ensure_future(enhance_request(self))
 
+    def start_preparing(self):
+        """Starts prepare_request in the background, the dispatcher calls this for the next few queued requests so
+        their preprocessing overlaps with whatever is generating"""
+        if self.preparation is None:
+            self.preparation = asyncio.ensure_future(prepare_request(self))
+
+    async def prepare(self):
+        self.start_preparing()
+        await asyncio.shield(self.preparation)
 
 
 class BaseAudioRequest:
+    queue_lane = "interactive"
+    persistent = True
+
     def __init__(self,
                  avernus_client: AvernusClient,
                  gallery: ImageGallery,
@@ -55,7 +127,6 @@ class BaseAudioRequest:
     async def display_audio(self, response):
         audio_item = self.load_audio_from_bytes(response)
         self.gallery.gallery.add_item(audio_item)
-        self.gallery.gallery.tile_images()
         self.gallery.update()
         await asyncio.sleep(0)  # Let the event loop breathe
         QApplication.processEvents()
@@ -67,7 +138,12 @@ class BaseAudioRequest:
 
         return ClickableAudio(tmp.name, self.prompt, self.lyrics)
 
-class BaseImageRequest:
+class BaseImageRequest(PreparedRequest):
+    queue_lane = "interactive"
+    persistent = True
+    enhance_instructions = None
+    prefetch_images = ()
+
     def __init__(self,
                  avernus_client: AvernusClient,
                  gallery: ImageGallery,
@@ -79,14 +155,25 @@ class BaseImageRequest:
         self.status = None
         self.ui_item: QueueObjectWidget | None = None
         self.queue_info = ""
+        self.outputs = []
+        self.reroll_enhancement = False
+        self.enhancement: asyncio.Future | None = None
+        self.preparation: asyncio.Future | None = None
 
     async def run(self):
         start_time = time.time()
         self.ui_item.status_label.setText("Running")
         self.ui_item.status_container.setStyleSheet(f"color: #ffffff; background-color: #004400;")
-        await self.generate()
+        progress = ProgressMonitor(self)
+        progress.start()
+        try:
+            await self.generate()
+        finally:
+            await progress.stop()
         end_time = time.time()
         elapsed_time = end_time - start_time
+        if self.status == "Finished":
+            HISTORY.record(self, elapsed_time, self.outputs)
         self.ui_item.status_label.setText(f"{self.status}\n{elapsed_time:.2f}s")
         if self.status == "Failed":
             self.ui_item.status_container.setStyleSheet(f"color: #ffffff; background-color: #000000;")
@@ -97,19 +184,27 @@ class BaseImageRequest:
     async def generate(self):
         pass
 
-    @asyncSlot()
-    async def display_images(self, images):
-        for image in images:
-            pixmap = QPixmap()
-            pixmap.loadFromData(image.getvalue())
-            pixmap_item = ClickablePixmap(pixmap, self.gallery.gallery, self.tabs)
-            self.gallery.gallery.add_item(pixmap_item)
-        self.gallery.gallery.tile_images()
+    async def display_image(self, base64_image):
+        """Decodes and stores a single streamed image on a worker thread and adds it to the gallery as soon as it
+        arrives. Only its base thumbnail stays in memory, the full image is loaded from the gallery store on demand"""
+        loop = asyncio.get_running_loop()
+        stored = await loop.run_in_executor(IMAGE_WORKERS, store_base64_image, base64_image)
+        if stored is None:
+            print("Received an image that could not be decoded")
+            return
+        key, thumbnail, original_size = stored
+        self.outputs.append(("image", GALLERY_STORE.path_for(key)))
+        pixmap = QPixmap.fromImage(thumbnail)  # QPixmaps can only be created on the UI thread
+        pixmap_item = ClickablePixmap(pixmap, self.gallery.gallery, self.tabs, image_key=key,
+                                      original_size=original_size)
+        self.gallery.gallery.add_item(pixmap_item)
         self.gallery.update()
-        await asyncio.sleep(0)  # Let the event loop breathe
-        QApplication.processEvents()
+        await asyncio.sleep(0)
 
 class BaseTextRequest:
+    queue_lane = "interactive"
+    persistent = False
+
     def __init__(self,
                  avernus_client: AvernusClient,
                  tab,
@@ -137,7 +232,12 @@ class BaseTextRequest:
         pass
 
 
-class BaseVideoRequest:
+class BaseVideoRequest(PreparedRequest):
+    queue_lane = "interactive"
+    persistent = True
+    enhance_instructions = VIDEO_ENHANCE_INSTRUCTIONS
+    prefetch_images = ()
+
     def __init__(self,
                  avernus_client: AvernusClient,
                  gallery: ImageGallery,
@@ -149,13 +249,24 @@ class BaseVideoRequest:
         self.status = None
         self.ui_item: QueueObjectWidget | None = None
         self.queue_info = None
+        self.outputs = []
+        self.reroll_enhancement = False
+        self.enhancement: asyncio.Future | None = None
+        self.preparation: asyncio.Future | None = None
 
     async def run(self):
         start_time = time.time()
         self.ui_item.status_label.setText("Running")
         self.ui_item.status_container.setStyleSheet(f"color: #ffffff; background-color: #004400;")
-        await self.generate()
+        progress = ProgressMonitor(self)
+        progress.start()
+        try:
+            await self.generate()
+        finally:
+            await progress.stop()
         elapsed_time = time.time() - start_time
+        if self.status == "Finished":
+            HISTORY.record(self, elapsed_time, self.outputs)
         self.ui_item.status_label.setText(f"{self.status}\n{elapsed_time:.2f}s")
         if self.status == "Failed":
             self.ui_item.status_container.setStyleSheet(f"color: #ffffff; background-color: #000000;")
@@ -167,13 +278,10 @@ class BaseVideoRequest:
         pass
 
     @asyncSlot()
-    async def display_video(self, response):
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
-        temp_file.write(response)
-        temp_file.close()
-        video_item = self.load_video_from_file(temp_file.name)
+    async def display_video(self, video_path):
+        self.outputs.append(("video", video_path))
+        video_item = self.load_video_from_file(video_path)
         self.gallery.gallery.add_item(video_item)
-        self.gallery.gallery.tile_images()
         self.gallery.update()
         await asyncio.sleep(0)  # Let the event loop breathe
         QApplication.processEvents()
@@ -181,6 +289,17 @@ class BaseVideoRequest:
     def load_video_from_file(self, video_path):
         return ClickableVideo(video_path, self.prompt)
 
+    def show_upload_progress(self, sent, total):
+        """Shows how much of the source file has been uploaded on the queue item"""
+        self.ui_item.status_label.setText(f"Uploading\n{sent / total:.0%}")
+
+    def show_download_progress(self, received, total):
+        """Shows how much of the generated video has been downloaded on the queue item"""
+        if total:
+            self.ui_item.status_label.setText(f"Downloading\n{received / total:.0%}")
+        else:
+            self.ui_item.status_label.setText(f"Downloading\n{received / (1024 * 1024):.1f}MB")
+
 class ClickableAudio(QGraphicsProxyWidget):
     def __init__(self, audio_path: str, prompt: str, lyrics: str):
         super().__init__()
@@ -363,14 +482,59 @@ class ClickableAudio(QGraphicsProxyWidget):
 
 
 class ClickablePixmap(QGraphicsPixmapItem):
-    def __init__(self, original_pixmap: QPixmap, gallery, tabs):
+    def __init__(self, original_pixmap: QPixmap, gallery, tabs, image_key=None, original_size=None):
+        """When image_key is given the pixmap passed in is only the base thumbnail and the full image lives in
+        GALLERY_STORE"""
         super().__init__(original_pixmap)
         self.tabs = tabs
         self.setAcceptHoverEvents(True)
         self.setAcceptedMouseButtons(Qt.LeftButton | Qt.RightButton)
-        self.original_pixmap = original_pixmap
+        self.image_key = image_key
+        self.base_thumbnail = original_pixmap if image_key is not None else None
+        self._original_pixmap = original_pixmap if image_key is None else None
+        self.original_size = original_size if original_size is not None else original_pixmap.size()
         self.gallery = gallery
         self.view_state = 1
+        self.thumbnails = {}
+        self.shown_width = None
+
+    @property
+    def original_pixmap(self) -> QPixmap:
+        if self.image_key is None:
+            return self._original_pixmap
+        return GALLERY_STORE.pixmap(self.image_key)
+
+    def tile_height(self, width):
+        """Returns the height this image takes up at the given column width without scaling anything"""
+        if self.original_size.width() <= 0:
+            return 0
+        return self.original_size.height() * width / self.original_size.width()
+
+    def thumbnail(self, width: int) -> QPixmap:
+        """Returns the image scaled to the given column width, reusing the last few widths it was scaled to"""
+        thumbnail = self.thumbnails.pop(width, None)
+        if thumbnail is None:
+            if self.base_thumbnail is not None and width <= self.base_thumbnail.width():
+                source = self.base_thumbnail
+            else:
+                source = self.original_pixmap
+            thumbnail = source.scaledToWidth(width, Qt.SmoothTransformation)
+        self.thumbnails[width] = thumbnail
+        while len(self.thumbnails) > THUMBNAIL_WIDTHS_CACHED:
+            self.thumbnails.pop(next(iter(self.thumbnails)))
+        return thumbnail
+
+    def show_thumbnail(self, width: int):
+        if self.shown_width != width:
+            self.setPixmap(self.thumbnail(width))
+            self.shown_width = width
+
+    def hide_thumbnail(self):
+        """Drops the displayed pixmap while the tile is far outside the viewport, its place in the layout is kept"""
+        if self.shown_width is not None or not self.pixmap().isNull():
+            self.setPixmap(QPixmap())
+            self.shown_width = None
+        self.thumbnails.clear()
 
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
@@ -378,8 +542,9 @@ class ClickablePixmap(QGraphicsPixmapItem):
                 width = self.gallery.viewport().width()
                 height = self.gallery.viewport().height()
                 self.gallery.scaled_image_view.clear()
-                scaled_pixmap = self.original_pixmap.scaled(QSize(width, height), Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                scaled_to_fit_pixmap = ClickablePixmap(self.original_pixmap, self.gallery, self.tabs)
+                original_pixmap = self.original_pixmap
+                scaled_pixmap = original_pixmap.scaled(QSize(width, height), Qt.KeepAspectRatio, Qt.SmoothTransformation)
+                scaled_to_fit_pixmap = ClickablePixmap(original_pixmap, self.gallery, self.tabs)
                 scaled_to_fit_pixmap.setPixmap(scaled_pixmap)
                 scaled_to_fit_pixmap.view_state = 2
                 self.gallery.scaled_image_view.addItem(scaled_to_fit_pixmap)
@@ -388,8 +553,9 @@ class ClickablePixmap(QGraphicsPixmapItem):
             elif self.view_state == 2:
                 width = self.gallery.viewport().width()
                 self.gallery.full_image_view.clear()
-                scaled_fullscreen_pixmap = self.original_pixmap.scaledToWidth(width, Qt.SmoothTransformation)
-                fullscreen_pixmap = ClickablePixmap(self.original_pixmap, self.gallery, self.tabs)
+                original_pixmap = self.original_pixmap
+                scaled_fullscreen_pixmap = original_pixmap.scaledToWidth(width, Qt.SmoothTransformation)
+                fullscreen_pixmap = ClickablePixmap(original_pixmap, self.gallery, self.tabs)
                 fullscreen_pixmap.setPixmap(scaled_fullscreen_pixmap)
                 fullscreen_pixmap.view_state = 3
                 self.gallery.full_image_view.addItem(fullscreen_pixmap)
@@ -496,7 +662,7 @@ class ClickableVideo(QGraphicsWidget):
             self.updateGeometry()
             self.update()
             if self.scene() and hasattr(self.scene(), 'parent_view') and self.scene().parent_view:
-                self.scene().parent_view.tile_images()
+                self.scene().parent_view.schedule_tile_images()
 
     def _on_native_size_changed(self, size: QSizeF):
         if not size.isEmpty():
@@ -504,7 +670,7 @@ class ClickableVideo(QGraphicsWidget):
             self.updateGeometry()  # let the layout know the size hint changed
             self.update()
             if self.scene() and hasattr(self.scene(), 'parent_view') and self.scene().parent_view:
-                self.scene().parent_view.tile_images()
+                self.scene().parent_view.schedule_tile_images()
 
     def sizeHint(self, which, constraint=QSizeF()):
         # Report preferred size for layout calculations
@@ -560,6 +726,8 @@ class QueueObjectWidget(QFrame):
         self.queue_object = queue_object
         self.hex_color = hex_color
         self.queue_view = queue_view
+        self.lane = getattr(queue_object, "queue_lane", "batch")
+        self.drag_start = None
 
         self.main_layout = QHBoxLayout(self)
         self.main_layout.setContentsMargins(2, 2, 2, 2)
@@ -594,7 +762,10 @@ class QueueObjectWidget(QFrame):
         self.prompt_separator = QFrame(frameShape=QFrame.Shape.HLine, frameShadow=QFrame.Shadow.Plain, lineWidth=10)
         self.prompt_separator.setStyleSheet(f"color: #888888; background-color: #888888;")
         self.prompt_label = QLabel(self.queue_object.prompt, wordWrap=True)
-        self.status_label = QLabel("Queued")
+        self.status_label = QLabel(f"Queued\n{self.lane}")
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        self.progress_bar.setMaximumHeight(14)
 
         self.main_layout.addWidget(self.prompt_container, stretch=20)
         self.main_layout.addWidget(self.status_container)
@@ -603,9 +774,90 @@ class QueueObjectWidget(QFrame):
         self.prompt_layout.addWidget(self.prompt_separator)
         self.prompt_layout.addWidget(self.prompt_label)
         self.status_layout.addWidget(self.status_label)
+        self.status_layout.addWidget(self.progress_bar)
         self.button_layout.addWidget(self.remove_button)
         self.button_layout.addWidget(self.info_button)
 
+    def set_progress(self, step, total, eta=None):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(min(step, total))
+        self.progress_bar.setFormat(f"{step}/{total}")
+        self.progress_bar.setVisible(True)
+        if eta is not None:
+            self.status_label.setText(f"Running\nETA {eta:.0f}s")
+
+    def set_busy(self):
+        """Shows an indeterminate bar while the servers progress can't be told apart from other jobs"""
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setFormat("")
+        self.progress_bar.setVisible(True)
+        self.status_label.setText("Running")
+
+    def clear_progress(self):
+        self.progress_bar.setVisible(False)
+
+    def is_queued(self):
+        return self.status_label.text().startswith("Queued")
+
+    def set_lane(self, lane):
+        self.lane = lane
+        if self.is_queued():
+            self.status_label.setText(f"Queued\n{lane}")
+
+    def contextMenuEvent(self, event):
+        menu = QMenu(self)
+        if self.is_queued() and self.queue_view.pending_requests is not None:
+            run_next_action = menu.addAction("Run Next")
+            run_next_action.triggered.connect(lambda: self.queue_view.run_next(self))
+            lane_menu = menu.addMenu("Move To Lane")
+            for lane in QUEUE_LANES:
+                lane_action = lane_menu.addAction(lane)
+                lane_action.setEnabled(lane != self.lane)
+                lane_action.triggered.connect(lambda checked=False, lane=lane: self.queue_view.set_lane(self, lane))
+            if getattr(self.queue_object, "enhance_prompt", False):
+                reroll_action = menu.addAction("Re-roll Enhancement")
+                reroll_action.triggered.connect(self.reroll_enhancement)
+        if hasattr(self.queue_object, "gallery"):
+            sweep_action = menu.addAction("Sweep Parameters...")
+            sweep_action.triggered.connect(self.sweep_parameters)
+        if not menu.isEmpty():
+            menu.exec(event.globalPos())
+
+    def reroll_enhancement(self):
+        """Makes a queued request ask the LLM for a fresh enhancement instead of reusing a cached one"""
+        self.queue_object.reroll_enhancement = True
+        for task in (self.queue_object.enhancement, self.queue_object.preparation):
+            if task is not None:
+                task.cancel()
+        self.queue_object.enhancement = None
+        self.queue_object.preparation = None
+
+    def sweep_parameters(self):
+        """Opens the sweep dialog with this request as the template and queues whatever it builds"""
+        from modules.sweep import SweepDialog
+        dialog = SweepDialog(self.queue_object, self)
+        if dialog.exec() and dialog.sweep is not None:
+            dialog.sweep.run()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton and self.is_queued():
+            self.drag_start = event.position().toPoint()
+        super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        """Starts dragging a queued request so it can be dropped elsewhere in the queue"""
+        if self.drag_start is None or not event.buttons() & Qt.LeftButton:
+            return super().mouseMoveEvent(event)
+        if (event.position().toPoint() - self.drag_start).manhattanLength() < QApplication.startDragDistance():
+            return
+        self.drag_start = None
+        mime_data = QMimeData()
+        mime_data.setData(QUEUE_ITEM_MIME, b"")
+        drag = QDrag(self)
+        drag.setMimeData(mime_data)
+        drag.setPixmap(self.grab().scaledToWidth(min(self.width(), 300), Qt.SmoothTransformation))
+        drag.exec(Qt.MoveAction)
+
     def info(self):
         prompt = getattr(self.queue_object, "enhanced_prompt", None)
         if prompt and str(prompt).strip():
@@ -616,7 +868,16 @@ class QueueObjectWidget(QFrame):
         info_box.exec()
 
     def remove_from_queue(self):
-
-        if self.queue_object in self.queue_view.parent().parent().parent().parent().pending_requests:
-            self.queue_view.parent().parent().parent().parent().pending_requests.remove(self.queue_object)
-        self.queue_view.del_queue_item(self)
\ No newline at end of file
+        """Removes a queued request, or cancels it if it is already running"""
+        ultrahal = self.queue_view.parent().parent().parent().parent()
+        if ultrahal.dispatcher.cancel(self.queue_object):
+            self.status_label.setText("Cancelling")
+            return
+        if self.queue_object in ultrahal.pending_requests:
+            ultrahal.pending_requests.remove(self.queue_object)
+        self.queue_view.del_queue_item(self)
+
+    def set_cancelled(self):
+        self.clear_progress()
+        self.status_label.setText("Cancelled")
+        self.status_container.setStyleSheet(f"color: #ffffff; background-color: #000000;")
\ No newline at end of file
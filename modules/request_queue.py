@@ -0,0 +1,158 @@
+import asyncio
+import heapq
+import inspect
+import itertools
+
+QUEUE_LANES = ["interactive", "batch", "background"]
+CONTEXT_PARAMETERS = ("avernus_client", "gallery", "tabs", "tab")
+REMOVED = object()
+
+
+def request_params(queue_request):
+    """Returns the constructor arguments of a request, read back from the attributes it stored them in"""
+    params = {}
+    for name in inspect.signature(type(queue_request).__init__).parameters:
+        if name == "self" or name in CONTEXT_PARAMETERS:
+            continue
+        params[name] = getattr(queue_request, name)
+    return params
+
+
+def clone_request(queue_request, **overrides):
+    """Builds a new request of the same type and context as queue_request, with some arguments replaced"""
+    context = {name: getattr(queue_request, name) for name in ("avernus_client", "gallery", "tabs", "tab")
+               if hasattr(queue_request, name)}
+    parameters = inspect.signature(type(queue_request).__init__).parameters
+    kwargs = {name: value for name, value in context.items() if name in parameters}
+    return type(queue_request)(**kwargs, **{**request_params(queue_request), **overrides})
+
+
+def mark_finished(queue_request):
+    """Wakes anything waiting on the requests finished_event, once it has run or will never run"""
+    finished_event = getattr(queue_request, "finished_event", None)
+    if finished_event is not None:
+        finished_event.set()
+
+
+class RequestQueue:
+    """Pending requests ordered by lane and then by submission order.
+
+    Backed by a heap with lazy deletion so append, pop and remove are O(log n). It keeps the list methods the tabs
+    already use (append, remove, in, len) so it can stand in for the old pending_requests list. If a journal is given
+    every change is written to it, and popped requests stay journaled until the dispatcher is done with them."""
+    def __init__(self, journal=None):
+        self.journal = journal
+        self.heap = []
+        self.entries = {}
+        self.counter = itertools.count()
+        self.front_counter = itertools.count(-1, -1)
+        self.space_waiters = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def __contains__(self, queue_request):
+        return queue_request in self.entries
+
+    def __iter__(self):
+        return iter(self.ordered())
+
+    def append(self, queue_request, lane=None):
+        """Queues a request at the back of its lane, by default the lane its class asks for"""
+        if lane is None:
+            lane = getattr(queue_request, "queue_lane", "batch")
+        self._push(queue_request, lane, next(self.counter))
+
+    def remove(self, queue_request):
+        """Drops a request from the queue for good"""
+        self._take(queue_request)
+        if self.journal is not None:
+            self.journal.remove(queue_request)
+        mark_finished(queue_request)
+
+    def peek(self):
+        while self.heap and self.heap[0][-1] is REMOVED:
+            heapq.heappop(self.heap)
+        return self.heap[0][-1] if self.heap else None
+
+    def pop(self, queue_request=None):
+        """Removes and returns the given request, or the first one in line if none is given"""
+        if queue_request is None:
+            queue_request = self.peek()
+            if queue_request is None:
+                raise IndexError("pop from an empty RequestQueue")
+        self._take(queue_request)
+        return queue_request
+
+    def lane(self, queue_request):
+        return QUEUE_LANES[self.entries[queue_request][0]]
+
+    def set_lane(self, queue_request, lane):
+        """Moves a request to the back of another lane"""
+        self._take(queue_request)
+        self._push(queue_request, lane, next(self.counter))
+
+    def run_next(self, queue_request):
+        """Moves a request to the very front of the queue"""
+        self._take(queue_request)
+        self._push(queue_request, QUEUE_LANES[0], next(self.front_counter))
+
+    def move_before(self, queue_request, target):
+        """Moves a request into the targets lane just ahead of it, used for drag to reorder"""
+        target_rank, target_order = self.entries[target][:2]
+        previous_order = max((entry[1] for request, entry in self.entries.items()
+                              if entry[0] == target_rank and entry[1] < target_order and request is not queue_request),
+                             default=target_order - 1)
+        self._take(queue_request)
+        self._push(queue_request, QUEUE_LANES[target_rank], (previous_order + target_order) / 2)
+
+    def move_to_back(self, queue_request):
+        self.set_lane(queue_request, self.lane(queue_request))
+
+    def ordered(self, limit=None):
+        """Returns the pending requests in the order they will run, or just the first limit of them"""
+        entries = self.entries.values()
+        if limit is None:
+            return [entry[-1] for entry in sorted(entries)]
+        return [entry[-1] for entry in heapq.nsmallest(limit, entries)]
+
+    async def wait_for_space(self, limit):
+        """Waits until fewer than limit requests are pending, woken whenever one is popped or removed"""
+        while len(self.entries) >= limit:
+            future = asyncio.get_running_loop().create_future()
+            self.space_waiters.append(future)
+            await future
+
+    def clear(self):
+        for queue_request, entry in self.entries.items():
+            entry[-1] = REMOVED
+            if self.journal is not None:
+                self.journal.remove(queue_request)
+            mark_finished(queue_request)
+        self.entries.clear()
+        self.heap.clear()
+        self._wake_waiters()
+
+    def _take(self, queue_request):
+        entry = self.entries.pop(queue_request)
+        entry[-1] = REMOVED
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        waiters, self.space_waiters = self.space_waiters, []
+        for future in waiters:
+            if not future.done():
+                future.set_result(None)
+
+    def _push(self, queue_request, lane, order):
+        if lane not in QUEUE_LANES:
+            print(f"Unknown queue lane {lane}, using batch")
+            lane = "batch"
+        entry = [QUEUE_LANES.index(lane), order, next(self.counter), queue_request]
+        self.entries[queue_request] = entry
+        heapq.heappush(self.heap, entry)
+        if self.journal is not None:
+            self.journal.save(queue_request, lane, order)
@@ -0,0 +1,93 @@
+import json
+
+QUOTE = 0x22
+BACKSLASH = 0x5C
+OPENERS = (0x7B, 0x5B)  # { [
+CLOSERS = (0x7D, 0x5D)  # } ]
+OPEN_ARRAY = 0x5B
+
+
+class JsonImageStreamParser:
+    """Incrementally scans a JSON response body for the strings inside one top level array, "images" by default.
+
+    feed() returns each image string as soon as its closing quote arrives. Everything outside that array is kept in a
+    small skeleton with the images replaced by null, so result() can still return the rest of the response."""
+    def __init__(self, key="images"):
+        self.key = key
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.capture = False
+        self.in_images = False
+        self.last_string = None
+        self.string_data = bytearray()
+        self.skeleton = bytearray()
+        self.image_count = 0
+
+    def feed(self, chunk: bytes) -> list[bytearray]:
+        images = []
+        view = memoryview(chunk)
+        position = 0
+        length = len(chunk)
+        while position < length:
+            if self.in_string:
+                end = self._find_string_end(chunk, position)
+                if end == -1:
+                    self.string_data.extend(view[position:])
+                    break
+                self.string_data.extend(view[position:end])
+                self._end_string(images)
+                position = end + 1
+                continue
+
+            byte = chunk[position]
+            if byte == QUOTE:
+                self.in_string = True
+                self.capture = self.in_images and self.depth == 2
+                self.string_data = bytearray()
+            else:
+                if byte in OPENERS:
+                    self.depth += 1
+                    if self.depth == 2 and byte == OPEN_ARRAY and self.last_string == self.key:
+                        self.in_images = True
+                elif byte in CLOSERS:
+                    if self.depth == 2:
+                        self.in_images = False
+                    self.depth -= 1
+                self.skeleton.append(byte)
+            position += 1
+        return images
+
+    def result(self) -> dict:
+        """Returns the parsed response with the streamed images left out"""
+        response = json.loads(bytes(self.skeleton))
+        response[self.key] = []
+        return response
+
+    def _find_string_end(self, chunk, position):
+        """Returns the index of the quote closing the current string, or -1 if it continues in the next chunk"""
+        if self.escape:
+            self.escape = False
+            position += 1
+        while True:
+            quote = chunk.find(b'"', position)
+            backslash = chunk.find(b'\\', position, quote if quote != -1 else len(chunk))
+            if backslash == -1:
+                return quote
+            if backslash + 1 >= len(chunk):
+                self.escape = True
+                return -1
+            position = backslash + 2
+
+    def _end_string(self, images):
+        self.in_string = False
+        if self.capture:
+            images.append(self.string_data)
+            self.image_count += 1
+            self.skeleton.extend(b"null")
+        else:
+            raw = b'"' + bytes(self.string_data) + b'"'
+            self.skeleton.extend(raw)
+            if self.depth == 1:
+                self.last_string = json.loads(raw)
+        self.string_data = bytearray()
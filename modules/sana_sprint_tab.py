@@ -12,7 +12,7 @@ from modules.request_helpers import BaseImageRequest, QueueObjectWidget
 from modules.ui_widgets import (HorizontalSlider, ImageGallery, ImageInputBox, ModelPickerWidget,
                                 ParagraphInputBox, PromptPickerWidget, QueueViewer, ResolutionInput,
                                 SingleLineInputBox, VerticalTabWidget)
-from modules.utils import base64_to_images, image_to_base64, get_generic_danbooru_tags, get_random_artist_prompt, get_enhanced_prompt
+from modules.utils import encode_image
 
 
 class SanaSprintTab(QWidget):
@@ -153,6 +153,8 @@ class SanaSprintTab(QWidget):
             print(f"Sana Sprint on_submit EXCEPTION: {e}")
 
 class SanaSprintRequest(BaseImageRequest):
+    prefetch_images = (("i2i_image", "i2i_image_enabled", "image"),)
+
     def __init__(self,
                  avernus_client: AvernusClient,
                  gallery: ImageGallery,
@@ -219,28 +221,17 @@ class SanaSprintRequest(BaseImageRequest):
 
 
         if self.i2i_image_enabled:
-            image = image_to_base64(self.i2i_image, kwargs["width"], kwargs["height"])
+            image = await encode_image(self.i2i_image, kwargs["width"], kwargs["height"])
             kwargs["image"] = str(image)
             if self.strength != "":
                 kwargs["strength"] = float(self.strength)
 
-        if self.enhance_prompt:
-            llm_prompt = await get_enhanced_prompt(self.avernus_client, self.prompt)
-            self.enhanced_prompt = llm_prompt
-        if self.add_artist:
-            random_artist_prompt = get_random_artist_prompt()
-            self.enhanced_prompt = f"{random_artist_prompt}. {self.enhanced_prompt}"
-        if self.add_danbooru_tags:
-            danbooru_tags = get_generic_danbooru_tags("./assets/danbooru.csv", self.danbooru_tags_amount)
-            self.enhanced_prompt = f"{self.enhanced_prompt}, {danbooru_tags}"
+        await self.prepare()
 
         try:
-            response = await self.avernus_client.sana_sprint_image(self.enhanced_prompt, **kwargs)
+            response = await self.avernus_client.sana_sprint_image(self.enhanced_prompt, on_image=self.display_image, **kwargs)
             if response["status"] == "True" or response["status"] == True:
                 self.status = "Finished"
-                base64_images = response["images"]
-                images = await base64_to_images(base64_images)
-                await self.display_images(images)
             else:
                 self.status = "Failed"
         except Exception as e:
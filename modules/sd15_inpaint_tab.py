@@ -12,7 +12,7 @@ from modules.queue import QueueTab
 from modules.request_helpers import BaseImageRequest, QueueObjectWidget
 from modules.ui_widgets import (ImageGallery, HorizontalSlider, ModelPickerWidget, PainterWidget, ParagraphInputBox,
                                 QueueViewer, SingleLineInputBox, VerticalTabWidget)
-from modules.utils import base64_to_images, image_to_base64, get_random_artist_prompt, get_generic_danbooru_tags, get_enhanced_prompt
+from modules.utils import encode_image
 
 
 class SD15InpaintTab(QWidget):
@@ -159,11 +159,9 @@ class SD15InpaintTab(QWidget):
     def set_brush_size(self):
         self.paint_area.pen.setWidth(int(self.brush_size_slider.slider.value()))
 
-    @asyncSlot()
-    async def make_lora_list(self):
+    def set_lora_list(self, response):
         self.lora_list.clear()
         try:
-            response = await self.avernus_client.list_sd15_loras()
             if response["status"] is True:
                 if len(response["loras"]) == 0:
                     self.lora_list.insertItems(0, ["NONE"])
@@ -175,11 +173,9 @@ class SD15InpaintTab(QWidget):
         except:
             self.lora_list.insertItems(0, ["LORA LIST ERROR"])
 
-    @asyncSlot()
-    async def make_scheduler_list(self):
+    def set_scheduler_list(self, response):
         self.scheduler_list.clear()
         try:
-            response = await self.avernus_client.list_sdxl_schedulers()
             if response["status"] is True:
                 for scheduler in response["schedulers"]:
                     self.scheduler_list.addItem(scheduler)
@@ -190,6 +186,8 @@ class SD15InpaintTab(QWidget):
 
 
 class SD15InpaintRequest(BaseImageRequest):
+    prefetch_images = (("image", None, "image"), ("mask_image", None, "mask_image"))
+
     def __init__(self,
                  avernus_client: AvernusClient,
                  gallery: ImageGallery,
@@ -249,9 +247,9 @@ class SD15InpaintRequest(BaseImageRequest):
         if self.guidance_scale != "":kwargs["guidance_scale"] = float(self.guidance_scale)
         if self.seed != "": kwargs["seed"] = int(self.seed)
         if self.lora_name != "<None>": kwargs["lora_name"] = self.lora_name
-        image = image_to_base64(self.image, self.width, self.height)
+        image = await encode_image(self.image, self.width, self.height)
         kwargs["image"] = str(image)
-        mask_image = image_to_base64(self.mask_image, self.width, self.height)
+        mask_image = await encode_image(self.mask_image, self.width, self.height, "mask_image")
         kwargs["mask_image"] = str(mask_image)
         kwargs["width"] = self.width
         kwargs["height"] = self.height
@@ -259,23 +257,12 @@ class SD15InpaintRequest(BaseImageRequest):
         kwargs["model_name"] = str(self.model_name)
         kwargs["scheduler"] = str(self.scheduler)
 
-        if self.enhance_prompt:
-            llm_prompt = await get_enhanced_prompt(self.avernus_client, self.prompt)
-            self.enhanced_prompt = llm_prompt
-        if self.add_artist:
-            random_artist_prompt = get_random_artist_prompt()
-            self.enhanced_prompt = f"{random_artist_prompt}. {self.enhanced_prompt}"
-        if self.add_danbooru_tags:
-            danbooru_tags = get_generic_danbooru_tags("./assets/danbooru.csv", self.danbooru_tags_amount)
-            self.enhanced_prompt = f"{self.enhanced_prompt}, {danbooru_tags}"
+        await self.prepare()
 
         try:
-            response = await self.avernus_client.sd15_inpaint_image(self.enhanced_prompt, **kwargs)
+            response = await self.avernus_client.sd15_inpaint_image(self.enhanced_prompt, on_image=self.display_image, **kwargs)
             if response["status"] == "True" or response["status"] == True:
                 self.status = "Finished"
-                base64_images = response["images"]
-                images = await base64_to_images(base64_images)
-                await self.display_images(images)
             else:
                 self.status = "Failed"
         except Exception as e:
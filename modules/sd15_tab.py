@@ -13,7 +13,7 @@ from modules.request_helpers import BaseImageRequest, QueueObjectWidget
 from modules.ui_widgets import (HorizontalSlider, ImageGallery, ImageInputBox, ModelPickerWidget, ParagraphInputBox,
                                 PromptPickerWidget, QueueViewer, ResolutionInput, SingleLineInputBox,
                                 VerticalTabWidget)
-from modules.utils import base64_to_images, image_to_base64, get_generic_danbooru_tags, get_random_artist_prompt, get_enhanced_prompt
+from modules.utils import encode_image
 
 
 class SD15Tab(QWidget):
@@ -181,11 +181,9 @@ class SD15Tab(QWidget):
         except Exception as e:
             print(f"SD 1.5 on_submit EXCEPTION: {e}")
 
-    @asyncSlot()
-    async def make_lora_list(self):
+    def set_lora_list(self, response):
         self.lora_list.clear()
         try:
-            response = await self.avernus_client.list_sd15_loras()
             if response["status"] is True:
                 if len(response["loras"]) == 0:
                     self.lora_list.insertItems(0, ["NONE"])
@@ -196,11 +194,9 @@ class SD15Tab(QWidget):
         except:
             self.lora_list.insertItems(0, ["LORA LIST ERROR"])
 
-    @asyncSlot()
-    async def make_scheduler_list(self):
+    def set_scheduler_list(self, response):
         self.scheduler_list.clear()
         try:
-            response = await self.avernus_client.list_sdxl_schedulers()
             if response["status"] is True:
                 for scheduler in response["schedulers"]:
                     self.scheduler_list.addItem(scheduler)
@@ -210,6 +206,8 @@ class SD15Tab(QWidget):
             self.scheduler_list.addItem("SCHEDULER LIST ERROR")
 
 class SD15Request(BaseImageRequest):
+    prefetch_images = (("i2i_image", "i2i_image_enabled", "image"),)
+
     def __init__(self,
                  avernus_client: AvernusClient,
                  gallery: ImageGallery,
@@ -278,27 +276,16 @@ class SD15Request(BaseImageRequest):
         if self.height is not None: kwargs["height"] = int(self.height)
 
         if self.i2i_image_enabled:
-            image = image_to_base64(self.i2i_image, kwargs["width"], kwargs["height"])
+            image = await encode_image(self.i2i_image, kwargs["width"], kwargs["height"])
             kwargs["image"] = str(image)
             if self.strength != "":
                 kwargs["strength"] = float(self.strength)
-        if self.enhance_prompt:
-            llm_prompt = await get_enhanced_prompt(self.avernus_client, self.prompt)
-            self.enhanced_prompt = llm_prompt
-        if self.add_artist:
-            random_artist_prompt = get_random_artist_prompt()
-            self.enhanced_prompt = f"{random_artist_prompt}. {self.enhanced_prompt}"
-        if self.add_danbooru_tags:
-            danbooru_tags = get_generic_danbooru_tags("./assets/danbooru.csv", self.danbooru_tags_amount)
-            self.enhanced_prompt = f"{self.enhanced_prompt}, {danbooru_tags}"
+        await self.prepare()
 
         try:
-            response = await self.avernus_client.sd15_image(self.enhanced_prompt, **kwargs)
+            response = await self.avernus_client.sd15_image(self.enhanced_prompt, on_image=self.display_image, **kwargs)
             if response["status"] == "True" or response["status"] == True:
                 self.status = "Finished"
-                base64_images = response["images"]
-                images = await base64_to_images(base64_images)
-                await self.display_images(images)
             else:
                 self.status = "Failed"
         except Exception as e:
@@ -11,7 +11,7 @@ from modules.gallery import GalleryTab
 from modules.queue import QueueTab
 from modules.ui_widgets import (HorizontalSlider, ImageGallery, ImageInputBox, ModelPickerWidget, ParagraphInputBox,
                                 QueueViewer, ResolutionInput, SingleLineInputBox, VerticalTabWidget)
-from modules.utils import base64_to_images, image_to_base64, get_generic_danbooru_tags, get_random_artist_prompt, get_enhanced_prompt
+from modules.utils import encode_image
 from modules.request_helpers import BaseImageRequest, QueueObjectWidget
 
 
@@ -220,11 +220,9 @@ class SdxlTab(QWidget):
         except Exception as e:
             print(f"SDXL on_submit EXCEPTION: {e}")
 
-    @asyncSlot()
-    async def make_lora_list(self):
+    def set_lora_list(self, response):
         self.lora_list.clear()
         try:
-            response = await self.avernus_client.list_sdxl_loras()
             if response["status"] is True:
                 if len(response["loras"]) == 0:
                     self.lora_list.insertItems(0, ["NONE"])
@@ -235,11 +233,9 @@ class SdxlTab(QWidget):
         except:
             self.lora_list.insertItems(0, ["LORA LIST ERROR"])
 
-    @asyncSlot()
-    async def make_controlnet_list(self):
+    def set_controlnet_list(self, response):
         self.controlnet_list.clear()
         try:
-            response = await self.avernus_client.list_sdxl_controlnets()
             if response["status"] is True:
                 for controlnet in response["sdxl_controlnets"]:
                     self.controlnet_list.addItem(controlnet)
@@ -248,11 +244,9 @@ class SdxlTab(QWidget):
         except:
             self.controlnet_list.addItem("CONTROLNET LIST ERROR")
 
-    @asyncSlot()
-    async def make_scheduler_list(self):
+    def set_scheduler_list(self, response):
         self.scheduler_list.clear()
         try:
-            response = await self.avernus_client.list_sdxl_schedulers()
             if response["status"] is True:
                 for scheduler in response["schedulers"]:
                     self.scheduler_list.addItem(scheduler)
@@ -263,6 +257,10 @@ class SdxlTab(QWidget):
 
 
 class SDXLRequest(BaseImageRequest):
+    prefetch_images = (("i2i_image", "i2i_image_enabled", "image"),
+                       ("ip_adapter_image", "ip_adapter_enabled", "ip_adapter_image"),
+                       ("controlnet_image", "controlnet_enabled", "controlnet_image"))
+
     def __init__(self, avernus_client: AvernusClient, gallery: ImageGallery, tabs: VerticalTabWidget, prompt: str,
                  negative_prompt: str, width: str, height: str, steps: str, batch_size: str, lora_name: list,
                  guidance_scale: str, strength: float, ip_adapter_strength: float, controlnet_strength: float,
@@ -323,38 +321,27 @@ class SDXLRequest(BaseImageRequest):
         if self.height is not None: kwargs["height"] = int(self.height)
 
         if self.i2i_image_enabled:
-            image = image_to_base64(self.i2i_image, kwargs["width"], kwargs["height"])
+            image = await encode_image(self.i2i_image, kwargs["width"], kwargs["height"])
             kwargs["image"] = str(image)
             if self.strength != "":
                 kwargs["strength"] = float(self.strength)
         if self.ip_adapter_enabled:
-            ip_adapter_image = image_to_base64(self.ip_adapter_image, kwargs["width"], kwargs["height"])
+            ip_adapter_image = await encode_image(self.ip_adapter_image, kwargs["width"], kwargs["height"], "ip_adapter_image")
             kwargs["ip_adapter_image"] = str(ip_adapter_image)
             if self.ip_adapter_strength != "":
                 kwargs["ip_adapter_strength"] = float(self.ip_adapter_strength)
         if self.controlnet_enabled:
-            controlnet_image = image_to_base64(self.controlnet_image, kwargs["width"], kwargs["height"])
+            controlnet_image = await encode_image(self.controlnet_image, kwargs["width"], kwargs["height"], "controlnet_image")
             kwargs["controlnet_image"] = str(controlnet_image)
             kwargs["controlnet_processor"] = str(self.controlnet_processor)
             if self.controlnet_strength != "":
                 kwargs["controlnet_conditioning"] = float(self.controlnet_strength)
-        if self.enhance_prompt:
-            llm_prompt = await get_enhanced_prompt(self.avernus_client, self.prompt)
-            self.enhanced_prompt = llm_prompt
-        if self.add_artist:
-            random_artist_prompt = get_random_artist_prompt()
-            self.enhanced_prompt = f"{random_artist_prompt}. {self.enhanced_prompt}"
-        if self.add_danbooru_tags:
-            danbooru_tags = get_generic_danbooru_tags("./assets/danbooru.csv", self.danbooru_tags_amount)
-            self.enhanced_prompt = f"{self.enhanced_prompt}, {danbooru_tags}"
+        await self.prepare()
 
         try:
-            response = await self.avernus_client.sdxl_image(self.enhanced_prompt, **kwargs)
+            response = await self.avernus_client.sdxl_image(self.enhanced_prompt, on_image=self.display_image, **kwargs)
             if response["status"] == "True" or response["status"] == True:
                 self.status = "Finished"
-                base64_images = response["images"]
-                images = await base64_to_images(base64_images)
-                await self.display_images(images)
             else:
                 self.status = "Failed"
         except Exception as e:
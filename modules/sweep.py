@@ -0,0 +1,288 @@
+import asyncio
+import itertools
+import math
+import re
+
+from PySide6.QtWidgets import (QComboBox, QDialog, QGridLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton,
+                               QScrollArea, QVBoxLayout, QWidget)
+from PySide6.QtGui import QColor, QFont, QImage, QPainter, QPixmap
+from PySide6.QtCore import QBuffer, QIODevice, Qt
+from qasync import asyncSlot
+
+from modules.gallery_store import GALLERY_STORE
+from modules.request_queue import clone_request, request_params
+from modules.utils import IMAGE_WORKERS
+
+SWEEP_CHUNK_SIZE = 25
+SWEEP_LANE = "batch"
+SWEEP_MAX_PENDING = 100
+SWEEP_SEPARATOR = "|"
+GRID_CELL_WIDTH = 384
+GRID_LABEL_HEIGHT = 32
+RANGE_PATTERN = re.compile(r"^\s*(-?[\d.]+)\s*:\s*(-?[\d.]+)\s*(?::\s*(-?[\d.]+)\s*)?$")
+
+
+def parse_sweep_values(text, current):
+    """Parses a sweep field into the values to try, typed to match the fields current value.
+
+    Values are separated by |, and numbers can also be given as an inclusive start:stop:step range.
+    List fields such as lora_name take + separated names for each value."""
+    text = text.strip()
+    if not text:
+        return []
+    if isinstance(current, list):
+        return [[name.strip() for name in item.split("+") if name.strip()] for item in text.split(SWEEP_SEPARATOR)]
+    if isinstance(current, bool):
+        return [item.strip().lower() in ("1", "true", "yes", "on") for item in text.split(SWEEP_SEPARATOR)]
+    match = RANGE_PATTERN.match(text)
+    if match:
+        start, stop = float(match.group(1)), float(match.group(2))
+        step = float(match.group(3) or 1)
+        if step == 0 or (stop - start) / step < 0:
+            raise ValueError(f"{text} is not a valid range")
+        count = math.floor(round((stop - start) / step, 9)) + 1
+        values = [round(start + step * index, 9) for index in range(count)]
+    else:
+        values = [item.strip() for item in text.split(SWEEP_SEPARATOR)]
+    if isinstance(current, int):
+        return [int(float(value)) for value in values]
+    if isinstance(current, float):
+        return [float(value) for value in values]
+    return [format_number(value) if isinstance(value, float) else value for value in values]
+
+
+def format_number(value):
+    return str(int(value)) if value == int(value) else f"{value:g}"
+
+
+def format_value(value):
+    if isinstance(value, list):
+        return "+".join(str(item) for item in value) or "none"
+    return str(value)
+
+
+def describe(combination):
+    return ", ".join(f"{name}={format_value(value)}" for name, value in combination.items())
+
+
+class ParameterSweep:
+    """The cartesian product of a set of swept fields over a template request.
+
+    Combinations are generated lazily with the grid axes varying fastest, so every grid's cells are queued one
+    after another and each grid can be built as soon as its own requests are done."""
+    def __init__(self, template, fields: dict, x_field=None, y_field=None):
+        self.template = template
+        self.x_field = x_field if x_field in fields else None
+        self.y_field = y_field if y_field in fields and y_field != self.x_field else None
+        self.fields = {name: values for name, values in fields.items() if name not in (self.x_field, self.y_field)}
+        if self.y_field is not None:
+            self.fields[self.y_field] = fields[self.y_field]
+        if self.x_field is not None:
+            self.fields[self.x_field] = fields[self.x_field]
+
+    def __len__(self):
+        return math.prod(len(values) for values in self.fields.values())
+
+    @property
+    def grid_size(self):
+        """Number of cells in each X/Y grid"""
+        return math.prod(len(self.fields[name]) for name in (self.x_field, self.y_field) if name is not None)
+
+    def combinations(self):
+        """Yields (combination, cell) pairs, cell being the (column, row) the combination takes in its grid. The cell
+        comes from each values position rather than the value itself so repeated values get cells of their own"""
+        names = list(self.fields)
+        for items in itertools.product(*(list(enumerate(values)) for values in self.fields.values())):
+            positions = dict(zip(names, (position for position, _ in items)))
+            cell = (positions[self.x_field] if self.x_field else 0, positions[self.y_field] if self.y_field else 0)
+            yield dict(zip(names, (value for _, value in items))), cell
+
+    def grid_title(self, combination):
+        return describe({name: value for name, value in combination.items()
+                         if name not in (self.x_field, self.y_field)})
+
+    @asyncSlot()
+    async def run(self):
+        """Queues the combinations a chunk at a time, never letting the pending queue grow past SWEEP_MAX_PENDING,
+        and adds an X/Y grid to the gallery each time a grid's requests have all finished"""
+        ultrahal = self.template.tabs.parent()
+        queue_view = ultrahal.queue_tab.queue_view
+        make_grids = self.x_field is not None or self.y_field is not None
+        grid_tasks = []
+        grid = []
+        combinations = self.combinations()
+        while True:
+            await ultrahal.pending_requests.wait_for_space(SWEEP_MAX_PENDING)
+            chunk = list(itertools.islice(combinations, SWEEP_CHUNK_SIZE))
+            if not chunk:
+                break
+            for combination, cell in chunk:
+                try:
+                    request = clone_request(self.template, **combination)
+                except Exception as e:
+                    print(f"Sweep could not build a request for {combination}: {e}")
+                    request = None
+                if request is not None:
+                    request.queue_info = f"Sweep {describe(combination)} | {request.queue_info or ''}"
+                    request.queue_lane = SWEEP_LANE
+                    request.ui_item = queue_view.add_queue_item(request, queue_view)
+                    if make_grids:
+                        request.finished_event = asyncio.Event()
+                    ultrahal.pending_requests.append(request, SWEEP_LANE)
+                if not make_grids:
+                    continue
+                # A request that could not be built keeps its cell as an empty tile so the rest of the grid doesn't shift
+                grid.append((combination, cell, request))
+                if len(grid) == self.grid_size:
+                    grid_tasks.append(asyncio.ensure_future(self.build_grid(grid)))
+                    grid = []
+            ultrahal.request_event.set()
+            await asyncio.sleep(0)
+        if grid:
+            grid_tasks.append(asyncio.ensure_future(self.build_grid(grid)))
+        await asyncio.gather(*grid_tasks)
+        print(f"Sweep of {len(self)} requests done")
+
+    async def build_grid(self, grid):
+        await asyncio.gather(*(request.finished_event.wait() for _, _, request in grid if request is not None))
+        cells = {}
+        for _, cell, request in grid:
+            if request is None:
+                continue
+            images = [path for kind, path in getattr(request, "outputs", []) if kind == "image"]
+            if images:
+                cells[cell] = images[0]
+        if not cells:
+            return
+        x_labels = [format_value(value) for value in self.fields[self.x_field]] if self.x_field else [""]
+        y_labels = [format_value(value) for value in self.fields[self.y_field]] if self.y_field else [""]
+        title = self.grid_title(grid[0][0])
+        loop = asyncio.get_running_loop()
+        stored = await loop.run_in_executor(IMAGE_WORKERS, render_grid, cells, x_labels, y_labels, self.x_field,
+                                            self.y_field, title)
+        if stored is None:
+            return
+        from modules.request_helpers import ClickablePixmap
+        key, thumbnail, original_size = stored
+        gallery = self.template.gallery
+        gallery.gallery.add_item(ClickablePixmap(QPixmap.fromImage(thumbnail), gallery.gallery, self.template.tabs,
+                                                 image_key=key, original_size=original_size))
+
+
+def render_grid(cells, x_labels, y_labels, x_field, y_field, title):
+    """Paints the X/Y comparison grid and writes it to the gallery store. Only touches QImage so it can run on a
+    worker thread"""
+    images = {cell: QImage(path) for cell, path in cells.items()}
+    images = {cell: image.scaledToWidth(GRID_CELL_WIDTH, Qt.SmoothTransformation)
+              for cell, image in images.items() if not image.isNull()}
+    if not images:
+        return None
+    cell_height = max(image.height() for image in images.values())
+    label_width = GRID_CELL_WIDTH // 2 if y_field else 0
+    header_height = GRID_LABEL_HEIGHT * (2 if title else 1)
+    grid = QImage(label_width + GRID_CELL_WIDTH * len(x_labels), header_height + cell_height * len(y_labels),
+                  QImage.Format_RGB32)
+    grid.fill(QColor("#1e1e1e"))
+    painter = QPainter(grid)
+    painter.setPen(QColor("#dddddd"))
+    font = QFont()
+    font.setPixelSize(GRID_LABEL_HEIGHT // 2)
+    painter.setFont(font)
+    if title:
+        painter.drawText(0, 0, grid.width(), GRID_LABEL_HEIGHT, Qt.AlignCenter, title)
+    for column, label in enumerate(x_labels):
+        painter.drawText(label_width + column * GRID_CELL_WIDTH, header_height - GRID_LABEL_HEIGHT, GRID_CELL_WIDTH,
+                         GRID_LABEL_HEIGHT, Qt.AlignCenter, f"{x_field}={label}" if x_field else "")
+    for row, label in enumerate(y_labels):
+        painter.drawText(0, header_height + row * cell_height, label_width, cell_height,
+                         Qt.AlignCenter | Qt.TextWordWrap, f"{y_field}={label}" if y_field else "")
+    for (column, row), image in images.items():
+        painter.drawImage(label_width + column * GRID_CELL_WIDTH, header_height + row * cell_height, image)
+    painter.end()
+    buffer = QBuffer()
+    buffer.open(QIODevice.WriteOnly)
+    grid.save(buffer, "PNG")
+    return GALLERY_STORE.store_image(bytes(buffer.data()))
+
+
+class SweepDialog(QDialog):
+    """Lets the user list values or ranges for any of a requests fields and queues every combination of them"""
+    def __init__(self, template, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"Sweep {template.__class__.__name__}")
+        self.template = template
+        self.inputs = {}
+        self.sweep = None
+
+        self.fields_widget = QWidget()
+        self.fields_layout = QGridLayout(self.fields_widget)
+        for row, (name, value) in enumerate(request_params(template).items()):
+            if not isinstance(value, (str, int, float, bool, list)) or \
+                    (isinstance(value, list) and not all(isinstance(item, str) for item in value)):
+                continue
+            field_input = QLineEdit()
+            field_input.setPlaceholderText(format_value(value))
+            field_input.textChanged.connect(self.update_count)
+            self.inputs[name] = field_input
+            self.fields_layout.addWidget(QLabel(name), row, 0)
+            self.fields_layout.addWidget(field_input, row, 1)
+        self.fields_scroll = QScrollArea()
+        self.fields_scroll.setWidget(self.fields_widget)
+        self.fields_scroll.setWidgetResizable(True)
+
+        self.help_label = QLabel("Separate values with |, give numbers as start:stop:step, join LoRAs with +")
+        self.x_picker = QComboBox()
+        self.y_picker = QComboBox()
+        for picker in (self.x_picker, self.y_picker):
+            picker.addItem("None")
+            picker.addItems(list(self.inputs))
+            picker.currentTextChanged.connect(self.update_count)
+        self.count_label = QLabel()
+        self.queue_button = QPushButton("Queue Sweep")
+        self.queue_button.clicked.connect(self.queue_sweep)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.reject)
+
+        self.axis_layout = QHBoxLayout()
+        self.axis_layout.addWidget(QLabel("Grid X:"))
+        self.axis_layout.addWidget(self.x_picker, stretch=1)
+        self.axis_layout.addWidget(QLabel("Grid Y:"))
+        self.axis_layout.addWidget(self.y_picker, stretch=1)
+        self.button_layout = QHBoxLayout()
+        self.button_layout.addWidget(self.count_label, stretch=1)
+        self.button_layout.addWidget(self.queue_button)
+        self.button_layout.addWidget(self.cancel_button)
+        self.main_layout = QVBoxLayout(self)
+        self.main_layout.addWidget(self.fields_scroll)
+        self.main_layout.addWidget(self.help_label)
+        self.main_layout.addLayout(self.axis_layout)
+        self.main_layout.addLayout(self.button_layout)
+        self.resize(500, 600)
+        self.update_count()
+
+    def build_sweep(self):
+        params = request_params(self.template)
+        fields = {}
+        for name, field_input in self.inputs.items():
+            values = parse_sweep_values(field_input.text(), params[name])
+            if values:
+                fields[name] = values
+        return ParameterSweep(self.template, fields, self.x_picker.currentText(), self.y_picker.currentText())
+
+    def update_count(self):
+        try:
+            sweep = self.build_sweep()
+        except ValueError as e:
+            self.count_label.setText(f"Invalid value: {e}")
+            self.queue_button.setEnabled(False)
+            return
+        self.count_label.setText(f"{len(sweep)} requests")
+        self.queue_button.setEnabled(bool(sweep.fields))
+
+    def queue_sweep(self):
+        try:
+            self.sweep = self.build_sweep()
+        except ValueError as e:
+            print(f"Invalid sweep: {e}")
+            return
+        self.accept()
@@ -10,11 +10,19 @@ from PySide6.QtWidgets import (QApplication, QHBoxLayout, QVBoxLayout, QTextEdit
                                QStackedWidget, QListWidgetItem, QStyledItemDelegate)
 from PySide6.QtGui import (QMouseEvent, QPixmap, QPainter, QPaintEvent, QPen, QTextDocument, QColor, QCursor, QFont,
                            QIcon, QImage)
-from PySide6.QtCore import Qt, QSize, Signal, QObject
+from PySide6.QtCore import Qt, QRectF, QSize, Signal, QObject, QTimer, QEvent
 
-from modules.utils import get_model_color
+from modules.enhancement_cache import ENHANCEMENT_CACHE
+from modules.gallery_store import GALLERY_STORE
+from modules.request_queue import QUEUE_LANES, RequestQueue
+from modules.utils import (ARGUMENT_ENCODE_PROFILES, IMAGE_WORKERS, UPLOAD_PROFILES, get_model_color,
+                           set_upload_profile)
 #from modules.request_helpers import ClickableAudio, ClickablePixmap, ClickableVideo, QueueObjectWidget
 
+RETILE_DELAY_MS = 100
+TEXT_FLUSH_MS = 50
+QUEUE_ITEM_MIME = "application/x-ultrahal-queue-item"
+
 
 
 class CheckableComboBox(QComboBox):
@@ -181,7 +189,7 @@ class ImageGallery(QWidget):
         self.clear_gallery_button = QPushButton("Clear Gallery")
         self.gallery = ImageGalleryViewer(self, parent)
 
-        self.column_slider.slider.valueChanged.connect(self.gallery.tile_images)
+        self.column_slider.slider.valueChanged.connect(self.gallery.schedule_tile_images)
         self.clear_gallery_button.clicked.connect(self.clear_gallery)
 
         config_layout = QHBoxLayout()
@@ -193,8 +201,9 @@ class ImageGallery(QWidget):
         main_layout.addWidget(self.gallery)
 
     def clear_gallery(self):
-        self.gallery.gallery.clear()
-        self.gallery.tile_images()
+        self.gallery.clear_items()
+        GALLERY_STORE.clear()
+        IMAGE_WORKERS.submit(GALLERY_STORE.prune)
         self.update()
 
 class ImageGalleryViewer(QGraphicsView):
@@ -205,57 +214,159 @@ class ImageGalleryViewer(QGraphicsView):
         self.gallery = QGraphicsScene()
         self.scaled_image_view = QGraphicsScene()
         self.full_image_view = QGraphicsScene()
+        self.tiles = []  # Gallery items in the order they were added
+        self.tile_rects = {}
+        self.tile_heights = {}
+        self.row_items = []  # The top row, newest first
+        self.row_bottom = 0
+        self.top_y = 0
+        self.tile_width = 0
+        self.tiled_viewport_width = None
+        self.tiled_columns = None
+        self.previews = {}  # Live preview tiles of running requests
         self.setScene(self.gallery)
         self.gallery.parent_view = self
+        self.retile_timer = QTimer(self)
+        self.retile_timer.setSingleShot(True)
+        self.retile_timer.setInterval(RETILE_DELAY_MS)
+        self.retile_timer.timeout.connect(self.tile_images)
+        self.verticalScrollBar().valueChanged.connect(lambda: self.update_visible())
 
     def add_item(self, item: QGraphicsItem):
+        """Adds a tile to the gallery, laying out only the new tile and the row it lands in"""
         self.gallery.addItem(item)
+        self.tiles.append(item)
+        columns = self.top_layout.column_slider.slider.value()
+        if self.viewport().width() != self.tiled_viewport_width or columns != self.tiled_columns:
+            self.tile_images()
+            return
+        scrollbar = self.verticalScrollBar()
+        at_top = scrollbar.value() == scrollbar.minimum()
+        self.place_tile(item, columns)
+        self.layout_previews()
+        if at_top:
+            scrollbar.setValue(scrollbar.minimum())  # Keep the newest results in view
+        self.update_visible(self.row_items)
+
+    def clear_items(self):
+        self.gallery.clear()
+        self.tiles = []
+        self.tile_rects = {}
+        self.previews = {}
+        self.tile_images()
+
+    def schedule_tile_images(self):
+        """Re-tiles once things settle instead of on every resize or slider step"""
+        self.retile_timer.start()
 
     def tile_images(self):
-        from modules.request_helpers import ClickableAudio, ClickablePixmap, ClickableVideo
-        cur_x = 0
-        cur_y = 0
+        """Lays out every tile from its cached dimensions, only the tiles near the viewport get scaled pixmaps"""
+        self.retile_timer.stop()
         width = self.viewport().width()
         columns = self.top_layout.column_slider.slider.value()
-        tile_width = width / columns
-        spacing = 0
-
-        row_max_height = 0
-        current_row = []
-
-        for item in self.gallery.items():
-            if isinstance(item, ClickablePixmap):
-                scaled_pixmap = item.original_pixmap.scaledToWidth(tile_width, Qt.SmoothTransformation)
-                item.setPixmap(scaled_pixmap)
-            elif isinstance(item, ClickableAudio):
-                widget = item.widget()
-                widget.setFixedWidth(tile_width)
-                widget.adjustSize()
-            elif isinstance(item, ClickableVideo):
-                tile_width = width / columns
-                item.resize(tile_width, item.sizeHint(Qt.PreferredSize).height())
-
-            else:
-                continue  # unsupported type
-
-            item.setPos(cur_x, cur_y)
-            current_row.append(item)
+        self.tile_width = width / columns
+        self.tiled_viewport_width = width
+        self.tiled_columns = columns
+        self.tile_rects = {}
+        self.tile_heights = {}
+        self.row_items = []
+        self.row_bottom = 0
+        self.top_y = 0
+
+        for item in self.tiles:
+            self.place_tile(item, columns)
+
+        self.layout_previews()
+        self.update_visible()
+
+    def place_tile(self, item: QGraphicsItem, columns: int):
+        """Places a tile at the start of the top row, rows stack upwards so the newest results are always on top
+        and adding one never moves anything outside its own row"""
+        from modules.request_helpers import ClickableAudio, ClickablePixmap, ClickableVideo
+        tile_width = self.tile_width
+        if isinstance(item, ClickablePixmap):
+            item_height = item.tile_height(int(tile_width))
+        elif isinstance(item, ClickableAudio):
+            widget = item.widget()
+            widget.setFixedWidth(tile_width)
+            widget.adjustSize()
             item_height = item.boundingRect().height()
-            row_max_height = max(row_max_height, item_height)
-            cur_x += tile_width + spacing
-
-            if len(current_row) >= columns:
-                cur_y += row_max_height + spacing
-                cur_x = 0
-                row_max_height = 0
-                current_row = []
+        elif isinstance(item, ClickableVideo):
+            item.resize(tile_width, item.sizeHint(Qt.PreferredSize).height())
+            item_height = item.boundingRect().height()
+        else:
+            return  # unsupported type
+
+        if len(self.row_items) >= columns:
+            self.row_bottom = self.top_y
+            self.row_items = []
+        self.row_items.insert(0, item)
+        self.tile_heights[item] = item_height
+        row_max_height = max(self.tile_heights[row_item] for row_item in self.row_items)
+        cur_y = self.row_bottom - row_max_height
+        for index, row_item in enumerate(self.row_items):
+            cur_x = index * tile_width
+            row_item.setPos(cur_x, cur_y)
+            self.tile_rects[row_item] = QRectF(cur_x, cur_y, tile_width, self.tile_heights[row_item])
+        self.top_y = cur_y
+
+    def show_preview(self, owner, pixmap: QPixmap):
+        """Shows or updates the live preview tile for a running request above the finished results"""
+        item = self.previews.get(owner)
+        if item is None:
+            item = QGraphicsPixmapItem()
+            item.setOpacity(0.8)
+            self.gallery.addItem(item)
+            self.previews[owner] = item
+        item.setPixmap(pixmap.scaledToWidth(max(1, int(self.tile_width)), Qt.SmoothTransformation))
+        self.layout_previews()
+
+    def hide_preview(self, owner):
+        item = self.previews.pop(owner, None)
+        if item is not None:
+            self.gallery.removeItem(item)
+            self.layout_previews()
+
+    def layout_previews(self):
+        """Places the preview tiles in a row of their own on top of the gallery and sizes the scene to fit"""
+        scrollbar = self.verticalScrollBar()
+        at_top = scrollbar.value() == scrollbar.minimum()
+        row_height = max((item.boundingRect().height() for item in self.previews.values()), default=0)
+        top = self.top_y - row_height
+        for index, item in enumerate(self.previews.values()):
+            item.setPos(index * self.tile_width, top)
+        self.gallery.setSceneRect(0, top, self.tiled_viewport_width or self.viewport().width(), -top)
+        if at_top and self.previews:
+            scrollbar.setValue(scrollbar.minimum())
+
+    def update_visible(self, items=None):
+        """Gives tiles within a screen of the viewport their thumbnail and releases the rest"""
+        from modules.request_helpers import ClickablePixmap
+        if self.scene() is not self.gallery:
+            return
+        visible = self.mapToScene(self.viewport().rect()).boundingRect()
+        margin = visible.height()
+        near = visible.adjusted(0, -margin, 0, margin)
+        for item in self.tile_rects if items is None else items:
+            rect = self.tile_rects[item]
+            if isinstance(item, ClickablePixmap):
+                if rect.intersects(near):
+                    item.show_thumbnail(int(self.tile_width))
+                else:
+                    item.hide_thumbnail()
 
-        self.gallery.setSceneRect(0, 0, width, cur_y + row_max_height + spacing)
+    def setScene(self, scene):
+        super().setScene(scene)
+        if scene is self.gallery:
+            self.update_visible()
 
     def resizeEvent(self, event):
-        """Resize event to ensure the images fit within the view and re-tile them."""
+        """Re-tiles once the resize settles if the width changed, otherwise just refreshes the visible tiles."""
         super().resizeEvent(event)
-        self.tile_images()  # Fit the image to the window size
+        if self.viewport().width() != self.tiled_viewport_width:
+            self.schedule_tile_images()
+        else:
+            self.update_visible()
 
 
 class ImageInputBox(QWidget):
@@ -375,6 +486,7 @@ class LLMHistoryWidget(QWidget):
 
         w.removeRequested.connect(self.handle_remove_request)
         w.rerollRequested.connect(self.handle_reroll_request)
+        return w
 
     def clear_history(self):
         for w in self.messages:
@@ -468,6 +580,24 @@ class LLMHistoryObjectWidget(QFrame):
         layout.addWidget(self._prompt_widget)
         layout.addWidget(self._buttons_widget)
 
+        self._pending_text = []
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(TEXT_FLUSH_MS)
+        self._flush_timer.timeout.connect(self.flush_text)
+
+    def append_text(self, text):
+        """Queues streamed text, the label is only updated once per flush interval however many tokens arrive"""
+        self._pending_text.append(text)
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def flush_text(self):
+        self._flush_timer.stop()
+        if self._pending_text:
+            self._prompt_widget.message = self._prompt_widget.message + "".join(self._pending_text)
+            self._pending_text.clear()
+
     @property
     def role(self):
         return self._prompt_widget.role
@@ -478,10 +608,11 @@ class LLMHistoryObjectWidget(QFrame):
 
     @property
     def message(self):
-        return self._prompt_widget.message
+        return self._prompt_widget.message + "".join(self._pending_text)
 
     @message.setter
     def message(self, value):
+        self._pending_text.clear()
         self._prompt_widget.message = value
 
     @property
@@ -1099,13 +1230,35 @@ class PromptPickerWidget(QWidget):
 class QueueViewer(QScrollArea):
     def __init__(self):
         super().__init__()
+        self.pending_requests: RequestQueue | None = None
         self.container_widget = QWidget()
+        self.container_widget.setAcceptDrops(True)
+        self.container_widget.installEventFilter(self)
         self.setWidget(self.container_widget)
         self.setWidgetResizable(True)
         self.clear_finished_button = QPushButton("Clear Finished")
         self.clear_finished_button.clicked.connect(self.clear_finished)
         self.clear_queue_button = QPushButton("Clear Queue")
         self.clear_queue_button.clicked.connect(self.clear_queue)
+        self.scheduling_label = QLabel("Scheduling:")
+        self.scheduling_picker = QComboBox()
+        self.scheduling_picker.addItems(["FIFO", "Model Affinity"])
+        self.scheduling_layout = QHBoxLayout()
+        self.scheduling_layout.addWidget(self.scheduling_label)
+        self.scheduling_layout.addWidget(self.scheduling_picker, stretch=1)
+        self.reuse_enhancement_checkbox = QCheckBox("Reuse Enhanced Prompts")
+        self.reuse_enhancement_checkbox.setToolTip("Reuse earlier LLM enhancements of the same prompt instead of "
+                                                   "asking the LLM again")
+        self.reuse_enhancement_checkbox.toggled.connect(self.set_reuse_enhancement)
+        self.scheduling_layout.addWidget(self.reuse_enhancement_checkbox)
+        self.upload_profile_label = QLabel("Upload Format:")
+        self.upload_profile_picker = QComboBox()
+        self.upload_profile_picker.addItems(UPLOAD_PROFILES)
+        self.upload_profile_picker.setCurrentText(ARGUMENT_ENCODE_PROFILES["image"])
+        self.upload_profile_picker.setToolTip("Lossless format input images are sent to the server in")
+        self.upload_profile_picker.currentTextChanged.connect(set_upload_profile)
+        self.scheduling_layout.addWidget(self.upload_profile_label)
+        self.scheduling_layout.addWidget(self.upload_profile_picker)
 
         self.main_layout = QVBoxLayout(self.container_widget)
         self.queue_layout = QVBoxLayout()
@@ -1113,14 +1266,27 @@ class QueueViewer(QScrollArea):
         self.queue_layout.addStrut(250)
 
         self.main_layout.addLayout(self.queue_layout, stretch=10)
+        self.main_layout.addLayout(self.scheduling_layout)
         self.main_layout.addWidget(self.clear_finished_button)
         self.main_layout.addWidget(self.clear_queue_button)
 
+    def set_reuse_enhancement(self, reuse):
+        ENHANCEMENT_CACHE.reuse = reuse
+        print(f"Reuse enhanced prompts: {reuse}")
+
     def add_queue_item(self, queue_item, queue_view):
+        """Adds a widget for a new request, placed ahead of any queued requests in a lower priority lane"""
         from modules.request_helpers import QueueObjectWidget
         hex_color = get_model_color(queue_item.__class__.__name__)
         queue_widget = QueueObjectWidget(queue_item, hex_color, queue_view)
-        self.queue_layout.addWidget(queue_widget)
+        lane_rank = QUEUE_LANES.index(queue_widget.lane)
+        index = self.queue_layout.count()
+        while index > 0:
+            widget = self.queue_layout.itemAt(index - 1).widget()
+            if widget is None or not widget.is_queued() or QUEUE_LANES.index(widget.lane) <= lane_rank:
+                break
+            index -= 1
+        self.queue_layout.insertWidget(index, queue_widget)
         return queue_widget
 
     def del_queue_item(self, queue_widget):
@@ -1128,6 +1294,60 @@ class QueueViewer(QScrollArea):
         queue_widget.setParent(None)
         queue_widget.deleteLater()
 
+    def queued_widgets(self):
+        widgets = (self.queue_layout.itemAt(i).widget() for i in range(self.queue_layout.count()))
+        return [widget for widget in widgets if widget is not None and widget.is_queued()]
+
+    def run_next(self, queue_widget):
+        self.pending_requests.run_next(queue_widget.queue_object)
+        self.sync_order()
+
+    def set_lane(self, queue_widget, lane):
+        self.pending_requests.set_lane(queue_widget.queue_object, lane)
+        self.sync_order()
+
+    def sync_order(self):
+        """Reorders the queued widgets to match the order the pending requests will run in.
+        Only widgets of requests still pending are moved, and they are put back into the same layout slots, so a
+        widget whose request was just popped keeps its place until its status catches up"""
+        widgets = {widget.queue_object: widget for widget in self.queued_widgets()
+                   if widget.queue_object in self.pending_requests}
+        if not widgets:
+            return
+        slots = sorted(self.queue_layout.indexOf(widget) for widget in widgets.values())
+        for widget in widgets.values():
+            self.queue_layout.removeWidget(widget)
+        ordered = [queue_request for queue_request in self.pending_requests.ordered() if queue_request in widgets]
+        for index, queue_request in zip(slots, ordered):
+            widget = widgets[queue_request]
+            widget.set_lane(self.pending_requests.lane(queue_request))
+            self.queue_layout.insertWidget(index, widget)
+
+    def eventFilter(self, watched, event):
+        if watched is self.container_widget and event.type() in (QEvent.DragEnter, QEvent.DragMove):
+            if event.mimeData().hasFormat(QUEUE_ITEM_MIME) and event.source() in self.queued_widgets():
+                event.acceptProposedAction()
+                return True
+        if watched is self.container_widget and event.type() == QEvent.Drop:
+            if event.mimeData().hasFormat(QUEUE_ITEM_MIME):
+                self.drop_queue_item(event.source(), event.position().toPoint())
+                event.acceptProposedAction()
+                return True
+        return super().eventFilter(watched, event)
+
+    def drop_queue_item(self, source, position):
+        """Moves a dragged queued request ahead of the queued request it was dropped on, or to the back of its lane"""
+        queued_widgets = self.queued_widgets()
+        if source not in queued_widgets:
+            return
+        for widget in queued_widgets:
+            if widget is not source and position.y() < widget.geometry().center().y():
+                self.pending_requests.move_before(source.queue_object, widget.queue_object)
+                break
+        else:
+            self.pending_requests.move_to_back(source.queue_object)
+        self.sync_order()
+
     def clear_finished(self):
         for i in reversed(range(self.queue_layout.count())):
             item = self.queue_layout.itemAt(i)
@@ -1138,11 +1358,13 @@ class QueueViewer(QScrollArea):
                 continue
 
             text = widget.status_label.text()
-            if text.startswith("Failed") or text.startswith("Finished"):
+            if text.startswith("Failed") or text.startswith("Finished") or text.startswith("Cancelled"):
                 self.queue_layout.removeWidget(widget)
                 widget.deleteLater()
 
     def clear_queue(self):
+        if self.pending_requests is not None:
+            self.pending_requests.clear()
         while self.queue_layout.count():
             item = self.queue_layout.takeAt(0)
             widget = item.widget()
@@ -1,12 +1,23 @@
+import asyncio
 import base64
 import colorsys
 import csv
+import hashlib
 import io
 import json
+import os
 import random
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from PIL import Image
 
+from modules.enhancement_batcher import ENHANCEMENT_BATCHER
+from modules.enhancement_cache import ENHANCEMENT_CACHE
+
 
 def lighten_color(hex_color, amount=0.5):
     """Lighten a given hex color by a given amount (0–1)."""
@@ -73,24 +84,127 @@ def get_model_color(model_name):
     """Return a hex color for the given model name."""
     return MODEL_COLOR_PALETTE.get(model_name, "#808080")
 
-async def base64_to_images(base64_images):
-    """Converts a list of base64 images into a list of file-like objects."""
-    image_files = []
-    for base64_image in base64_images:
-        img_data = base64.b64decode(base64_image)  # Decode base64 string
-        img_file = io.BytesIO(img_data)  # Convert to file-like object
-        image_files.append(img_file)
-    return image_files
-
-def image_to_base64(image, width, height):
-    if hasattr(image, "toImage"):  # QPixmap / QImage
-        image = qpixmap_to_pil(image)
-
-    image = image.convert("RGB").resize((width, height))
+IMAGE_WORKERS = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="image_worker")
+
+# Wire formats images can be uploaded in, all of them lossless
+IMAGE_ENCODE_PROFILES = {
+    "png": {"format": "PNG", "mode": "RGB", "options": {}},
+    "png_fast": {"format": "PNG", "mode": "RGB", "options": {"compress_level": 1}},
+    "webp_lossless": {"format": "WEBP", "mode": "RGB", "options": {"lossless": True, "quality": 0, "method": 0}},
+    "mask": {"format": "PNG", "mode": "L", "options": {"compress_level": 1}},
+}
+
+# Which profile each request argument is encoded with, anything not listed uses "png"
+ARGUMENT_ENCODE_PROFILES = {
+    "image": "png_fast",
+    "ip_adapter_image": "png_fast",
+    "controlnet_image": "png_fast",
+    "mask_image": "mask",
+}
+IMAGE_ARGUMENTS = ("image", "ip_adapter_image", "controlnet_image")
+UPLOAD_PROFILES = [profile for profile in IMAGE_ENCODE_PROFILES if profile != "mask"]
+
+def set_upload_profile(profile):
+    """Picks the profile color images are uploaded with, masks keep their own"""
+    if profile not in UPLOAD_PROFILES:
+        print(f"Unknown upload profile: {profile}")
+        return
+    for argument in IMAGE_ARGUMENTS:
+        ARGUMENT_ENCODE_PROFILES[argument] = profile
+    print(f"Upload format: {profile}")
+
+def image_to_base64(image, width, height, profile="png"):
+    if hasattr(image, "toImage"):  # QPixmap
+        image = image.toImage()
+    if hasattr(image, "convertToFormat"):  # QImage
+        image = qimage_to_pil(image)
+
+    encode_profile = IMAGE_ENCODE_PROFILES[profile]
+    image = image.convert(encode_profile["mode"]).resize((width, height))
     buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
+    image.save(buffered, format=encode_profile["format"], **encode_profile["options"])
     return base64.b64encode(buffered.getvalue()).decode("utf-8")
 
+class EncodedImageCache:
+    """A byte-size bounded LRU of base64 payloads keyed by image identity, target size and format"""
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        payload = self.entries.get(key)
+        if payload is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return payload
+
+    def put(self, key, payload):
+        if len(payload) > self.max_bytes:
+            return
+        if key in self.entries:
+            self.current_bytes -= len(self.entries.pop(key))
+        self.entries[key] = payload
+        self.current_bytes += len(payload)
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.current_bytes -= len(evicted)
+
+    def clear(self):
+        self.entries.clear()
+        self.current_bytes = 0
+
+    def stats(self):
+        return {"entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "hits": self.hits,
+                "misses": self.misses}
+
+ENCODED_IMAGE_CACHE = EncodedImageCache()
+
+def image_content_hash(image):
+    """Hashes the pixels of a PIL image or QImage for use as a cache key"""
+    if hasattr(image, "convertToFormat"):  # QImage
+        image = qimage_to_pil(image)
+    digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+    digest.update(f"{image.mode}{image.size}".encode())
+    return digest.hexdigest()
+
+async def encode_image(image, width, height, argument="image"):
+    """Runs image_to_base64 on the image worker pool and returns its result without blocking the event loop.
+    The encode profile is picked from ARGUMENT_ENCODE_PROFILES by the request argument the image is sent as.
+    Results are kept in ENCODED_IMAGE_CACHE so resubmitting the same source image skips the work."""
+    profile = ARGUMENT_ENCODE_PROFILES.get(argument, "png")
+    loop = asyncio.get_running_loop()
+    if hasattr(image, "cacheKey"):  # QPixmap / QImage, the key changes whenever the pixels do
+        source_key = ("qt", image.cacheKey())
+    else:
+        source_key = ("hash", await loop.run_in_executor(IMAGE_WORKERS, image_content_hash, image))
+    key = (source_key, int(width), int(height), profile)
+
+    payload = ENCODED_IMAGE_CACHE.get(key)
+    if payload is not None:
+        return payload
+    if key in ENCODED_IMAGE_CACHE.pending:
+        return await asyncio.shield(ENCODED_IMAGE_CACHE.pending[key])
+
+    if hasattr(image, "toImage"):
+        # QPixmaps may only be touched on the UI thread, the QImage copy is safe to hand to a worker
+        image = image.toImage()
+    future = loop.run_in_executor(IMAGE_WORKERS, image_to_base64, image, width, height, profile)
+    ENCODED_IMAGE_CACHE.pending[key] = future
+    try:
+        payload = await asyncio.shield(future)
+    finally:
+        ENCODED_IMAGE_CACHE.pending.pop(key, None)
+    ENCODED_IMAGE_CACHE.put(key, payload)
+    return payload
+
 
 def get_csv_tags(csv_path: str, n: int) -> str:
     """
@@ -125,35 +239,124 @@ def get_csv_tags(csv_path: str, n: int) -> str:
         return ' '.join(first_values)
 
 
-def get_generic_danbooru_tags(csv_path, num_lines, category="0"):
+class StringTable:
+    """A compact, immutable list of strings stored as one interned buffer plus an array of offsets into it"""
+    def __init__(self, strings):
+        self.offsets = array("L", [0])
+        position = 0
+        for string in strings:
+            position += len(string)
+            self.offsets.append(position)
+        self.buffer = sys.intern("".join(strings))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]]
+
+    def sample(self, k):
+        """Returns k distinct random strings in O(k)"""
+        return [self[index] for index in random.sample(range(len(self)), min(k, len(self)))]
+
+
+class TagIndex:
+    """Lazily parses a tag file once into per-category StringTables and reloads it only when its mtime changes"""
+    _instances = {}
+    _lock = threading.Lock()
+
+    def __init__(self, path, loader):
+        self.path = path
+        self.loader = loader
+        self.mtime = None
+        self.categories = {}
+
+    @classmethod
+    def get(cls, path, loader):
+        key = (os.path.abspath(path), loader)
+        with cls._lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(path, loader)
+            return cls._instances[key]
+
+    def category(self, category):
+        mtime = os.path.getmtime(self.path)
+        if mtime != self.mtime:
+            with self._lock:
+                if mtime != self.mtime:
+                    grouped = self.loader(self.path)
+                    self.categories = {name: StringTable(strings) for name, strings in grouped.items()}
+                    self.mtime = mtime
+        return self.categories.get(category)
+
+
+def load_danbooru_csv(csv_path):
+    """Groups the tag names of a danbooru csv by their category column"""
+    grouped = {}
     with open(csv_path, newline='', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        filtered_rows = [row for row in reader if len(row) > 1 and row[1].strip() == category]
+        for row in csv.reader(f):
+            if len(row) > 1:
+                grouped.setdefault(row[1].strip(), []).append(row[0])
+    return grouped
 
-    if not filtered_rows:
-        return ""
 
-    selected_rows = random.sample(filtered_rows, min(num_lines, len(filtered_rows)))
-    print(selected_rows)
-
-    combined_string = " ".join(row[0] for row in selected_rows)
+def load_artist_json(json_path):
+    """Collects the prompt of every artist entry under a single category"""
+    with open(json_path, 'r') as file:
+        data = json.load(file)
+    return {"prompt": [artist.get('prompt') or "" for artist in data]}
 
-    return combined_string
 
-def get_random_artist_prompt():
-    with open('assets/artist.json', 'r') as file:
-        data = json.load(file)
-        selected_artist = random.choice(data)
-        return selected_artist.get('prompt')
+def get_generic_danbooru_tags(csv_path, num_lines, category="0"):
+    tags = TagIndex.get(csv_path, load_danbooru_csv).category(category)
+    if not tags:
+        return ""
 
-async def get_enhanced_prompt(avernus_client, prompt, instructions=None):
+    selected_tags = tags.sample(num_lines)
+    print(selected_tags)
+
+    return " ".join(selected_tags)
+
+def get_random_artist_prompt(json_path='assets/artist.json'):
+    prompts = TagIndex.get(json_path, load_artist_json).category("prompt")
+    if not prompts:
+        return None
+    return prompts[random.randrange(len(prompts))]
+
+async def get_enhanced_prompt(avernus_client, prompt, instructions=None, model_name=None, reuse=None, reroll=False):
+    """Asks the LLM to rewrite a prompt, falling back to the original prompt if it fails.
+    In reuse mode (ENHANCEMENT_CACHE.reuse unless reuse is given) an earlier enhancement of the same prompt, instructions
+    and model is returned without asking the LLM, and identical enhancements already in flight are shared.
+    reroll always asks the LLM and replaces whatever was cached."""
+    if reuse is None:
+        reuse = ENHANCEMENT_CACHE.reuse
+    if reuse and not reroll:
+        cached = ENHANCEMENT_CACHE.get(model_name, instructions, prompt)
+        if cached is not None:
+            return cached
+        key = ENHANCEMENT_CACHE.key(model_name, instructions, prompt)
+        if key in ENHANCEMENT_CACHE.pending:
+            return await asyncio.shield(ENHANCEMENT_CACHE.pending[key])
+        future = asyncio.ensure_future(request_enhanced_prompt(avernus_client, prompt, instructions, model_name))
+        ENHANCEMENT_CACHE.pending[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            ENHANCEMENT_CACHE.pending.pop(key, None)
+    return await request_enhanced_prompt(avernus_client, prompt, instructions, model_name)
+
+async def request_enhanced_prompt(avernus_client, prompt, instructions=None, model_name=None):
     try:
         if instructions is None:
-            llm_prompt = await avernus_client.llm_chat(
-                f"Turn the following prompt into a three sentence visual description of it. Here is the prompt: {prompt}")
+            llm_prompt = await ENHANCEMENT_BATCHER.chat(
+                avernus_client,
+                f"Turn the following prompt into a three sentence visual description of it. Here is the prompt: {prompt}",
+                model_name=model_name)
         else:
-            llm_prompt = await avernus_client.llm_chat(f"{instructions}: {prompt}")
+            llm_prompt = await ENHANCEMENT_BATCHER.chat(avernus_client, f"{instructions}: {prompt}",
+                                                        model_name=model_name)
         if llm_prompt["status"] is True or llm_prompt["status"] == "True":
+            ENHANCEMENT_CACHE.put(model_name, instructions, prompt, llm_prompt["response"])
             return llm_prompt["response"]
         else:
             return prompt
@@ -162,7 +365,10 @@ async def get_enhanced_prompt(avernus_client, prompt, instructions=None):
         return prompt
 
 def qpixmap_to_pil(pixmap):
-    qimage = pixmap.toImage().convertToFormat(pixmap.toImage().Format.Format_RGBA8888)
+    return qimage_to_pil(pixmap.toImage())
+
+def qimage_to_pil(qimage):
+    qimage = qimage.convertToFormat(qimage.Format.Format_RGBA8888)
 
     width = qimage.width()
     height = qimage.height()
@@ -11,7 +11,7 @@ from modules.queue import QueueTab
 from modules.request_helpers import BaseVideoRequest, QueueObjectWidget
 from modules.ui_widgets import (ImageGallery, ImageInputBox, ModelPickerWidget, ParagraphInputBox, ResolutionInput,
                                 QueueViewer, SingleLineInputBox, VideoInputWidget, VerticalTabWidget)
-from modules.utils import image_to_base64, get_enhanced_prompt
+from modules.utils import encode_image
 
 
 class WanTab(QWidget):
@@ -203,9 +203,7 @@ class WanRequest(BaseVideoRequest):
         if self.flow_shift != "": kwargs["flow_shift"] = float(self.flow_shift)
         if self.seed != "": kwargs["seed"] = int(self.seed)
         if self.model_name != "" or None: kwargs["model_name"] = str(self.model_name)
-        if self.enhance_prompt:
-            llm_prompt = await get_enhanced_prompt(self.avernus_client, self.prompt, "Rewrite and enhance the original editing instruction with richer detail, clearer structure, and improved descriptive quality. When adding text that should appear inside an image, place that text inside double quotes and in capital letters. Explain what needs to be changed and what needs to be left unchanged. Explain in details how to change  camera position or tell that camera position shouldn't be changed. example: Original text: add text 911 and 'Police' Result: Add the word '911' in large blue letters to the hood. Below that, add the word 'POLICE.' Keep the camera position unchanged, as do the background, car position, and lighting. Answer only with expanded prompt. Rewrite Prompt: ")
-            self.enhanced_prompt = llm_prompt
+        await self.prepare()
         kwargs["prompt"] = self.enhanced_prompt
 
         if self.i2v_image_enabled:
@@ -219,13 +217,13 @@ class WanRequest(BaseVideoRequest):
                 i2v_height = int(self.i2v_image.height())
             else:
                 i2v_height = int(self.height)
-            image = image_to_base64(self.i2v_image, i2v_width, i2v_height)
+            image = await encode_image(self.i2v_image, i2v_width, i2v_height)
             kwargs["image"] = str(image)
         try:
-            response = await self.avernus_client.wan_ti2v(**kwargs)
+            response = await self.avernus_client.wan_ti2v(on_progress=self.show_download_progress, **kwargs)
             if response["status"] == True or response["status"] == "True":
                 self.status = "Finished"
-                await self.display_video(response["video"])
+                await self.display_video(response["video_path"])
             else:
                 self.status = "Failed"
         except Exception as e:
@@ -233,6 +231,8 @@ class WanRequest(BaseVideoRequest):
             print(f"WAN REQUEST EXCEPTION: {e}")
 
 class WanV2VRequest(BaseVideoRequest):
+    enhance_instructions = None  # V2V always used the plain three sentence description, not the video edit rewrite
+
     def __init__(self,
                  avernus_client: AvernusClient,
                  gallery: ImageGallery,
@@ -277,17 +277,15 @@ class WanV2VRequest(BaseVideoRequest):
         if self.flow_shift != "": kwargs["flow_shift"] = float(self.flow_shift)
         if self.seed != "": kwargs["seed"] = int(self.seed)
         if self.model_name != "" or None: kwargs["model_name"] = str(self.model_name)
-        if self.enhance_prompt:
-            llm_prompt = await self.avernus_client.llm_chat(
-                f"Turn the following prompt into a three sentence visual description of it. Here is the prompt: {self.prompt}")
-            self.enhanced_prompt = llm_prompt
+        await self.prepare()
         kwargs["prompt"] = self.enhanced_prompt
         kwargs["video_path"] = self.video
         try:
-            response = await self.avernus_client.wan_v2v(**kwargs)
+            response = await self.avernus_client.wan_v2v(on_progress=self.show_download_progress,
+                                                         on_upload_progress=self.show_upload_progress, **kwargs)
             if response["status"] == True or response["status"] == "True":
                 self.status = "Finished"
-                await self.display_video(response["video"])
+                await self.display_video(response["video_path"])
             else:
                 self.status = "Failed"
         except Exception as e:
@@ -0,0 +1,63 @@
+import asyncio
+
+from modules.enhancement_batcher import EnhancementBatcher
+
+
+class FakeClient:
+    def __init__(self, batch_supported=True, fail=False):
+        self.batch_supported = batch_supported
+        self.fail = fail
+        self.batches = []
+        self.chats = []
+
+    async def llm_chat_batch(self, prompts, model_name=None):
+        if not self.batch_supported:
+            return None
+        if self.fail:
+            raise RuntimeError("server went away")
+        self.batches.append(list(prompts))
+        return [{"status": True, "response": prompt.upper()} for prompt in prompts]
+
+    async def llm_chat(self, prompt, model_name=None):
+        self.chats.append(prompt)
+        return {"status": True, "response": prompt.upper()}
+
+
+def run_prompts(batcher, client, prompts):
+    async def run():
+        return await asyncio.gather(*(batcher.chat(client, prompt) for prompt in prompts))
+    return asyncio.run(run())
+
+
+def test_batches_are_split_at_the_size_limit():
+    client = FakeClient()
+    prompts = [f"p{index}" for index in range(10)]
+    results = run_prompts(EnhancementBatcher(window=0.01, max_batch_size=4), client, prompts)
+    assert [result["response"] for result in results] == [prompt.upper() for prompt in prompts]
+    assert [len(batch) for batch in client.batches] == [4, 4, 2]
+    assert client.chats == []
+
+
+def test_single_prompt_skips_the_batch_endpoint():
+    client = FakeClient()
+    results = run_prompts(EnhancementBatcher(window=0.01), client, ["only"])
+    assert results == [{"status": True, "response": "ONLY"}]
+    assert client.batches == []
+    assert client.chats == ["only"]
+
+
+def test_falls_back_to_single_chats_without_a_batch_endpoint():
+    client = FakeClient(batch_supported=False)
+    results = run_prompts(EnhancementBatcher(window=0.01), client, ["a", "b", "c"])
+    assert [result["response"] for result in results] == ["A", "B", "C"]
+    assert sorted(client.chats) == ["a", "b", "c"]
+
+
+def test_errors_reach_every_caller():
+    client = FakeClient(fail=True)
+
+    async def run():
+        batcher = EnhancementBatcher(window=0.01)
+        return await asyncio.gather(*(batcher.chat(client, prompt) for prompt in ("a", "b")), return_exceptions=True)
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+pytest.importorskip("PySide6")
+
+from modules.gallery_store import GalleryStore
+
+
+def write_file(path, size, mtime):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    os.utime(path, (mtime, mtime))
+
+
+def test_prune_deletes_oldest_files_until_under_the_cap(tmp_path):
+    store = GalleryStore(path=str(tmp_path), max_disk_bytes=250)
+    write_file(tmp_path / "aa" / "old.png", 100, 1000)
+    write_file(tmp_path / "bb" / "middle.png", 100, 2000)
+    write_file(tmp_path / "cc" / "new.png", 100, 3000)
+
+    assert store.prune() == 1
+    assert not (tmp_path / "aa" / "old.png").exists()
+    assert (tmp_path / "bb" / "middle.png").exists()
+    assert (tmp_path / "cc" / "new.png").exists()
+
+
+def test_prune_leaves_a_store_under_the_cap_and_partial_writes_alone(tmp_path):
+    store = GalleryStore(path=str(tmp_path), max_disk_bytes=150)
+    write_file(tmp_path / "aa" / "image.png", 100, 1000)
+    write_file(tmp_path / "aa" / "writing.png.tmp", 100, 500)
+
+    assert store.prune() == 0
+    assert (tmp_path / "aa" / "writing.png.tmp").exists()
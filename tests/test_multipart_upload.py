@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiofiles")
+
+from modules.multipart_upload import MultipartUpload
+
+
+def read_body(upload):
+    async def read():
+        return b"".join([chunk async for chunk in upload])
+    return asyncio.run(read())
+
+
+def test_content_length_matches_the_body(tmp_path):
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"\x00\x01" * 5000)
+    mask = tmp_path / "mask.png"
+    mask.write_bytes(b"png data")
+    progress = []
+    upload = MultipartUpload(data={"prompt": 'a "quoted" prompt', "steps": 20},
+                             files={"video": str(video), "mask": (str(mask), "image/png")},
+                             on_progress=lambda sent, total: progress.append((sent, total)), chunk_size=1024)
+    body = read_body(upload)
+    assert len(body) == upload.total == int(upload.headers["Content-Length"])
+    assert body.endswith(f"--{upload.boundary}--\r\n".encode())
+    assert b'name="prompt"\r\n\r\na "quoted" prompt\r\n' in body
+    assert b'filename="clip.mp4"\r\nContent-Type: video/mp4\r\n\r\n' in body
+    assert b"Content-Type: image/png" in body
+    assert progress[-1] == (upload.total, upload.total)
+    assert [sent for sent, _ in progress] == sorted(sent for sent, _ in progress)
+
+
+def test_empty_upload_is_just_the_closing_boundary():
+    upload = MultipartUpload()
+    assert read_body(upload) == upload.closing
+    assert upload.total == len(upload.closing)
@@ -0,0 +1,179 @@
+import asyncio
+
+from modules.request_queue import RequestQueue, clone_request, request_params
+
+
+class FakeRequest:
+    queue_lane = "batch"
+
+    def __init__(self, avernus_client, prompt, seed=None):
+        self.avernus_client = avernus_client
+        self.prompt = prompt
+        self.seed = seed
+
+    def __repr__(self):
+        return self.prompt
+
+
+class InteractiveRequest(FakeRequest):
+    queue_lane = "interactive"
+
+
+class FakeJournal:
+    def __init__(self):
+        self.saved = []
+        self.removed = []
+
+    def save(self, queue_request, lane, position):
+        self.saved.append((queue_request, lane, position))
+
+    def remove(self, queue_request):
+        self.removed.append(queue_request)
+
+
+def make_requests(*prompts):
+    return [FakeRequest(None, prompt) for prompt in prompts]
+
+
+def test_orders_by_lane_then_submission():
+    queue = RequestQueue()
+    a, b = make_requests("a", "b")
+    c = InteractiveRequest(None, "c")
+    d = FakeRequest(None, "d")
+    queue.append(a)
+    queue.append(b)
+    queue.append(c)
+    queue.append(d, "background")
+    assert queue.ordered() == [c, a, b, d]
+    assert queue.ordered(2) == [c, a]
+    assert [queue.pop() for _ in range(4)] == [c, a, b, d]
+    assert not queue
+
+
+def test_removed_requests_are_skipped():
+    queue = RequestQueue()
+    a, b, c = make_requests("a", "b", "c")
+    for queue_request in (a, b, c):
+        queue.append(queue_request)
+    queue.remove(a)
+    queue.pop(c)
+    assert len(queue) == 1
+    assert a not in queue
+    assert queue.peek() is b
+    assert queue.pop() is b
+    assert queue.peek() is None
+
+
+def test_pop_from_empty_queue_raises():
+    queue = RequestQueue()
+    try:
+        queue.pop()
+    except IndexError:
+        pass
+    else:
+        raise AssertionError("pop on an empty queue should raise IndexError")
+
+
+def test_run_next_jumps_every_lane():
+    queue = RequestQueue()
+    a, b = make_requests("a", "b")
+    c = InteractiveRequest(None, "c")
+    queue.append(a)
+    queue.append(c)
+    queue.append(b, "background")
+    queue.run_next(b)
+    queue.run_next(a)
+    assert queue.ordered() == [a, b, c]
+    assert queue.lane(b) == "interactive"
+
+
+def test_move_before_lands_between_neighbours():
+    queue = RequestQueue()
+    a, b, c, d = make_requests("a", "b", "c", "d")
+    for queue_request in (a, b, c):
+        queue.append(queue_request)
+    queue.append(d, "background")
+    queue.move_before(d, b)
+    assert queue.ordered() == [a, d, b, c]
+    assert queue.lane(d) == "batch"
+    queue.move_before(c, a)
+    queue.move_before(b, a)
+    assert queue.ordered() == [c, b, a, d]
+
+
+def test_set_lane_and_move_to_back():
+    queue = RequestQueue()
+    a, b, c = make_requests("a", "b", "c")
+    for queue_request in (a, b, c):
+        queue.append(queue_request)
+    queue.move_to_back(a)
+    assert queue.ordered() == [b, c, a]
+    queue.set_lane(c, "interactive")
+    assert queue.ordered() == [c, b, a]
+
+
+def test_unknown_lane_falls_back_to_batch():
+    queue = RequestQueue()
+    a, b = make_requests("a", "b")
+    queue.append(a, "nowhere")
+    queue.append(b)
+    assert queue.lane(a) == "batch"
+    assert queue.ordered() == [a, b]
+
+
+def test_journal_follows_changes():
+    journal = FakeJournal()
+    queue = RequestQueue(journal)
+    a, b = make_requests("a", "b")
+    queue.append(a)
+    queue.append(b)
+    queue.run_next(b)
+    assert [(saved, lane) for saved, lane, _ in journal.saved] == [(a, "batch"), (b, "batch"), (b, "interactive")]
+    queue.pop()
+    assert journal.removed == []
+    queue.remove(a)
+    assert journal.removed == [a]
+
+
+def test_remove_and_clear_mark_requests_finished():
+    async def check():
+        queue = RequestQueue()
+        a, b = make_requests("a", "b")
+        for queue_request in (a, b):
+            queue_request.finished_event = asyncio.Event()
+            queue.append(queue_request)
+        queue.remove(a)
+        assert a.finished_event.is_set()
+        assert not b.finished_event.is_set()
+        queue.clear()
+        assert b.finished_event.is_set()
+        assert len(queue) == 0 and queue.peek() is None
+    asyncio.run(check())
+
+
+def test_clone_request_keeps_context_and_overrides():
+    client = object()
+    request = FakeRequest(client, "a cat", seed=1)
+    assert request_params(request) == {"prompt": "a cat", "seed": 1}
+    clone = clone_request(request, seed=2)
+    assert clone.avernus_client is client
+    assert (clone.prompt, clone.seed) == ("a cat", 2)
+
+
+def test_wait_for_space_wakes_when_requests_leave():
+    async def check():
+        queue = RequestQueue()
+        a, b, c = make_requests("a", "b", "c")
+        for queue_request in (a, b, c):
+            queue.append(queue_request)
+        waiter = asyncio.ensure_future(queue.wait_for_space(3))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        queue.set_lane(a, "background")
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        queue.pop()
+        await asyncio.wait_for(waiter, 1)
+        await asyncio.wait_for(queue.wait_for_space(3), 1)
+        assert len(queue) == 2
+    asyncio.run(check())
@@ -0,0 +1,42 @@
+import json
+
+from modules.response_stream import JsonImageStreamParser
+
+
+def parse(body, chunk_size):
+    parser = JsonImageStreamParser()
+    images = []
+    for start in range(0, len(body), chunk_size):
+        images += [bytes(image) for image in parser.feed(body[start:start + chunk_size])]
+    return images, parser.result()
+
+
+def test_streams_images_and_keeps_the_rest():
+    body = json.dumps({"status": "True", "images": ["aGVsbG8=", "d29ybGQ="], "seed": 5}).encode()
+    for chunk_size in (1, 2, 3, 7, len(body)):
+        images, result = parse(body, chunk_size)
+        assert images == [b"aGVsbG8=", b"d29ybGQ="]
+        assert result == {"status": "True", "images": [], "seed": 5}
+
+
+def test_escapes_split_across_chunks():
+    # Images come back as the raw string contents, escapes and all, as base64 only ever escapes a /
+    body = rb'{"message": "say \"hi\" \\", "images": ["a\/b"]}'
+    for chunk_size in range(1, 8):
+        images, result = parse(body, chunk_size)
+        assert images == [rb"a\/b"]
+        assert result["message"] == 'say "hi" \\'
+
+
+def test_only_the_top_level_images_array_is_captured():
+    body = json.dumps({"meta": {"images": ["nested"]}, "other": ["x"], "images": ["top"]}).encode()
+    images, result = parse(body, 4)
+    assert images == [b"top"]
+    assert result["meta"] == {"images": ["nested"]}
+    assert result["other"] == ["x"]
+
+
+def test_response_without_images():
+    images, result = parse(b'{"status": "False", "images": []}', 5)
+    assert images == []
+    assert result == {"status": "False", "images": []}
@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip("PySide6")
+pytest.importorskip("qasync")
+
+from modules.sweep import ParameterSweep, parse_sweep_values
+
+
+def test_parses_separated_values_typed_like_the_field():
+    assert parse_sweep_values("1 | 2|3", 7) == [1, 2, 3]
+    assert parse_sweep_values("1.5|2", 1.0) == [1.5, 2.0]
+    assert parse_sweep_values("a cat|a dog", "") == ["a cat", "a dog"]
+    assert parse_sweep_values("yes|off", True) == [True, False]
+    assert parse_sweep_values("  ", 1) == []
+
+
+def test_parses_inclusive_ranges():
+    assert parse_sweep_values("1:5", 0) == [1, 2, 3, 4, 5]
+    assert parse_sweep_values("1:2:0.25", 0.0) == [1.0, 1.25, 1.5, 1.75, 2.0]
+    assert parse_sweep_values("5:1:-2", 0) == [5, 3, 1]
+    assert parse_sweep_values("0.1:0.3:0.1", 0.0) == [0.1, 0.2, 0.3]
+    assert parse_sweep_values("20:30:5", "") == ["20", "25", "30"]
+
+
+def test_rejects_ranges_that_never_end():
+    for text in ("1:5:0", "5:1:1"):
+        with pytest.raises(ValueError):
+            parse_sweep_values(text, 0)
+
+
+def test_list_fields_take_plus_separated_names():
+    assert parse_sweep_values("a+b|c|", ["x"]) == [["a", "b"], ["c"], []]
+
+
+def test_repeated_values_get_their_own_cells():
+    sweep = ParameterSweep(None, {"seed": [1, 1, 2], "steps": [10, 20]}, x_field="seed", y_field="steps")
+    combinations = list(sweep.combinations())
+    assert len(combinations) == len(sweep) == sweep.grid_size == 6
+    assert sorted(cell for _, cell in combinations) == [(column, row) for column in range(3) for row in range(2)]
+    assert combinations[0] == ({"steps": 10, "seed": 1}, (0, 0))
+    assert combinations[1] == ({"steps": 10, "seed": 1}, (1, 0))
+
+
+def test_grid_axes_vary_fastest():
+    sweep = ParameterSweep(None, {"model_name": ["a", "b"], "seed": [1, 2]}, x_field="seed")
+    assert [combination for combination, _ in sweep.combinations()] == [
+        {"model_name": "a", "seed": 1}, {"model_name": "a", "seed": 2},
+        {"model_name": "b", "seed": 1}, {"model_name": "b", "seed": 2}]
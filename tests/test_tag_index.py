@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from modules.utils import StringTable, TagIndex, get_generic_danbooru_tags, load_danbooru_csv
+
+
+def write_csv(path, rows, mtime):
+    path.write_text("".join(f"{name},{category}\n" for name, category in rows), encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+class CountingLoader:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, path):
+        self.calls += 1
+        return load_danbooru_csv(path)
+
+
+def test_string_table_round_trips():
+    strings = ["cat", "", "long hair", "ü"]
+    table = StringTable(strings)
+    assert len(table) == 4
+    assert [table[index] for index in range(len(table))] == strings
+
+
+def test_sample_is_distinct_and_capped():
+    table = StringTable([f"tag{index}" for index in range(10)])
+    sample = table.sample(5)
+    assert len(sample) == len(set(sample)) == 5
+    assert set(sample) <= {f"tag{index}" for index in range(10)}
+    assert sorted(table.sample(50)) == sorted(f"tag{index}" for index in range(10))
+    assert StringTable([]).sample(3) == []
+
+
+def test_sampling_does_not_reread_the_file(tmp_path):
+    path = tmp_path / "tags.csv"
+    write_csv(path, [("cat", 0), ("dog", 0), ("artist", 1)], 1_000_000)
+    loader = CountingLoader()
+    index = TagIndex(str(path), loader)
+    for _ in range(20):
+        assert set(index.category("0").sample(2)) <= {"cat", "dog"}
+    assert index.category("1")[0] == "artist"
+    assert index.category("missing") is None
+    assert loader.calls == 1
+
+
+def test_reloads_when_the_mtime_changes(tmp_path):
+    path = tmp_path / "tags.csv"
+    write_csv(path, [("cat", 0)], 1_000_000)
+    loader = CountingLoader()
+    index = TagIndex(str(path), loader)
+    assert list(index.category("0").sample(5)) == ["cat"]
+    write_csv(path, [("dog", 0), ("bird", 0)], 1_000_100)
+    assert sorted(index.category("0").sample(5)) == ["bird", "dog"]
+    assert loader.calls == 2
+    index.category("0")
+    assert loader.calls == 2
+
+
+def test_tag_indexes_are_shared_per_path_and_loader(tmp_path):
+    path = tmp_path / "tags.csv"
+    write_csv(path, [("cat", 0), ("dog", 0)], 1_000_000)
+    assert TagIndex.get(str(path), load_danbooru_csv) is TagIndex.get(str(path), load_danbooru_csv)
+    assert sorted(get_generic_danbooru_tags(str(path), 2).split()) == ["cat", "dog"]
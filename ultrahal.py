@@ -12,16 +12,23 @@ from modules.ace_tab import ACETab
 from modules.auraflow_tab import AuraFlowTab
 from modules.avernus_client import AvernusClient
 from modules.chroma_tab import ChromaTab
+from modules.dispatcher import AvernusEndpoint, RequestDispatcher
+from modules.enhancement_cache import ENHANCEMENT_CACHE
 from modules.flux_fill_tab import FluxFillTab
 from modules.flux_inpaint_tab import FluxInpaintTab
 from modules.flux_tab import FluxTab
 from modules.flux2_tab import Flux2Tab
 from modules.framepack_tab import FramepackTab
 from modules.gallery import GalleryTab
+from modules.gallery_store import GALLERY_STORE
+from modules.health_monitor import HealthMonitor, HealthPanel
 from modules.hidream import HiDreamTab
+from modules.history import HISTORY
+from modules.history_tab import HistoryTab
 from modules.hunyuan_video_tab import HunyuanVideoTab
 from modules.image_processors import ImageProcessorTab
 from modules.kandinsky5_tab import Kandinsky5Tab
+from modules.list_catalog import LIST_CATALOG
 from modules.llm_tab import LlmTab
 from modules.lumina2_tab import Lumina2Tab
 from modules.sana_sprint_tab import SanaSprintTab
@@ -30,12 +37,15 @@ from modules.sd15_inpaint_tab import SD15InpaintTab
 from modules.sdxl_tab import SdxlTab
 from modules.sdxl_inpaint_tab import SdxlInpaintTab
 from modules.queue import QueueTab
+from modules.queue_journal import QUEUE_JOURNAL
+from modules.request_queue import RequestQueue
 from modules.qwen_tab import QwenTab
 from modules.qwen_image_inpaint_tab import QwenImageInpaintTab
 from modules.qwen_edit_plus_tab import QwenEditPlusTab
 from modules.wan_tab import WanTab
 from modules.wan_vace_tab import WanVACETab
 from modules.zimage_tab import ZImageTab
+from modules.utils import IMAGE_WORKERS
 
 
 class MainWindow(QWidget):
@@ -47,10 +57,14 @@ class MainWindow(QWidget):
         self.avernus_port: int = 6969
         self.avernus_client: AvernusClient = AvernusClient(self.avernus_url)
         self.loop = qasync.QEventLoop(self)
-        self.pending_requests: list = []
+        self.pending_requests: RequestQueue = RequestQueue(QUEUE_JOURNAL)
         self.request_event = asyncio.Event()
-        self.request_currently_processing: bool = False
+        self.dispatcher: RequestDispatcher = RequestDispatcher(self.request_event)
+        self.dispatcher.journal = QUEUE_JOURNAL
+        self.dispatcher.set_endpoints([AvernusEndpoint(self.avernus_client)])
+        self.health_monitor: HealthMonitor = HealthMonitor(self.dispatcher)
         self.process_request_queue()
+        self.monitor_health()
 
         self.avernus_label = QLabel("Avernus URL:")
         self.avernus_entry = QLineEdit(text="localhost")
@@ -58,8 +72,20 @@ class MainWindow(QWidget):
         self.avernus_port_label = QLabel("Port:")
         self.avernus_port_entry = QLineEdit(text="6969")
         self.avernus_port_entry.returnPressed.connect(self.update_avernus_url)
+        self.extra_servers_label = QLabel("Extra Servers:")
+        self.extra_servers_entry = QLineEdit()
+        self.extra_servers_entry.setPlaceholderText("host:port, host:port")
+        self.extra_servers_entry.returnPressed.connect(self.update_avernus_url)
+        self.jobs_per_server_label = QLabel("Jobs/Server:")
+        self.jobs_per_server_entry = QLineEdit(text="1")
+        self.jobs_per_server_entry.setMaximumWidth(40)
+        self.jobs_per_server_entry.returnPressed.connect(self.update_avernus_url)
         self.avernus_current_server = QLabel(f"Current Server:{self.avernus_url}")
         self.avernus_online_label = CircleWidget()
+        self.avernus_online = None
+        self.health_panel = HealthPanel()
+        self.health_monitor.add_listener(self.show_health)
+        self.health_monitor.add_listener(self.health_panel.show_health)
         self.avernus_button = QPushButton("Update URL")
         self.avernus_button.clicked.connect(self.update_avernus_url)
         self.update_avernus_url()
@@ -68,8 +94,12 @@ class MainWindow(QWidget):
 
         self.gallery_tab = GalleryTab(self.avernus_client, self)
         self.queue_tab = QueueTab(self.avernus_client, self)
+        self.queue_tab.queue_view.scheduling_picker.currentTextChanged.connect(self.dispatcher.set_policy)
+        self.queue_tab.queue_view.pending_requests = self.pending_requests
         self.tabs.addTab(self.gallery_tab, "Gallery")
         self.tabs.addTab(self.queue_tab, "Queue")
+        self.history_tab = HistoryTab(self.avernus_client, self.tabs)
+        self.tabs.addTab(self.history_tab, "History")
 
         self.ace_tab = ACETab(self.avernus_client, self.tabs)
         self.auraflow_tab = AuraFlowTab(self.avernus_client, self.tabs)
@@ -122,84 +152,165 @@ class MainWindow(QWidget):
         self.tabs.addTab(self.wan_tab, "Wan")
         self.tabs.addTab(self.wan_vace_tab, "Wan VACE")
         self.tabs.addTab(self.zimage_tab, "ZImage")
+        self.subscribe_lists()
 
         self.avernus_layout = QHBoxLayout()
         self.avernus_layout.addWidget(self.avernus_label)
         self.avernus_layout.addWidget(self.avernus_entry)
         self.avernus_layout.addWidget(self.avernus_port_label)
         self.avernus_layout.addWidget(self.avernus_port_entry)
+        self.avernus_layout.addWidget(self.extra_servers_label)
+        self.avernus_layout.addWidget(self.extra_servers_entry)
+        self.avernus_layout.addWidget(self.jobs_per_server_label)
+        self.avernus_layout.addWidget(self.jobs_per_server_entry)
         self.avernus_layout.addWidget(self.avernus_current_server)
         self.avernus_layout.addWidget(self.avernus_online_label)
         self.avernus_layout.addWidget(self.avernus_button)
 
         self.layout = QVBoxLayout()
         self.layout.addLayout(self.avernus_layout)
+        self.layout.addWidget(self.health_panel)
         self.layout.addWidget(self.tabs)
         self.setLayout(self.layout)
         self.setStyle(QStyleFactory.create("Fusion"))
+        self.restore_queue()
+        IMAGE_WORKERS.submit(GALLERY_STORE.prune)
+
+    def restore_queue(self):
+        """Puts back any requests that were still queued or running when UltraHal last closed"""
+        restored = QUEUE_JOURNAL.restore(self.avernus_client, self.gallery_tab.gallery, self.tabs)
+        queue_view = self.queue_tab.queue_view
+        for queue_request, lane in restored:
+            queue_request.ui_item = queue_view.add_queue_item(queue_request, queue_view)
+            self.pending_requests.append(queue_request, lane)
+        queue_view.sync_order()
+        if restored:
+            print(f"Restored {len(restored)} queued requests")
+            self.request_event.set()
 
     @asyncSlot()
     async def update_avernus_url(self):
         self.avernus_url = self.avernus_entry.text()
         self.avernus_port = int(self.avernus_port_entry.text())
         await self.avernus_client.update_url(self.avernus_url, self.avernus_port)
+        await self.update_endpoints()
         self.avernus_current_server.setText(f"Server: {self.avernus_url}")
         print(f"Avernus URL Updated: {self.avernus_url}")
-        await self.check_status()
-        await self.update_lists()
+        self.check_status()
+        await self.update_lists(force=True)
+
 
+    async def update_endpoints(self):
+        """Updates the dispatcher endpoint pool to the primary server plus any extra servers.
+        Servers already in the pool keep their endpoint so the jobs running on them stay counted"""
+        try:
+            jobs_per_server = max(1, int(self.jobs_per_server_entry.text()))
+        except ValueError:
+            jobs_per_server = 1
+        current = self.dispatcher.endpoints + self.dispatcher.retiring
+        primary = next((endpoint for endpoint in current if endpoint.avernus_client is self.avernus_client), None)
+        if primary is None:
+            primary = AvernusEndpoint(self.avernus_client)
+        current_endpoints = {endpoint.name: endpoint for endpoint in current if endpoint is not primary}
+        endpoints = [primary]
+        for server in self.extra_servers_entry.text().split(","):
+            server = server.strip()
+            if not server:
+                continue
+            host, _, port = server.partition(":")
+            port = int(port) if port.isdigit() else 6969
+            base_url = f"{host}:{port}"
+            if base_url == self.avernus_client.base_url or any(e.name == base_url for e in endpoints):
+                continue
+            endpoint = current_endpoints.pop(base_url, None) or AvernusEndpoint(AvernusClient(host, port))
+            endpoints.append(endpoint)
+        for endpoint in endpoints:
+            endpoint.max_concurrency = jobs_per_server
+        self.dispatcher.set_endpoints(endpoints)
+        print(f"Avernus endpoints: {', '.join(endpoint.name for endpoint in endpoints)}")
 
     @asyncSlot()
     async def process_request_queue(self):
         while True:
-            # Wait for a new event or retry if queue isn't empty
-            if not self.pending_requests:
+            # Wait for a new event or a slot to free up on one of the endpoints
+            if not self.pending_requests or self.dispatcher.idle_endpoint() is None:
                 await self.request_event.wait()
                 self.request_event.clear()
 
             while self.pending_requests:
-                queue_request = self.pending_requests.pop(0)
-                try:
-                    await queue_request.run()
-                except Exception as e:
-                    print(f"Exception while processing request: {e}")
+                endpoint = self.dispatcher.idle_endpoint()
+                if endpoint is None:
+                    break
+                queue_request = self.pending_requests.pop(self.dispatcher.select_next(self.pending_requests, endpoint))
+                self.dispatcher.dispatch(queue_request, endpoint)
+            self.dispatcher.prepare_ahead(self.pending_requests)
 
     @asyncSlot()
-    async def check_status(self):
-        status = await self.avernus_client.check_status()
-        if status.get("status") == True:
-            self.avernus_online_label.set_color(1)
-        else:
-            self.avernus_online_label.set_color(0)
+    async def monitor_health(self):
+        await self.health_monitor.run()
 
-    @asyncSlot()
-    async def update_lists(self):
+    def check_status(self):
+        self.health_monitor.wake()
+
+    def show_health(self, monitor):
+        health = monitor.health(self.avernus_client.base_url)
+        if health is None:
+            return
+        self.avernus_online_label.set_color(1 if health.online else 0)
+        self.avernus_online_label.setToolTip(health.describe())
+        if health.online and not self.avernus_online:
+            # Automatic refresh when the server comes up, lists still within the TTL are left alone
+            asyncio.ensure_future(self.update_lists())
+        self.avernus_online = health.online
+
+    def subscribe_lists(self):
+        """Hooks each tabs LoRA, scheduler and controlnet pickers up to the list endpoint they show"""
+        subscriptions = [
+            ("list_chroma_loras", self.chroma_tab.set_lora_list),
+            ("list_flux_loras", self.flux_tab.set_lora_list),
+            ("list_flux_loras", self.flux_inpaint_tab.set_lora_list),
+            ("list_flux_loras", self.flux_fill_tab.set_lora_list),
+            ("list_flux2_loras", self.flux2_tab.set_lora_list),
+            ("list_qwen_image_loras", self.qwen_tab.set_lora_list),
+            ("list_qwen_image_loras", self.qwen_edit_tab.set_lora_list),
+            ("list_qwen_image_loras", self.qwen_inpaint_tab.set_lora_list),
+            ("list_sd15_loras", self.sd15_tab.set_lora_list),
+            ("list_sd15_loras", self.sd15_inpaint_tab.set_lora_list),
+            ("list_sdxl_controlnets", self.sdxl_tab.set_controlnet_list),
+            ("list_sdxl_loras", self.sdxl_tab.set_lora_list),
+            ("list_sdxl_loras", self.sdxl_inpaint_tab.set_lora_list),
+            ("list_sdxl_schedulers", self.sdxl_tab.set_scheduler_list),
+            ("list_sdxl_schedulers", self.sdxl_inpaint_tab.set_scheduler_list),
+            ("list_sdxl_schedulers", self.sd15_tab.set_scheduler_list),
+            ("list_sdxl_schedulers", self.sd15_inpaint_tab.set_scheduler_list),
+            ("list_zimage_loras", self.zimage_tab.set_lora_list),
+        ]
+        for endpoint, callback in subscriptions:
+            LIST_CATALOG.subscribe(endpoint, callback)
+
+    async def update_lists(self, force=False):
+        """Refreshes every subscribed list, force refetches lists that are still within the catalogs TTL"""
         try:
-            await self.sdxl_tab.make_lora_list()
-            await self.sdxl_tab.make_controlnet_list()
-            await self.sdxl_tab.make_scheduler_list()
-            await self.sdxl_inpaint_tab.make_lora_list()
-            await self.sdxl_inpaint_tab.make_scheduler_list()
-            await self.flux_tab.make_lora_list()
-            await self.flux_inpaint_tab.make_lora_list()
-            await self.flux_fill_tab.make_lora_list()
-            await self.flux2_tab.make_lora_list()
-            await self.qwen_tab.make_lora_list()
-            await self.qwen_edit_tab.make_lora_list()
-            await self.qwen_inpaint_tab.make_lora_list()
-            await self.chroma_tab.make_lora_list()
-            await self.sd15_tab.make_lora_list()
-            await self.sd15_tab.make_scheduler_list()
-            await self.sdxl_tab.make_scheduler_list()
-            await self.sd15_inpaint_tab.make_lora_list()
-            await self.sd15_inpaint_tab.make_scheduler_list()
-            await self.zimage_tab.make_lora_list()
+            await LIST_CATALOG.refresh(self.avernus_client, force=force)
         except Exception as e:
             print(f"UPDATING LORA LISTS FAILED: {e}")
 
-    def closeEvent(self, event):
+    @asyncSlot()
+    async def shutdown(self):
+        self.health_monitor.stop()
+        try:
+            await self.dispatcher.close(keep=self.avernus_client)
+            await self.avernus_client.close()
+        except Exception as e:
+            print(f"Exception while closing avernus client: {e}")
+        HISTORY.close()
+        QUEUE_JOURNAL.close()
+        ENHANCEMENT_CACHE.close()
         QApplication.quit()
 
+    def closeEvent(self, event):
+        self.shutdown()
+
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)